@@ -0,0 +1,4 @@
+'''
+Benchmarks for the gravityai package. Each module can be run with "python -m benchmarks.<name>" from the repository
+root and prints its results as json, so runs can be saved and compared across versions.
+'''
@@ -0,0 +1,134 @@
+'''
+Helpers shared by the benchmarks: latency summaries, json output, and starting a gravityai server to measure.
+'''
+import contextlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sortedValues, q):
+    if (not sortedValues):
+        return None
+    index = min(len(sortedValues) - 1, max(0, int(round(q * (len(sortedValues) - 1)))))
+    return sortedValues[index]
+
+
+def summarize_latencies(values):
+    '''
+    Returns the count, mean, p50, p90, p99 and max of a list of latencies in seconds.
+    '''
+    values = sorted(values)
+    if (not values):
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 0.50),
+        "p90": percentile(values, 0.90),
+        "p99": percentile(values, 0.99),
+        "max": values[-1],
+    }
+
+
+def best_of(repeat, function):
+    '''
+    Calls function repeat times and returns the shortest wall time in seconds with the last result.
+    '''
+    best = None
+    result = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def import_gravityai():
+    '''
+    Imports gravityai.gravityai, which parses the command line when imported from a terminal, with a serve command
+    line and its banner hidden.
+    '''
+    argv = sys.argv
+    sys.argv = [argv[0], "serve", "-p", "49200"]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            from gravityai import gravityai
+    finally:
+        sys.argv = argv
+    return gravityai
+
+
+def environment():
+    return {"python": sys.version.split()[0], "platform": sys.platform, "cpus": os.cpu_count()}
+
+
+def write_results(results, output=None):
+    '''
+    Prints results as json, and also writes them to output when it is given.
+    '''
+    text = json.dumps(results, indent=2)
+    print(text)
+    if (output):
+        with open(output, "w") as file_object:
+            file_object.write(text + "\n")
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _connect(port, unixSocket):
+    if (unixSocket is None):
+        return socket.create_connection(("127.0.0.1", port), timeout=1)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(unixSocket)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def start_server(module, port, serveArgs=(), env=None, timeout=30, unixSocket=None):
+    '''
+    Starts "python -m module serve -p port serveArgs..." from the repository root (with --unix-socket when unixSocket
+    is given) and waits until it accepts connections. Returns the subprocess.Popen; stop it with stop_server.
+    '''
+    childEnv = dict(os.environ)
+    childEnv["PYTHONPATH"] = REPO_ROOT + os.pathsep + childEnv.get("PYTHONPATH", "")
+    childEnv.update(env or {})
+    command = [sys.executable, "-m", module, "serve", "-p", str(port)] + list(serveArgs)
+    if (unixSocket is not None):
+        command += ["--unix-socket", unixSocket]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=childEnv, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    where = f"port {port}" if unixSocket is None else unixSocket
+    deadline = time.time() + timeout
+    while(time.time() < deadline):
+        if (process.poll() is not None):
+            raise RuntimeError(f"Server exited with status {process.returncode}: {process.stderr.read().decode()}")
+        try:
+            with _connect(port, unixSocket):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    stop_server(process)
+    raise RuntimeError(f"Server did not start listening on {where} within {timeout} seconds")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
@@ -0,0 +1,69 @@
+'''
+Micro-benchmark for handle_csvs_with_uris: a manifest of synthetic csv files given as file:// uris, handled by a
+function that reads each file and returns a small summary table, written in each output format.
+
+    python -m benchmarks.csv_uris --files 200 --rows 1000 --formats xlsx csv_zip --output csv_uris.json
+'''
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks import common
+
+
+def _summarize_file(filename, row):
+    import pandas as pd
+    return pd.read_csv(filename).describe()
+
+
+def _make_manifest(folder, files, rows, columns, seed):
+    import numpy as np
+    import pandas as pd
+    random = np.random.RandomState(seed)
+    uris = []
+    for i in range(files):
+        path = os.path.join(folder, f"input_{i}.csv")
+        pd.DataFrame(random.rand(rows, columns), columns=[f"c{j}" for j in range(columns)]).to_csv(path, index=False)
+        uris.append(Path(path).as_uri())
+    manifest = os.path.join(folder, "manifest.csv")
+    pd.DataFrame({"uri": uris}).to_csv(manifest, index=False)
+    return manifest
+
+
+def run(files=100, rows=1000, columns=10, formats=("xlsx", "csv_zip"), repeat=1, seed=0):
+    grav = common.import_gravityai()
+    results = dict(common.environment(), benchmark="csv_uris", files=files, rows=rows, columns=columns, formats={})
+    with tempfile.TemporaryDirectory(prefix="gravityai-bench-") as folder:
+        manifest = _make_manifest(folder, files, rows, columns, seed)
+        for output_format in formats:
+            outPath = os.path.join(folder, "output." + output_format)
+            seconds, _ = common.best_of(repeat, lambda: grav.handle_csvs_with_uris(
+                manifest, outPath, _summarize_file, output_format=output_format))
+            results["formats"][output_format] = {
+                "seconds": seconds,
+                "files_per_second": files / seconds,
+                "output_bytes": os.path.getsize(outPath),
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=100, help="number of uris in the manifest")
+    parser.add_argument("--rows", type=int, default=1000, help="rows per input file")
+    parser.add_argument("--columns", type=int, default=10, help="columns per input file")
+    parser.add_argument("--formats", nargs="+", default=["xlsx", "csv_zip"],
+                        help="output formats to measure (xlsx, parquet, feather, csv_zip)")
+    parser.add_argument("--repeat", type=int, default=1, help="keep the best of this many runs")
+    parser.add_argument("--output", help="also write the json results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.files, args.rows, args.columns, args.formats, args.repeat)
+    common.write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
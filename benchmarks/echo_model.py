@@ -0,0 +1,23 @@
+'''
+A synthetic model for the load generator: it sleeps GRAVITYAI_BENCH_HANDLER_MS milliseconds (0 by default), to stand
+in for the model, and copies its input file to the output file.
+
+    python -m benchmarks.echo_model serve -p 49200 --concurrency 4
+'''
+import os
+import shutil
+import time
+
+from gravityai import gravityai as grav
+
+HANDLER_SECONDS = float(os.environ.get("GRAVITYAI_BENCH_HANDLER_MS", "0")) / 1000.0
+
+
+def handler(inputPath, outputPath):
+    if (HANDLER_SECONDS > 0):
+        time.sleep(HANDLER_SECONDS)
+    shutil.copyfile(inputPath, outputPath)
+
+
+if __name__ == "__main__":
+    grav.wait_for_requests(handler)
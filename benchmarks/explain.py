@@ -0,0 +1,98 @@
+'''
+Micro-benchmarks for the explainability paths on synthetic models: interpret_model with a fresh explainer and with a
+cached one, getBarPlotJson on its own, and the KernelExplainer ("neuralNetwork") path on a smaller sample. On that
+sample it also compares the model specific explainers picked by model_type="auto" (TreeExplainer for the forest,
+LinearExplainer for a logistic regression) with the model agnostic PermutationExplainer, and times
+ELI5Explainer.explainPredictions for all rows of the logistic regression (computed from its coefficients) and for
+the sample with the forest (one eli5 call per row).
+
+    python -m benchmarks.explain --rows 2000 --features 20 --repeat 3 --output explain.json
+'''
+import argparse
+import sys
+
+from benchmarks import common
+
+
+def _make_model(rows, features, trees, seed):
+    import numpy as np
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+    random = np.random.RandomState(seed)
+    data = pd.DataFrame(random.rand(rows, features), columns=[f"feature_{i}" for i in range(features)])
+    labels = (data.iloc[:, 0] > 0.5).astype(int) + (data.iloc[:, 1] > 0.5)
+    model = RandomForestClassifier(n_estimators=trees, max_depth=8, random_state=seed).fit(data, labels)
+    return model, data
+
+
+def _make_linear_model(data, seed):
+    from sklearn.linear_model import LogisticRegression
+    labels = (data.iloc[:, 0] > 0.5).astype(int)
+    return LogisticRegression(random_state=seed).fit(data, labels)
+
+
+def _compare_model_types(grav, models, sample, repeat):
+    results = {}
+    for name, model, modelTypes in models:
+        for modelType in modelTypes:
+            results[f"{name}_{modelType}_seconds"], _ = common.best_of(
+                repeat, lambda: grav.interpret_model(model, sample, None, model_type=modelType, use_cache=False))
+    return results
+
+
+def run(rows=2000, features=20, trees=50, kernel_rows=20, nsamples=100, repeat=3, seed=0):
+    grav = common.import_gravityai()
+    from gravityai.explainability_interface import explainer
+    model, data = _make_model(rows, features, trees, seed)
+    # warm up, so the first measurement does not pay for importing shap
+    grav.interpret_model(model, data[:10], None, use_cache=False)
+
+    results = dict(common.environment(), benchmark="explain", rows=rows, features=features, trees=trees)
+    results["interpret_model_uncached_seconds"], _ = common.best_of(
+        repeat, lambda: grav.interpret_model(model, data, None, use_cache=False))
+    grav.interpret_model(model, data, None)
+    results["interpret_model_cached_seconds"], _ = common.best_of(
+        repeat, lambda: grav.interpret_model(model, data, None))
+
+    shapExplainer = explainer.SHAPExplainer(model, data)
+    explanationObject = shapExplainer.getExplanationObject()
+    results["get_bar_plot_json_seconds"], _ = common.best_of(
+        repeat, lambda: shapExplainer.getBarPlotJson(explanationObject))
+
+    sample = data[:kernel_rows]
+    results["kernel_rows"] = kernel_rows
+    results["kernel_nsamples"] = nsamples
+    results["interpret_model_kernel_seconds"], _ = common.best_of(
+        repeat, lambda: grav.interpret_model(model.predict_proba, sample, None, model_type="neuralNetwork",
+                                             background_size=20, nsamples=nsamples))
+    linear = _make_linear_model(data, seed)
+    results["model_types"] = _compare_model_types(grav, [
+        ("forest", model, ("tree", "general", "permutation")),
+        ("logistic", linear, ("linear", "permutation")),
+    ], sample, repeat)
+    results["eli5_linear_rows_seconds"], _ = common.best_of(
+        repeat, lambda: explainer.ELI5Explainer(linear, data).explainPredictions())
+    results["eli5_forest_rows_seconds"], _ = common.best_of(
+        repeat, lambda: explainer.ELI5Explainer(model, sample).explainPredictions())
+    results["explainer_cache"] = grav.explainer_cache_stats()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--features", type=int, default=20)
+    parser.add_argument("--trees", type=int, default=50)
+    parser.add_argument("--kernel-rows", type=int, default=20, help="rows explained with KernelExplainer")
+    parser.add_argument("--nsamples", type=int, default=100, help="KernelExplainer samples per row")
+    parser.add_argument("--repeat", type=int, default=3, help="keep the best of this many runs")
+    parser.add_argument("--output", help="also write the json results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.features, args.trees, args.kernel_rows, args.nsamples, args.repeat)
+    common.write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+'''
+Load generator for the websocket protocol of "serve": sends requests with requestId / inputFile / outputFile over a
+number of connections, each keeping a number of requests in flight, and reports the throughput and the latency from
+sending a request to receiving its "complete" reply. Without --url it starts benchmarks.echo_model with the given
+serve options and a synthetic handler time.
+
+    python -m benchmarks.loadgen --requests 2000 --connections 4 --inflight 8 --handler-ms 5 -- --concurrency 8
+    python -m benchmarks.loadgen --url ws://127.0.0.1:49200 --requests 500 --output loadgen.json
+'''
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks import common
+
+
+async def _stats(url):
+    '''
+    Asks the server for its own metrics, or returns None if it does not answer stats messages.
+    '''
+    import websockets
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({"type": "stats", "requestId": "loadgen-stats"}))
+        try:
+            reply = json.loads(await asyncio.wait_for(ws.recv(), 5))
+        except (asyncio.TimeoutError, ValueError):
+            return None
+        return reply.get("stats") if reply.get("type") == "stats" else None
+
+
+async def _connection(url, index, counter, inflight, folder, inputFile, latencies, errors):
+    import websockets
+    async with websockets.connect(url, max_size=None) as ws:
+        waiting = {}
+
+        async def read_replies():
+            async for message in ws:
+                reply = json.loads(message)
+                if (reply.get("status") == "pending"):
+                    continue
+                future = waiting.pop(reply.get("requestId"), None)
+                if (future is not None and not future.done()):
+                    future.set_result(reply)
+
+        async def send_requests(slot):
+            outputFile = os.path.join(folder, f"out-{index}-{slot}")
+            while(counter[0] > 0):
+                counter[0] -= 1
+                reqId = f"{index}-{slot}-{counter[0]}"
+                future = asyncio.get_running_loop().create_future()
+                waiting[reqId] = future
+                start = time.perf_counter()
+                await ws.send(json.dumps({"requestId": reqId, "inputFile": inputFile, "outputFile": outputFile}))
+                reply = await future
+                if (reply.get("status") == "complete"):
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors.append(reply.get("error"))
+
+        reader = asyncio.ensure_future(read_replies())
+        try:
+            await asyncio.gather(*[send_requests(slot) for slot in range(inflight)])
+        finally:
+            reader.cancel()
+
+
+async def _load(url, requests, connections, inflight, payloadBytes, warmup):
+    with tempfile.TemporaryDirectory(prefix="gravityai-loadgen-") as folder:
+        inputFile = os.path.join(folder, "input")
+        with open(inputFile, "wb") as file_object:
+            file_object.write(os.urandom(payloadBytes))
+
+        if (warmup):
+            await _connection(url, "warmup", [warmup], 1, folder, inputFile, [], [])
+
+        counter = [requests]
+        latencies = []
+        errors = []
+        start = time.perf_counter()
+        await asyncio.gather(*[_connection(url, i, counter, inflight, folder, inputFile, latencies, errors)
+                               for i in range(connections)])
+        seconds = time.perf_counter() - start
+    return seconds, latencies, errors
+
+
+def run(url=None, requests=1000, connections=1, inflight=1, payload_bytes=1024, warmup=10, handler_ms=0, serve_args=()):
+    server = None
+    if (url is None):
+        port = common.free_port()
+        server = common.start_server("benchmarks.echo_model", port, serve_args,
+                                     env={"GRAVITYAI_BENCH_HANDLER_MS": str(handler_ms)})
+        url = f"ws://127.0.0.1:{port}"
+    try:
+        seconds, latencies, errors = asyncio.run(_load(url, requests, connections, inflight, payload_bytes, warmup))
+        serverStats = asyncio.run(_stats(url))
+    finally:
+        if (server is not None):
+            common.stop_server(server)
+
+    return dict(common.environment(), **{
+        "benchmark": "loadgen",
+        "url": url if server is None else None,
+        "serve_args": list(serve_args) if server is not None else None,
+        "handler_ms": handler_ms if server is not None else None,
+        "requests": requests,
+        "connections": connections,
+        "inflight": inflight,
+        "payload_bytes": payload_bytes,
+        "seconds": seconds,
+        "throughput": len(latencies) / seconds if seconds else None,
+        "latency": common.summarize_latencies(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "server_stats": serverStats,
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="server to load, for example ws://127.0.0.1:49200 (default: start echo_model)")
+    parser.add_argument("--requests", type=int, default=1000, help="total number of requests")
+    parser.add_argument("--connections", type=int, default=1, help="number of websocket connections")
+    parser.add_argument("--inflight", type=int, default=1, help="requests in flight per connection")
+    parser.add_argument("--payload-bytes", type=int, default=1024, help="size of the input file")
+    parser.add_argument("--warmup", type=int, default=10, help="requests sent before measuring")
+    parser.add_argument("--handler-ms", type=float, default=0, help="time the echo model spends per request")
+    parser.add_argument("--output", help="also write the json results to this file")
+    parser.add_argument("serve_args", nargs="*", help="options for the echo model's serve command, after --")
+    args = parser.parse_args(argv)
+
+    results = run(args.url, args.requests, args.connections, args.inflight, args.payload_bytes, args.warmup,
+                  args.handler_ms, args.serve_args)
+    common.write_results(results, args.output)
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
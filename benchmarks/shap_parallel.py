@@ -0,0 +1,119 @@
+'''
+Compares serial and multi-process shap value computation for the interpret_model bar plot on a synthetic random
+forest, and checks that every parallel call returns the serial result for the same rows (exactly with --chunk-size,
+otherwise up to the rounding of the summation order). Each call explains different rows, as requests against a loaded
+model do. The first call of each configuration builds the explainer and starts the workers; "seconds" is the best of
+the --repeat calls after it, which reuse them.
+
+    python -m benchmarks.shap_parallel --rows 5000 --jobs 2 4 8 --repeat 3 --output shap_parallel.json
+'''
+import argparse
+import os
+import sys
+import time
+
+from benchmarks import common
+
+
+def _make_model(rows, features, trees, seed):
+    import numpy as np
+    from sklearn.ensemble import RandomForestClassifier
+    random = np.random.RandomState(seed)
+    data = random.rand(rows, features)
+    labels = (data[:, 0] > 0.5).astype(int) + (data[:, 1] > 0.5)
+    model = RandomForestClassifier(n_estimators=trees, max_depth=8, random_state=seed).fit(data, labels)
+    return model, data
+
+
+def _make_rows(rows, features, calls, seed):
+    import numpy as np
+    random = np.random.RandomState(seed + 1)
+    return [random.rand(rows, features) for _ in range(calls)]
+
+
+def _as_lists(result):
+    import numpy as np
+    return {str(k): [np.asarray(v[0]).tolist(), np.asarray(v[1]).tolist()] for k, v in result.items()}
+
+
+def _matches(results, expected, exact):
+    return all(_matches_one(result, other, exact) for result, other in zip(results, expected))
+
+
+def _matches_one(result, expected, exact):
+    import numpy as np
+    if (result.keys() != expected.keys()):
+        return False
+    for key in expected:
+        if (result[key][0] != expected[key][0]):
+            return False
+        if (exact and result[key][1] != expected[key][1]):
+            return False
+        if (not np.allclose(result[key][1], expected[key][1], rtol=1e-12, atol=0)):
+            return False
+    return True
+
+
+def _time_explainer(model, datasets, **kwargs):
+    from gravityai.explainability_interface import cache, explainer
+    cache.EXPLAINER_CACHE.clear()
+    explainer.shutdownShapPools()
+    times = []
+    results = []
+    for data in datasets:
+        start = time.perf_counter()
+        shapExplainer = explainer.SHAPExplainer(model, data, **kwargs)
+        explanationObject = None if shapExplainer.isParallel() else shapExplainer.getExplanationObject()
+        results.append(_as_lists(shapExplainer.getBarPlotJson(explanationObject)))
+        times.append(time.perf_counter() - start)
+    explainer.shutdownShapPools()
+    return times[0], min(times[1:]), results
+
+
+def run(rows=5000, features=20, trees=50, jobs=(2, 4), chunk_size=None, repeat=3, seed=0):
+    model, data = _make_model(rows, features, trees, seed)
+    datasets = _make_rows(rows, features, repeat + 1, seed)
+    # warm up, so the serial run does not pay for importing shap
+    _time_explainer(model, [data[:10], data[10:20]])
+    serial_first, serial_seconds, serial_result = _time_explainer(model, datasets, chunk_size=chunk_size)
+    parallel = []
+    for n_jobs in jobs:
+        first, seconds, result = _time_explainer(model, datasets, chunk_size=chunk_size, n_jobs=n_jobs)
+        parallel.append({
+            "n_jobs": n_jobs,
+            "first_seconds": first,
+            "seconds": seconds,
+            "speedup": serial_seconds / seconds,
+            "matches_serial": _matches(result, serial_result, exact=bool(chunk_size)),
+        })
+    return {
+        "benchmark": "shap_parallel",
+        "rows": rows,
+        "features": features,
+        "trees": trees,
+        "chunk_size": chunk_size,
+        "cpus": os.cpu_count(),
+        "serial_first_seconds": serial_first,
+        "serial_seconds": serial_seconds,
+        "parallel": parallel,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--features", type=int, default=20)
+    parser.add_argument("--trees", type=int, default=50)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3, help="keep the best of this many runs after the first")
+    parser.add_argument("--output", help="also write the json results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.features, args.trees, args.jobs, args.chunk_size, args.repeat)
+    common.write_results(results, args.output)
+    return 0 if all(p["matches_serial"] for p in results["parallel"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+'''
+Measures the cold start cost of importing gravityai.gravityai: the time spent importing it, the wall time of the whole
+process, and the peak memory of the process. The import runs in a fresh interpreter for every repeat, next to a bare
+interpreter as a baseline, and the heavy optional libraries that ended up loaded are listed so an eager import shows up.
+
+    python -m benchmarks.startup --repeat 5 --max-import-seconds 0.5 --output startup.json
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks import common
+
+REPO_ROOT = common.REPO_ROOT
+HEAVY_MODULES = ["shap", "pandas", "numpy", "eli5", "wget", "websockets"]
+
+_CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+sys.argv = [sys.argv[0], "serve", "-p", "49200"]
+if {module!r}:
+    __import__({module!r})
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+except ImportError:
+    rss_mb = None
+print(json.dumps({{"import_seconds": elapsed, "maxrss_mb": rss_mb,
+                  "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def _run_child(module):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    code = _CHILD.format(module=module, heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], env=env, cwd=REPO_ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    wall = time.perf_counter() - start
+    if (result.returncode != 0):
+        raise RuntimeError(f"Importing {module} failed: {result.stderr}")
+    # the serve subcommand prints its own banner before our json line
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample["process_seconds"] = wall
+    return sample
+
+
+def _summarize(samples, key):
+    values = [s[key] for s in samples if s[key] is not None]
+    if (not values):
+        return None
+    return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+
+def run(module="gravityai.gravityai", repeat=5):
+    baseline = [_run_child("") for _ in range(repeat)]
+    samples = [_run_child(module) for _ in range(repeat)]
+    return {
+        "benchmark": "startup",
+        "module": module,
+        "python": sys.version.split()[0],
+        "repeat": repeat,
+        "import_seconds": _summarize(samples, "import_seconds"),
+        "process_seconds": _summarize(samples, "process_seconds"),
+        "maxrss_mb": _summarize(samples, "maxrss_mb"),
+        "baseline_process_seconds": _summarize(baseline, "process_seconds"),
+        "baseline_maxrss_mb": _summarize(baseline, "maxrss_mb"),
+        "heavy_modules_loaded": samples[-1]["loaded"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="gravityai.gravityai", help="module to import")
+    parser.add_argument("--repeat", type=int, default=5, help="number of fresh interpreters to measure")
+    parser.add_argument("--output", help="also write the json results to this file")
+    parser.add_argument("--max-import-seconds", type=float,
+                        help="exit with status 1 if the median import time is above this")
+    parser.add_argument("--max-rss-mb", type=float,
+                        help="exit with status 1 if the median peak memory is above this")
+    args = parser.parse_args(argv)
+
+    results = run(args.module, args.repeat)
+    common.write_results(results, args.output)
+
+    failures = []
+    if (args.max_import_seconds is not None and results["import_seconds"]["median"] > args.max_import_seconds):
+        failures.append(f"import took {results['import_seconds']['median']:.3f}s")
+    if (args.max_rss_mb is not None and results["maxrss_mb"] and results["maxrss_mb"]["median"] > args.max_rss_mb):
+        failures.append(f"peak memory was {results['maxrss_mb']['median']:.1f}MB")
+    if (failures):
+        sys.stderr.write("Startup regression: " + ", ".join(failures) + "\n")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
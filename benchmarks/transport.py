@@ -0,0 +1,97 @@
+'''
+Round-trip latency of the websocket transport: starts benchmarks.echo_model on loopback tcp and on a unix socket
+(with and without per-message compression) and, over one connection, times sequential "stats" messages, which
+never reach the handler, and sequential requests for a small input file.
+
+    python -m benchmarks.transport --requests 2000 --compression deflate none --output transport.json
+'''
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks import common
+
+
+async def _round_trips(connect, requests, warmup, inputFile, outputFile):
+    async with connect() as ws:
+
+        async def request(message, final):
+            start = time.perf_counter()
+            await ws.send(message)
+            while(True):
+                reply = json.loads(await ws.recv())
+                if (reply.get("type") == "stats" or reply.get("status") in final):
+                    break
+            if (reply.get("status") == "error"):
+                raise RuntimeError(reply.get("error"))
+            return time.perf_counter() - start
+
+        stats = json.dumps({"type": "stats", "requestId": "transport-stats"})
+        work = json.dumps({"requestId": "transport", "inputFile": inputFile, "outputFile": outputFile})
+        for _ in range(warmup):
+            await request(stats, ())
+            await request(work, ("complete", "error"))
+        statsLatencies = [await request(stats, ()) for _ in range(requests)]
+        requestLatencies = [await request(work, ("complete", "error")) for _ in range(requests)]
+    return statsLatencies, requestLatencies
+
+
+def _measure(transport, compression, requests, warmup, payloadBytes, folder):
+    import websockets
+    port = common.free_port()
+    unixSocket = os.path.join(folder, "gravityai.sock") if transport == "unix" else None
+    server = common.start_server("benchmarks.echo_model", port, ["--compression", compression],
+                                 unixSocket=unixSocket)
+    inputFile = os.path.join(folder, "input")
+    with open(inputFile, "wb") as file_object:
+        file_object.write(os.urandom(payloadBytes))
+    outputFile = os.path.join(folder, "output")
+    # the client offers compression either way, the server decides whether it is used
+    if (unixSocket is None):
+        def connect(): return websockets.connect(f"ws://127.0.0.1:{port}", max_size=None)
+    else:
+        def connect(): return websockets.unix_connect(unixSocket, "ws://localhost/", max_size=None)
+    try:
+        statsLatencies, requestLatencies = asyncio.run(
+            _round_trips(connect, requests, warmup, inputFile, outputFile))
+    finally:
+        common.stop_server(server)
+    return {
+        "transport": transport,
+        "compression": compression,
+        "stats_round_trip": common.summarize_latencies(statsLatencies),
+        "request_round_trip": common.summarize_latencies(requestLatencies),
+    }
+
+
+def run(requests=1000, warmup=50, payload_bytes=1024, transports=("tcp", "unix"), compressions=("deflate", "none")):
+    results = dict(common.environment(), benchmark="transport", requests=requests, payload_bytes=payload_bytes, runs=[])
+    with tempfile.TemporaryDirectory(prefix="gravityai-transport-") as folder:
+        for transport in transports:
+            for compression in compressions:
+                results["runs"].append(_measure(transport, compression, requests, warmup, payload_bytes, folder))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000, help="round trips measured for each message type")
+    parser.add_argument("--warmup", type=int, default=50, help="round trips sent before measuring")
+    parser.add_argument("--payload-bytes", type=int, default=1024, help="size of the input file")
+    parser.add_argument("--transports", nargs="+", choices=["tcp", "unix"], default=["tcp", "unix"])
+    parser.add_argument("--compression", nargs="+", choices=["deflate", "none"], default=["deflate", "none"],
+                        help="server compression settings to measure")
+    parser.add_argument("--output", help="also write the json results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.requests, args.warmup, args.payload_bytes, args.transports, args.compression)
+    common.write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+# ioctl request to share the blocks of one file with another (a reflink), on filesystems that support it
+_FICLONE = 0x40049409
+# blobs without an index entry are only swept once they are this old, since put writes a blob before its entry
+_ORPHAN_GRACE_SECONDS = 60
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file_object:
+        for chunk in iter(lambda: file_object.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_file(source, destination):
+    '''
+    Copies source to destination as a reflink when the filesystem supports it (btrfs, xfs, ...), so no data is
+    duplicated, and as a regular copy otherwise.
+    '''
+    try:
+        import fcntl
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(source, destination)
+
+
+class DiskCache:
+    '''
+    Content addressed on-disk cache of files. Each key maps to a small json index entry holding the sha256 of the
+    content and any metadata given when it was stored, and contents are kept once per hash under blobs/, so keys with
+    identical content share storage. Stored blobs are made read-only since they are handed out as hard links.
+
+    When a key is stored again with different content, its previous blob is removed once no other key refers to it.
+    When the blobs take more than max_bytes, blobs that no key refers to (left behind by an interrupted or concurrent
+    writer) are removed, then the least recently used keys are dropped (and their blobs once no other key refers to
+    them). Several processes may share a folder: every file is written to a temporary name and renamed
+    into place, and missing files are treated as misses.
+    '''
+
+    def __init__(self, folder, max_bytes=1024 * 1024 * 1024):
+        self.folder = os.path.abspath(folder)
+        self.max_bytes = max_bytes
+        self._blobs = os.path.join(self.folder, "blobs")
+        self._index = os.path.join(self.folder, "index")
+        os.makedirs(self._blobs, exist_ok=True)
+        os.makedirs(self._index, exist_ok=True)
+        self._lock = threading.Lock()
+        self._bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_stored = 0
+        self.bytes_served = 0
+
+    def _index_path(self, key):
+        return os.path.join(self._index, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def blob_path(self, entry):
+        digest = entry["hash"]
+        return os.path.join(self._blobs, digest[:2], digest)
+
+    def get(self, key, count=True):
+        '''
+        Returns the index entry for key, or None. The entry's modification time is used as its last access time.
+        '''
+        entry = self._read_entry(key)
+        try:
+            if (entry is not None and os.path.isfile(self.blob_path(entry))):
+                os.utime(self._index_path(key))
+            else:
+                entry = None
+        except OSError:
+            entry = None
+        if (count):
+            self.record(entry)
+        return entry
+
+    def _read_entry(self, key):
+        try:
+            with open(self._index_path(key), "r") as file_object:
+                entry = json.load(file_object)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("key") == key else None
+
+    def record(self, entry):
+        '''
+        Counts a hit on entry, or a miss when it is None. For callers that look entries up with count=False and only
+        know afterwards whether the entry was usable.
+        '''
+        with self._lock:
+            if (entry is None):
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.bytes_served += entry["size"]
+
+    def put(self, key, path, link=True, **metadata):
+        '''
+        Stores the file at path under key, and returns the new index entry. With link set the blob is a hard link to
+        path when possible, which makes path read-only too; otherwise it is a reflink or copy.
+        '''
+        digest = hash_file(path)
+        size = os.path.getsize(path)
+        previous = self._read_entry(key)
+        entry = dict(metadata, key=key, hash=digest, size=size, stored=time.time())
+        blob = self.blob_path(entry)
+        added = 0
+        if (not os.path.isfile(blob)):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            handle, temp = tempfile.mkstemp(dir=os.path.dirname(blob), prefix=".tmp-")
+            os.close(handle)
+            try:
+                os.remove(temp)
+                try:
+                    if (not link):
+                        raise OSError("copy requested")
+                    os.link(path, temp)
+                except OSError:
+                    copy_file(path, temp)
+                os.chmod(temp, 0o444)
+                os.replace(temp, blob)
+                added = size
+            finally:
+                if (os.path.exists(temp)):
+                    os.remove(temp)
+
+        self._write_index(key, entry)
+        with self._lock:
+            self.bytes_stored += added
+            if (self._bytes is not None):
+                self._bytes += added
+            if (previous is not None and previous["hash"] != digest):
+                self._release_blob(previous)
+        self._evict()
+        return entry
+
+    def _entries(self):
+        '''
+        Returns (modification time, index path, entry) for every readable index entry.
+        '''
+        entries = []
+        for name in os.listdir(self._index):
+            path = os.path.join(self._index, name)
+            try:
+                with open(path, "r") as file_object:
+                    entries.append((os.path.getmtime(path), path, json.load(file_object)))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def _release_blob(self, entry):
+        # called with the lock held, once entry is no longer in the index
+        if (any(other["hash"] == entry["hash"] for _, _, other in self._entries())):
+            return
+        try:
+            os.remove(self.blob_path(entry))
+        except OSError:
+            return
+        if (self._bytes is not None):
+            self._bytes -= entry["size"]
+
+    def _write_index(self, key, entry):
+        handle, temp = tempfile.mkstemp(dir=self._index, prefix=".tmp-")
+        with os.fdopen(handle, "w") as file_object:
+            json.dump(entry, file_object)
+        os.replace(temp, self._index_path(key))
+
+    def materialize(self, entry, destination, link=True):
+        '''
+        Places the cached content of entry at destination, as a hard link when link is set (and possible), otherwise
+        as a reflink or copy that the caller may modify.
+        '''
+        blob = self.blob_path(entry)
+        if (link):
+            try:
+                os.link(blob, destination)
+                return destination
+            except OSError:
+                pass
+        copy_file(blob, destination)
+        os.chmod(destination, 0o644)
+        return destination
+
+    def _blob_bytes(self):
+        total = 0
+        for root, _, files in os.walk(self._blobs):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _evict(self):
+        with self._lock:
+            if (self._bytes is None):
+                self._bytes = self._blob_bytes()
+            if (self._bytes <= self.max_bytes):
+                return
+
+            entries = self._entries()
+            entries.sort(key=lambda e: e[0])
+            references = {}
+            for _, _, entry in entries:
+                references[entry["hash"]] = references.get(entry["hash"], 0) + 1
+            self._sweep_orphans(references)
+
+            for _, path, entry in entries:
+                if (self._bytes <= self.max_bytes):
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.evictions += 1
+                references[entry["hash"]] -= 1
+                if (references[entry["hash"]] == 0):
+                    try:
+                        os.remove(self.blob_path(entry))
+                        self._bytes -= entry["size"]
+                    except OSError:
+                        pass
+
+    def _sweep_orphans(self, references):
+        now = time.time()
+        for root, _, files in os.walk(self._blobs):
+            for name in files:
+                if (name in references or name.startswith(".tmp-")):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                    if (now - info.st_ctime < _ORPHAN_GRACE_SECONDS):
+                        continue
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._bytes -= info.st_size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes_stored": self.bytes_stored,
+                "bytes_served": self.bytes_served,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,320 @@
+import base64
+import os
+import shutil
+import tempfile
+import threading
+import time
+import concurrent.futures
+import http.client
+import urllib.parse
+import urllib.request
+
+
+class DownloadError(Exception):
+    pass
+
+
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+_RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+def _filename_for(uri):
+    name = os.path.basename(urllib.parse.unquote(urllib.parse.urlsplit(uri).path))
+    return name or "download"
+
+
+def _proxy_for(scheme, netloc):
+    '''
+    Returns the proxy url for scheme as urllib finds it (the http_proxy and https_proxy environment variables, or the
+    system settings), or None when there is none or netloc matches no_proxy.
+    '''
+    proxy = urllib.request.getproxies().get(scheme)
+    if (not proxy or urllib.request.proxy_bypass(netloc)):
+        return None
+    if ("://" not in proxy):
+        proxy = "http://" + proxy
+    return proxy
+
+
+def _proxy_headers(proxy):
+    parts = urllib.parse.urlsplit(proxy)
+    if (parts.username is None):
+        return {}
+    credentials = urllib.parse.unquote(parts.username) + ":" + urllib.parse.unquote(parts.password or "")
+    return {"Proxy-Authorization": "Basic " + base64.b64encode(credentials.encode()).decode("ascii")}
+
+
+class _ConnectionPool:
+    '''
+    Keeps one open http(s) connection per host for each thread, so consecutive downloads from the same host reuse
+    the connection instead of reconnecting (and renegotiating tls) every time. With a proxy, http connections go to
+    the proxy, and https ones tunnel through it with CONNECT.
+    '''
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+
+    def get(self, scheme, netloc, proxy=None):
+        connections = getattr(self._local, "connections", None)
+        if (connections is None):
+            connections = self._local.connections = {}
+        key = (scheme, netloc, proxy)
+        connection = connections.get(key)
+        if (connection is None):
+            connection = self._connect(scheme, netloc, proxy)
+            connections[key] = connection
+            with self._lock:
+                self._all.append(connection)
+        return connection
+
+    def _connect(self, scheme, netloc, proxy):
+        if (proxy is None):
+            if (scheme == "https"):
+                return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            return http.client.HTTPConnection(netloc, timeout=self.timeout)
+        proxyParts = urllib.parse.urlsplit(proxy)
+        proxyHost = proxyParts.netloc.rpartition("@")[2]
+        if (scheme == "https"):
+            connection = http.client.HTTPSConnection(proxyHost, timeout=self.timeout)
+            connection.set_tunnel(netloc, headers=_proxy_headers(proxy))
+            return connection
+        if (proxyParts.scheme == "https"):
+            return http.client.HTTPSConnection(proxyHost, timeout=self.timeout)
+        return http.client.HTTPConnection(proxyHost, timeout=self.timeout)
+
+    def discard(self, scheme, netloc, proxy=None):
+        connections = getattr(self._local, "connections", {})
+        connection = connections.pop((scheme, netloc, proxy), None)
+        if (connection is not None):
+            connection.close()
+
+    def close(self):
+        with self._lock:
+            for connection in self._all:
+                connection.close()
+            self._all = []
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(folder, max_bytes=1024 * 1024 * 1024):
+    '''
+    Returns the process wide DiskCache for folder, so its counters add up across requests.
+    '''
+    from .diskcache import DiskCache
+    folder = os.path.abspath(folder)
+    with _caches_lock:
+        if (folder not in _caches):
+            _caches[folder] = DiskCache(folder, max_bytes)
+        cache = _caches[folder]
+        cache.max_bytes = max_bytes
+        return cache
+
+
+class Downloader:
+    '''
+    Fetches uris into a private temporary folder with a bounded pool of threads, reusing http connections per host.
+    Each uri is retried up to retries times (with exponential backoff) on connection errors, timeouts and 408/429/5xx
+    responses. file:// uris and plain paths are read in place rather than copied. http(s) downloads go through the
+    proxies that urllib would use (http_proxy, https_proxy and no_proxy); https ones are tunnelled with CONNECT.
+
+    With a cache (a DiskCache), http(s) downloads are stored by content hash along with their ETag and Last-Modified
+    headers. Later fetches of the same uri send a conditional request, and a 304 reply is served from the cache as a
+    hard link. Entries younger than cache_ttl seconds are served without asking the server at all.
+
+    prefetch(items, uri_of) yields (item, path, is_temporary) in the order of items while the next downloads run in
+    the background, so downloading overlaps with whatever the caller does with each file.
+    '''
+
+    def __init__(self, workers=8, timeout=60, retries=3, backoff=0.5, folder=None, cache=None, cache_ttl=0):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self._stats = {"downloads": 0, "bytes_downloaded": 0, "cache_hits": 0, "cache_misses": 0,
+                       "cache_revalidated": 0, "bytes_from_cache": 0}
+        self._statsLock = threading.Lock()
+        self._ownsFolder = folder is None
+        self.folder = folder
+        self._pool = _ConnectionPool(timeout)
+        self._executor = None
+        self._counter = 0
+        self._counterLock = threading.Lock()
+
+    def __enter__(self):
+        if (self.folder is None):
+            self.folder = tempfile.mkdtemp(prefix="gravityai-downloads-")
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="gravityai-download")
+        return self
+
+    def __exit__(self, *exc_info):
+        self._executor.shutdown(wait=True)
+        self._pool.close()
+        if (self._ownsFolder and self.folder is not None):
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _destination(self, uri):
+        with self._counterLock:
+            self._counter += 1
+            index = self._counter
+        # one sub folder per download keeps the original file name (and extension) for the handler
+        folder = os.path.join(self.folder, str(index))
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, _filename_for(uri))
+
+    def fetch(self, uri):
+        '''
+        Fetches uri and returns (path, is_temporary). Temporary files may be removed by the caller once used.
+        '''
+        parts = urllib.parse.urlsplit(uri)
+        if (parts.scheme == "file"):
+            path = urllib.request.url2pathname(parts.path)
+            if (not os.path.isfile(path)):
+                raise DownloadError(f"File not found for {uri}")
+            return path, False
+        if (parts.scheme == ""):
+            if (not os.path.isfile(uri)):
+                raise DownloadError(f"File not found for {uri}")
+            return uri, False
+
+        destination = self._destination(uri)
+        entry = None
+        if (self.cache is not None and parts.scheme in ("http", "https")):
+            entry = self.cache.get("uri:" + uri, count=False)
+            if (entry is not None and time.time() - entry["stored"] < self.cache_ttl):
+                if (self._from_cache(entry, destination, revalidated=False)):
+                    return destination, True
+                entry = None
+
+        attempt = 0
+        while(True):
+            try:
+                if (parts.scheme in ("http", "https")):
+                    status, validators = self._get(uri, destination, entry)
+                    if (status == 304):
+                        if (self._from_cache(entry, destination, revalidated=True)):
+                            return destination, True
+                        # evicted since it was looked up, so download it again without the validators
+                        entry = None
+                        continue
+                    self._count(downloads=1, bytes_downloaded=os.path.getsize(destination))
+                    if (self.cache is not None):
+                        self._count(cache_misses=1)
+                        self.cache.record(None)
+                        self.cache.put("uri:" + uri, destination, **validators)
+                else:
+                    with urllib.request.urlopen(uri, timeout=self.timeout) as response, open(destination, "wb") as file_object:
+                        shutil.copyfileobj(response, file_object, 1024 * 1024)
+                return destination, True
+            except DownloadError as e:
+                if (not getattr(e, "retry", False) or attempt >= self.retries):
+                    raise
+            except (OSError, http.client.HTTPException) as e:
+                if (attempt >= self.retries):
+                    raise DownloadError(f"Failed to download {uri}: {e}") from e
+            attempt += 1
+            time.sleep(self.backoff * (2 ** (attempt - 1)))
+
+    def _count(self, **counts):
+        with self._statsLock:
+            for name, value in counts.items():
+                self._stats[name] += value
+
+    def stats(self):
+        with self._statsLock:
+            return dict(self._stats)
+
+    def _from_cache(self, entry, destination, revalidated):
+        '''
+        Places the cached content of entry at destination and returns True, or returns False when the entry was evicted
+        (by another thread or process sharing the cache) after it was looked up.
+        '''
+        try:
+            self.cache.materialize(entry, destination)
+        except OSError:
+            return False
+        self.cache.record(entry)
+        self._count(cache_hits=1, cache_revalidated=1 if revalidated else 0, bytes_from_cache=entry["size"])
+        return True
+
+    def _get(self, uri, destination, entry=None, redirects=5):
+        '''
+        Downloads uri to destination and returns the status with the response's validators. When entry (a cache
+        entry) has validators, the request is conditional and a 304 status means destination was not written.
+        '''
+        headers = {"User-Agent": "gravityai", "Accept-Encoding": "identity"}
+        if (entry is not None and entry.get("etag")):
+            headers["If-None-Match"] = entry["etag"]
+        if (entry is not None and entry.get("last_modified")):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        current = uri
+        for _ in range(redirects + 1):
+            parts = urllib.parse.urlsplit(current)
+            path = parts.path or "/"
+            if (parts.query):
+                path += "?" + parts.query
+            proxy = _proxy_for(parts.scheme, parts.netloc)
+            requestHeaders = headers
+            if (proxy is not None and parts.scheme == "http"):
+                # an http proxy takes the absolute uri, and its credentials with every request
+                path = urllib.parse.urlunsplit((parts.scheme, parts.netloc, path, "", ""))
+                requestHeaders = dict(headers, **_proxy_headers(proxy))
+            connection = self._pool.get(parts.scheme, parts.netloc, proxy)
+            try:
+                connection.request("GET", path, headers=requestHeaders)
+                response = connection.getresponse()
+                if (response.status == 304 and entry is not None):
+                    response.read()
+                    if (response.will_close):
+                        self._pool.discard(parts.scheme, parts.netloc, proxy)
+                    return 304, {}
+                if (response.status in _REDIRECT_STATUSES and response.getheader("Location")):
+                    response.read()
+                    current = urllib.parse.urljoin(current, response.getheader("Location"))
+                    continue
+                if (response.status != 200):
+                    response.read()
+                    error = DownloadError(f"HTTP {response.status} while downloading {uri}")
+                    error.retry = response.status in _RETRY_STATUSES
+                    raise error
+                with open(destination, "wb") as file_object:
+                    shutil.copyfileobj(response, file_object, 1024 * 1024)
+                if (response.will_close):
+                    self._pool.discard(parts.scheme, parts.netloc, proxy)
+                return 200, {"etag": response.getheader("ETag"), "last_modified": response.getheader("Last-Modified")}
+            except (OSError, http.client.HTTPException):
+                # the connection may have been closed by the server while idle; start over with a fresh one
+                self._pool.discard(parts.scheme, parts.netloc, proxy)
+                raise
+        raise DownloadError(f"Too many redirects while downloading {uri}")
+
+    def prefetch(self, items, uri_of, depth=None):
+        depth = depth or self.workers * 2
+        items = iter(items)
+        pending = []
+
+        def submit_next():
+            for item in items:
+                pending.append((item, self._executor.submit(self.fetch, uri_of(item))))
+                return True
+            return False
+
+        try:
+            while(len(pending) < depth and submit_next()):
+                pass
+            while(pending):
+                item, future = pending.pop(0)
+                path, is_temporary = future.result()
+                submit_next()
+                yield item, path, is_temporary
+        finally:
+            for _, future in pending:
+                future.cancel()
@@ -1,3 +1,4 @@
 from .explainer import *
 from .modelhandler import *
-from .factory import *
\ No newline at end of file
+from .factory import *
+from .cache import *
\ No newline at end of file
@@ -0,0 +1,168 @@
+import sys
+import threading
+import types
+from collections import OrderedDict
+
+
+_SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType)
+
+
+def _estimateSize(obj, exclude=(), limit=200000):
+    '''
+    Rough estimate of the memory held by obj, walking its attributes and containers (and the state of extension objects
+    that have no attributes, such as the trees of scikit-learn models). numpy arrays and pandas objects report their
+    buffers. Objects in exclude are not counted, and the walk stops after limit objects so estimating a large
+    explainer stays cheap.
+    '''
+    seen = set(id(o) for o in exclude)
+    # states built by __getstate__ are kept until the end, so their ids are not reused by the next one
+    states = []
+    stack = [obj]
+    total = 0
+    while(stack and len(seen) < limit):
+        o = stack.pop()
+        if (id(o) in seen or isinstance(o, _SKIPPED_TYPES)):
+            continue
+        seen.add(id(o))
+        if (type(o).__module__ == "numpy" and hasattr(o, "nbytes")):
+            total += int(o.nbytes)
+            continue
+        if (type(o).__module__.startswith("pandas") and hasattr(o, "memory_usage")):
+            try:
+                usage = o.memory_usage(deep=True)
+                total += int(usage.sum() if hasattr(usage, "sum") else usage)
+                continue
+            except Exception:
+                pass
+        try:
+            total += sys.getsizeof(o)
+        except TypeError:
+            continue
+        if (isinstance(o, (str, bytes, bytearray, int, float, complex, bool))):
+            continue
+        if (isinstance(o, dict)):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif (isinstance(o, (list, tuple, set, frozenset))):
+            stack.extend(o)
+        attributes = getattr(o, "__dict__", None)
+        if (isinstance(attributes, dict)):
+            stack.extend(attributes.values())
+        elif (getattr(type(o), "__getstate__", object.__getstate__) is not object.__getstate__):
+            try:
+                states.append(o.__getstate__())
+                stack.append(states[-1])
+            except Exception:
+                pass
+        for slot in getattr(type(o), "__slots__", ()):
+            # some objects (numba's for one) raise other errors than AttributeError for missing attributes
+            try:
+                if (isinstance(slot, str) and hasattr(o, slot)):
+                    stack.append(getattr(o, slot))
+            except Exception:
+                continue
+    return total
+
+
+class ExplainerCache:
+    '''
+    Process wide LRU cache of built explainers, keyed by the identity of the model, the explainer type and an optional
+    extra key (for example a fingerprint of the background data). Building an explainer such as shap.TreeExplainer
+    often costs more than computing the values, so repeated requests against the same loaded model reuse it.
+
+    A cached entry keeps a reference to its model, so the model's id cannot be reused while the entry exists, and the
+    model stays in memory until its last entry is evicted. The estimated size of each model is therefore counted once
+    along with its entries. Entries are evicted least recently used first once there are more than maxEntries of them,
+    or once the estimated size of the explainers and models goes over maxBytes; raise maxBytes (see configure) to
+    cache the explainers of models larger than that.
+    '''
+
+    def __init__(self, maxEntries=32, maxBytes=512 * 1024 * 1024):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()
+        # id(model) -> [model, estimated bytes, number of entries]
+        self._models = {}
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def getOrCreate(self, model, explainerType, build, extraKey=None):
+        key = (id(model), explainerType, extraKey)
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is not None and entry[0] is model):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Build outside the lock so a slow build does not hold up other models.
+        explainer = build()
+        size = _estimateSize(explainer, exclude=(model,))
+        with self._lock:
+            known = self._models.get(id(model))
+        modelSize = known[1] if known is not None else _estimateSize(model)
+        with self._lock:
+            self._remove(key)
+            if (self.maxEntries > 0 and size + modelSize <= self.maxBytes):
+                self._entries[key] = (model, explainer, size)
+                self._bytes += size
+                modelEntry = self._models.get(id(model))
+                if (modelEntry is None):
+                    modelEntry = self._models[id(model)] = [model, modelSize, 0]
+                    self._bytes += modelSize
+                modelEntry[2] += 1
+                self._evict()
+        return explainer
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if (entry is not None):
+            self._release(entry)
+
+    def _release(self, entry):
+        model, _, size = entry
+        self._bytes -= size
+        modelEntry = self._models[id(model)]
+        modelEntry[2] -= 1
+        if (modelEntry[2] == 0):
+            del self._models[id(model)]
+            self._bytes -= modelEntry[1]
+
+    def _evict(self):
+        while(self._entries and (len(self._entries) > self.maxEntries or self._bytes > self.maxBytes)):
+            _, entry = self._entries.popitem(last=False)
+            self._release(entry)
+            self.evictions += 1
+
+    def configure(self, maxEntries=None, maxBytes=None):
+        with self._lock:
+            if (maxEntries is not None):
+                self.maxEntries = maxEntries
+            if (maxBytes is not None):
+                self.maxBytes = maxBytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._models.clear()
+            self._bytes = 0
+
+    def getStats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxEntries": self.maxEntries,
+                "maxBytes": self.maxBytes,
+            }
+
+
+EXPLAINER_CACHE = ExplainerCache()
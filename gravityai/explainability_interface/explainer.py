@@ -1,13 +1,87 @@
 import abc
-import eli5
+import atexit
+import math
+import multiprocessing
+import threading
+from collections import OrderedDict
 from .modelhandler import *
+from .modelhandler import _iterRowChunks
+from .cache import EXPLAINER_CACHE
 
 
+# The model handler class (or the name of one in modelhandler) for each model_type of SHAPExplainer.
 MODEL_TYPE_MAPPINGS = {
     "general": "GeneralHandler",
-    "neuralNetwork": "NeuralNetworkHandler"
+    "neuralNetwork": "NeuralNetworkHandler",
+    "tree": "TreeHandler",
+    "linear": "LinearHandler",
+    "permutation": "PermutationHandler"
 }
 
+_TREE_PACKAGES = ("xgboost", "lightgbm", "catboost")
+_SKLEARN_TREE_MODELS = ("DecisionTree", "ExtraTree", "RandomForest", "GradientBoosting", "HistGradientBoosting",
+                        "IsolationForest")
+# deep learning models need tensors rather than the arrays the permutation explainer passes them
+_GENERAL_PACKAGES = ("torch", "tensorflow", "keras", "transformers")
+
+def _isTreeModel(model):
+    module = type(model).__module__
+    if module.split(".")[0] in _TREE_PACKAGES:
+        return True
+    if module.startswith(("sklearn.tree", "sklearn.ensemble")):
+        # bagging, voting and stacking ensembles may hold any kind of model
+        return type(model).__name__.startswith(_SKLEARN_TREE_MODELS)
+    return False
+
+def _isLinearModel(model):
+    return (type(model).__module__.startswith("sklearn.linear_model")
+            and hasattr(model, "coef_") and hasattr(model, "intercept_"))
+
+def _isPredictor(model):
+    if type(model).__module__.split(".")[0] in _GENERAL_PACKAGES:
+        return False
+    return callable(model) or hasattr(model, "predict")
+
+# Checked in order by detectModelType; registerModelHandler adds to the front.
+MODEL_TYPE_DETECTORS = [
+    ("tree", _isTreeModel),
+    ("linear", _isLinearModel),
+    ("permutation", _isPredictor)
+]
+
+def detectModelType(model):
+    '''
+    Returns the model_type used for model_type="auto": "tree" for tree models, "linear" for linear models,
+    "permutation" for other estimators and prediction functions, and "general" for anything else.
+    '''
+    for model_type, detector in MODEL_TYPE_DETECTORS:
+        if detector(model):
+            return model_type
+    return "general"
+
+def registerModelHandler(model_type, handlerClass, detector=None):
+    '''
+    Adds a model_type for SHAPExplainer, explained by handlerClass (a ModelHandlerSHAP). With a detector, a function
+    that takes the model and returns True if handlerClass should explain it, "auto" picks it before the built in types.
+    '''
+    MODEL_TYPE_MAPPINGS[model_type] = handlerClass
+    if detector is not None:
+        MODEL_TYPE_DETECTORS.insert(0, (model_type, detector))
+
+def _handlerClass(model_type):
+    if model_type not in MODEL_TYPE_MAPPINGS:
+        raise Exception("Unknown model_type \"%s\", please use \"auto\" or one of: %s."
+                        % (model_type, ", ".join(MODEL_TYPE_MAPPINGS)))
+    class_ = MODEL_TYPE_MAPPINGS[model_type]
+    return globals()[class_] if isinstance(class_, str) else class_
+
+def _supportedKwargs(class_, kwargs):
+    import inspect
+    parameters = inspect.signature(class_.__init__).parameters
+    if any(p.kind == p.VAR_KEYWORD for p in parameters.values()):
+        return dict(kwargs)
+    return {k: v for k, v in kwargs.items() if k in parameters}
+
 class Explainer(abc.ABC):
     '''
     Abstract explainer class
@@ -20,37 +94,235 @@ class Explainer(abc.ABC):
 
        
 
+# The model handler and explainer of a parallel shap worker process, built once by _initShapWorker.
+_workerShap = None
+
+def _initShapWorker(model, data, model_type, handler_kwargs):
+    global _workerShap
+    shapExplainer = SHAPExplainer(model, data, model_type, use_cache=False, **handler_kwargs)
+    _workerShap = (shapExplainer.modelHandler, shapExplainer.getExplanationObject())
+
+def _explainShapRows(rows):
+    modelHandler, explanationObject = _workerShap
+    return modelHandler.getShapSums(explanationObject, rows, len(rows))
+
+# Worker pools of parallel SHAPExplainers, keyed by model, model_type, handler keywords, n_jobs and the handler's
+# cache key for the data (None unless the explainer keeps the data as its background), so the workers start and build
+# their explainer once, and the rows of each call are sent to them in chunks.
+_SHAP_POOLS = OrderedDict()
+_SHAP_POOLS_SIZE = 4
+_SHAP_POOLS_LOCK = threading.Lock()
+
+def _newShapPool(shapExplainer, backgroundKey):
+    import concurrent.futures
+    # forkserver imports __main__ once and forks the workers from that single threaded process
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+    else:
+        context = multiprocessing.get_context("spawn")
+    # the workers only need the data when their explainer keeps it as its background
+    background = shapExplainer.data if backgroundKey is not None else None
+    return concurrent.futures.ProcessPoolExecutor(max_workers=shapExplainer.n_jobs, mp_context=context,
+                                                  initializer=_initShapWorker,
+                                                  initargs=(shapExplainer.model, background,
+                                                            shapExplainer.model_type, shapExplainer.handler_kwargs))
+
+def _shapPoolKey(shapExplainer, backgroundKey):
+    return (id(shapExplainer.model), shapExplainer.model_type, repr(sorted(shapExplainer.handler_kwargs.items())),
+            shapExplainer.n_jobs, backgroundKey)
+
+def _getShapPool(key, shapExplainer, backgroundKey):
+    with _SHAP_POOLS_LOCK:
+        entry = _SHAP_POOLS.get(key)
+        # the entry keeps the model alive, so its id cannot be reused while it is cached
+        if entry is not None:
+            _SHAP_POOLS.move_to_end(key)
+            return entry[1]
+        pool = _newShapPool(shapExplainer, backgroundKey)
+        _SHAP_POOLS[key] = (shapExplainer.model, pool)
+        while len(_SHAP_POOLS) > _SHAP_POOLS_SIZE:
+            _, (_, oldPool) = _SHAP_POOLS.popitem(last=False)
+            oldPool.shutdown(wait=False)
+        return pool
+
+def _discardShapPool(key, pool):
+    with _SHAP_POOLS_LOCK:
+        entry = _SHAP_POOLS.get(key)
+        if entry is not None and entry[1] is pool:
+            del _SHAP_POOLS[key]
+    pool.shutdown(wait=False)
+
+def shutdownShapPools():
+    '''
+    Stops the worker processes kept for parallel SHAPExplainers (n_jobs above 1). They are otherwise kept until the
+    process exits, or until the pools of newer models replace them.
+    '''
+    with _SHAP_POOLS_LOCK:
+        pools = [pool for _, pool in _SHAP_POOLS.values()]
+        _SHAP_POOLS.clear()
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+atexit.register(shutdownShapPools)
+
 class SHAPExplainer(Explainer):
     '''
-    Concrete class for SHAP explainer
+    Concrete class for SHAP explainer. With n_jobs above 1, the rows of data are split across that many worker
+    processes to compute the shap values for the bar plot. model_type="auto" picks the handler from the model (see
+    detectModelType), and then ignores the handler keywords that the chosen handler does not take; it is opt-in, since
+    the specialized explainers give different values than the default "general" one.
     '''
 
-    def __init__(self, model, data,  model_type="general"):
+    def __init__(self, model, data,  model_type="general", use_cache=True, n_jobs=None, **handler_kwargs):
+        if model_type == "auto":
+            model_type = detectModelType(model)
+            handler_kwargs = _supportedKwargs(_handlerClass(model_type), handler_kwargs)
         super().__init__(model, data, model_type)
+        self.use_cache = use_cache
+        self.n_jobs = n_jobs
+        self.handler_kwargs = handler_kwargs
         self.modelHandler = self._makeModelHandler()
     
     def _makeModelHandler(self):
-        module = __import__("modelhandler")
-        class_ = getattr(module, MODEL_TYPE_MAPPINGS[self.model_type])
-        instance = class_()
+        '''
+        Builds the model handler for model_type. Extra keyword arguments given to SHAPExplainer are passed on to it,
+        for example background_size or nsamples for the "neuralNetwork" handler.
+        '''
+        class_ = _handlerClass(self.model_type)
+        instance = class_(**self.handler_kwargs)
         return instance
 
     def getExplanationObject(self):
-        return self.modelHandler.getExplainer(self.model, self.data)
+        '''
+        Returns the shap explainer for the model. Unless use_cache is False, explainers are kept in the process wide
+        EXPLAINER_CACHE, so repeated calls for the same loaded model skip building it again.
+        '''
+        if not self.use_cache:
+            return self.modelHandler.getExplainer(self.model, self.data)
+        return EXPLAINER_CACHE.getOrCreate(self.model, ("shap", self.model_type),
+                                           lambda: self.modelHandler.getExplainer(self.model, self.data),
+                                           extraKey=self.modelHandler.getCacheKey(self.data))
+
+    def isParallel(self):
+        return bool(self.n_jobs and self.n_jobs > 1 and len(self.data) > 1)
+
+    def getParallelMeanShapValues(self):
+        '''
+        Computes the mean shap values of data across n_jobs worker processes. Each worker builds its explainer once, so
+        the model and data must be picklable. The workers start from a fresh interpreter rather than a fork, which is not
+        safe in a process that already runs threads (a server's request pool, BLAS or OpenMP pools), and
+        import the caller's __main__ script again. Unless use_cache is False, the workers are kept for the next call with
+        the same model and settings, whatever its rows, unless the handler's explainer keeps the data as its background
+        (see getCacheKey and shutdownShapPools). The rows are split into chunk_size rows (by default
+        one share per worker), each worker returns the per-feature sums of its chunks, and the sums are added in chunk
+        order. With a chunk_size the result is exactly that of the serial path with the same chunk_size; without one it
+        only differs from the serial mean by the rounding of the summation order (relative differences around 1e-15).
+        '''
+        import concurrent.futures.process
+        chunk_size = self.modelHandler.chunk_size
+        if not chunk_size:
+            chunk_size = int(math.ceil(len(self.data) / float(self.n_jobs)))
+        chunks = _iterRowChunks(self.data, chunk_size)
+        backgroundKey = self.modelHandler.getCacheKey(self.data)
+
+        if not self.use_cache:
+            with _newShapPool(self, backgroundKey) as pool:
+                return self._addShapSums(pool.map(_explainShapRows, chunks))
+
+        key = _shapPoolKey(self, backgroundKey)
+        pool = _getShapPool(key, self, backgroundKey)
+        try:
+            return self._addShapSums(pool.map(_explainShapRows, chunks))
+        except concurrent.futures.process.BrokenProcessPool:
+            # a worker died, so the next call starts new ones
+            _discardShapPool(key, pool)
+            raise
+
+    def _addShapSums(self, results):
+        sums = None
+        rows = 0
+        for chunk_sums, chunk_rows in results:
+            sums = chunk_sums if sums is None else sums + chunk_sums
+            rows += chunk_rows
+        return sums / rows
 
     def getBarPlotJson(self, explanationObject, max_features=5, output_labels=None, feature_labels=None):
-        return self.modelHandler.getBarPlotJson(explanationObject, self.data, max_features, output_labels, feature_labels)
+        mean_values = self.getParallelMeanShapValues() if self.isParallel() else None
+        return self.modelHandler.getBarPlotJson(explanationObject, self.data, max_features, output_labels, feature_labels, mean_values)
 
 class ELI5Explainer(Explainer):
     '''
-    Concrete class for ELI5 explainer
+    Concrete class for ELI5 explainer. explainPredictions explains many rows in one call and returns numpy arrays; for
+    linear models the contributions are computed from the coefficients for all rows at once, as eli5 would compute them
+    row by row. explainWeights only depends on the model, so unless use_cache is False it is built once per model and
+    kept in EXPLAINER_CACHE. feature_names default to the columns of data when it is a DataFrame.
     '''
-    def __init__(self, model, data, outputs, model_type="general"):
-        super().__init__(model, data, outputs, model_type)
+    def __init__(self, model, data=None, model_type="general", feature_names=None, use_cache=True):
+        super().__init__(model, data, model_type)
+        if feature_names is None and hasattr(data, "columns"):
+            feature_names = [str(column) for column in data.columns]
+        self.feature_names = feature_names
+        self.use_cache = use_cache
 
     def explainWeights(self):
-        return eli5.explain_weights(self.model) #for interface with a front end to show different graphs
+        import eli5
+        build = lambda: eli5.explain_weights(self.model, feature_names=self.feature_names) #for interface with a front end to show different graphs
+        if not self.use_cache:
+            return build()
+        extraKey = tuple(self.feature_names) if self.feature_names else None
+        return EXPLAINER_CACHE.getOrCreate(self.model, ("eli5", "weights"), build, extraKey=extraKey)
+
+    def explainPredictions(self, data=None):
+        '''
+        Explains every row of data (the explainer's data by default; a single row is taken as a batch of one) and returns
+        (contributions, bias). contributions holds the contribution of each feature to each row's prediction, shaped
+        rows x features, or rows x features x targets for models with several targets. Binary classifiers have a single
+        target, their second (positive) class, for every row; eli5 on its own explains each row's predicted class. bias
+        holds the intercept of each row, shaped rows or rows x targets.
+        '''
+        import numpy as np
+        if data is None:
+            data = self.data
+        features = np.atleast_2d(np.asarray(data.values if hasattr(data, "columns") else data, dtype=float))
+        if _isLinearModel(self.model):
+            return self._explainLinearPredictions(features)
+        return self._explainEachPrediction(features)
+
+    def _explainLinearPredictions(self, features):
+        import numpy as np
+        coef = np.atleast_2d(self.model.coef_)
+        intercept = np.broadcast_to(np.atleast_1d(self.model.intercept_), coef.shape[:1])
+        contributions = features[:, :, np.newaxis] * coef.T[np.newaxis, :, :]
+        bias = np.tile(intercept, (features.shape[0], 1))
+        return _squeezeTargets(contributions, bias)
 
-    def explainPredictions(self, dataPoint):
-        return eli5.explain_prediction(self.model, dataPoint)
+    def _explainEachPrediction(self, features):
+        import eli5
+        import numpy as np
+        names = self.feature_names or ["x%d" % i for i in range(features.shape[1])]
+        index = {name: i for i, name in enumerate(names)}
+        classes = getattr(self.model, "classes_", None)
+        targets = [classes[1]] if classes is not None and len(classes) == 2 else None
+        contributions = np.zeros((len(features), len(names), 1))
+        bias = np.zeros((len(features), 1))
+        for row, values in enumerate(features):
+            explanation = eli5.explain_prediction(self.model, values, top=None, feature_names=names, targets=targets)
+            if not explanation.targets:
+                raise Exception("ELI5 could not explain this model: %s" % explanation.error)
+            if row == 0 and len(explanation.targets) != 1:
+                contributions = np.zeros((len(features), len(names), len(explanation.targets)))
+                bias = np.zeros((len(features), len(explanation.targets)))
+            for target, targetExplanation in enumerate(explanation.targets):
+                weights = targetExplanation.feature_weights
+                for weight in weights.pos + weights.neg:
+                    if weight.feature == "<BIAS>":
+                        bias[row, target] = weight.weight
+                    else:
+                        contributions[row, index[weight.feature], target] = weight.weight
+        return _squeezeTargets(contributions, bias)
 
+def _squeezeTargets(contributions, bias):
+    # a single target is returned without its own axis
+    if contributions.shape[2] == 1:
+        return contributions[:, :, 0], bias[:, 0]
+    return contributions, bias
@@ -1,34 +1,34 @@
-import shap
 import abc
 from .explainer import *
 
 class ExplainabilityFactory(abc.ABC):
     '''
-    Abstract factory for the different types of explainability options
+    Abstract factory for the different types of explainability options. create_factory returns an explainer for model
+    and data that can be reused for any number of calls.
     '''
     @abc.abstractmethod
-    def create_factory(self):
+    def create_factory(self, model, data=None, **kwargs):
         pass
 
 
 
 class SHAPFactory(ExplainabilityFactory):
     '''
-    Concrete factory for SHAP explainer
+    Concrete factory for SHAP explainer. kwargs are passed to SHAPExplainer, for example model_type or n_jobs.
     '''
 
-    def create_factory(self):
-        shapExplainer = SHAPExplainer()
+    def create_factory(self, model, data=None, **kwargs):
+        shapExplainer = SHAPExplainer(model, data, **kwargs)
         return shapExplainer
 
     
 
 class ELI5Factory(ExplainabilityFactory):
     '''
-    Concrete factory for ELI5 explainer
+    Concrete factory for ELI5 explainer. kwargs are passed to ELI5Explainer, for example feature_names.
     '''
-    def create_factory(self):
-        eli5Explainer = ELI5Explainer()
+    def create_factory(self, model, data=None, **kwargs):
+        eli5Explainer = ELI5Explainer(model, data, **kwargs)
         return eli5Explainer
 
 
@@ -1,34 +1,102 @@
 import abc
-import shap
 import json
-import numpy as np
+import threading
+from collections import OrderedDict
+
+def _fingerprint(data):
+    '''
+    Content hash of a numpy array or pandas object, used to tell background datasets apart in caches.
+    '''
+    import hashlib
+    import numpy as np
+    digest = hashlib.blake2b(digest_size=16)
+    if hasattr(data, "columns") and hasattr(data, "values"):
+        digest.update(repr(list(data.columns)).encode("utf-8"))
+        data = data.values
+    array = np.ascontiguousarray(data)
+    digest.update(repr((array.shape, str(array.dtype))).encode("utf-8"))
+    if array.dtype.hasobject:
+        digest.update(repr(array.tolist()).encode("utf-8"))
+    else:
+        digest.update(memoryview(array).cast("B"))
+    return digest.hexdigest()
 
 class ModelHandlerSHAP(abc.ABC):
     @abc.abstractmethod
     def getExplainer(self,model, data):
         pass
 
+    def getCacheKey(self, data):
+        '''
+        Extra key for the explainer cache, for handlers whose explainer depends on the data as well as the model.
+        '''
+        return None
+
+def _iterRowChunks(data, chunk_size):
+    for start in range(0, len(data), chunk_size):
+        if hasattr(data, "iloc"):
+            yield data.iloc[start:start + chunk_size]
+        else:
+            yield data[start:start + chunk_size]
+
 class GeneralHandler(ModelHandlerSHAP):
+    '''
+    Explains models with shap.Explainer. By default shap values are computed for all rows at once. With chunk_size set,
+    they are computed chunk_size rows at a time and only running per-feature (and per-output) sums are kept, so peak
+    memory depends on the chunk size instead of the number of rows.
+    '''
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size
+
     def getExplainer(self, model, data=None):
+        import shap
         explainer = shap.Explainer(model)
         return explainer
 
-    def getBarPlotJson(self, explanationObject,processed_data, max_features=5, output_labels=None, feature_labels=None):
+    def getShapValues(self, explanationObject, data):
+        return explanationObject(data)
+
+    def getShapSums(self, explanationObject, data, chunk_size):
+        '''
+        Returns the sum over rows of the shap values of data (features, or features x outputs) and the number of rows,
+        computing the values chunk_size rows at a time.
+        '''
+        sums = None
+        rows = 0
+        for chunk in _iterRowChunks(data, chunk_size):
+            values = self.getShapValues(explanationObject, chunk).values
+            chunk_sums = values.sum(axis=0)
+            sums = chunk_sums if sums is None else sums + chunk_sums
+            rows += values.shape[0]
+        return sums, rows
+
+    def getMeanShapValues(self, explanationObject, data):
+        if not self.chunk_size:
+            return self.getShapValues(explanationObject, data).values.mean(axis=0)
+        sums, rows = self.getShapSums(explanationObject, data, self.chunk_size)
+        if rows == 0:
+            raise Exception("Please provide at least one row of data to explain.")
+        return sums / rows
+
+    def getBarPlotJson(self, explanationObject,processed_data, max_features=5, output_labels=None, feature_labels=None, mean_values=None):
         '''
         A function to get the shap bar plot in json form. Handles both 2D np arrays (single output variable) and 3D np arrays (multiple
-        output variables).
+        output variables). The bar plot only needs the mean shap value of each feature over the rows, so mean_values can be given
+        instead when they were already computed elsewhere.
         '''
-        def getShapBarGraphJson(array, n=max_features):
+        import numpy as np
+
+        def getShapBarGraphJson(means, n=max_features):
             '''
-            Helper function to take a 2D np array, and return a tuple containing the indices of the shap values (i.e. which feature), as well
+            Helper function to take a 1D np array of the mean shap value of each feature, and return a tuple containing the indices of the shap values (i.e. which feature), as well
             as the shap values. The length of the shap value will almost always be one higher, since the final value in there is the combined shap value
             of the rest of the features. The exception is if n is set to more than the length of the feature space. If feature_labels is provided, it will also include a mapping 
             from indices to feature names for inclusion in the front-end graph.
             '''
             nonlocal feature_labels
-            means = array.mean(axis=0)
-            ix = np.argsort(means.values)
-            shap_values = np.abs(means.values)[ix]
+            ix = np.argsort(means)
+            shap_values = np.abs(means)[ix]
             if feature_labels:
                 if shap_values.shape[0] < n:
                     feature_dict = {i:feature_labels[i] for i in list(ix)}
@@ -46,30 +114,181 @@ class GeneralHandler(ModelHandlerSHAP):
                 return [ix[:n], shap_values_toRet, feature_dict]
         output_dict = {}
         feature_dict = {}
-        shap_values = explanationObject(processed_data)
-        if feature_labels and shap_values.shape[1] != len(feature_labels):
-            print(len(shap_values))
+        if mean_values is None:
+            mean_values = self.getMeanShapValues(explanationObject, processed_data)
+        if feature_labels and mean_values.shape[0] != len(feature_labels):
             raise Exception("Please ensure that the length of the feature_labels list exactly matches the number of features expected by the model.")
         
-        if len(shap_values.shape) > 2:
+        if len(mean_values.shape) > 1:
             #handle each categorical variable
-            if output_labels and len(output_labels) != shap_values.shape[-1]:
+            if output_labels and len(output_labels) != mean_values.shape[-1]:
                 raise Exception("Please ensure that the output_labels list corresponds exactly to the outputs expected by the model.")
-            for z in range(shap_values.shape[2]):
+            for z in range(mean_values.shape[1]):
                 if output_labels:
                     key = output_labels[z]
                 else:
                     key = z
-                output_dict[key] = getShapBarGraphJson(shap_values[:,:,z])
+                output_dict[key] = getShapBarGraphJson(mean_values[:,z])
         else:
             #single handling
             for z in range(1):
-                if len(output_labels) > 1:
+                if output_labels and len(output_labels) > 1:
                     raise Exception("Please ensure that the output_labels list corresponds exactly to the outputs expected by the model.")
-                output_dict = getShapBarGraphJson(shap_values)
+                output_dict = getShapBarGraphJson(mean_values)
         return output_dict
 
-class NeuralNetworkHandler(ModelHandlerSHAP):
+# Background summaries for KernelExplainer, keyed by dataset fingerprint and summary settings.
+_BACKGROUND_CACHE = OrderedDict()
+_BACKGROUND_CACHE_SIZE = 16
+_BACKGROUND_CACHE_LOCK = threading.Lock()
+
+class NeuralNetworkHandler(GeneralHandler):
+    '''
+    Explains arbitrary models with shap.KernelExplainer. Its cost grows with the size of the background data times the
+    number of samples per explained row, so the background is summarized down to background_size rows, either with
+    weighted k-means centroids (summarize="kmeans") or a random sample (summarize="sample"), and nsamples caps the
+    number of model evaluations per row ("auto" uses shap's default of 2 * features + 2048). Summaries are cached per
+    dataset fingerprint. Pass background_size=None to use the full data as before.
+    '''
+
+    def __init__(self, background_size=100, summarize="kmeans", nsamples="auto", chunk_size=None):
+        super().__init__(chunk_size)
+        if summarize not in ("kmeans", "sample"):
+            raise Exception("Please set summarize to either \"kmeans\" or \"sample\".")
+        self.background_size = background_size
+        self.summarize = summarize
+        self.nsamples = nsamples
+        self._lastFingerprint = (None, None)
+
+    def _fingerprintOf(self, data):
+        # getCacheKey and getBackground are called with the same data, so only hash it once
+        if self._lastFingerprint[0] is not data:
+            self._lastFingerprint = (data, _fingerprint(data))
+        return self._lastFingerprint[1]
+
+    def getCacheKey(self, data):
+        # KernelExplainer keeps the background, so the explainer is only reusable for the same data
+        return (self._fingerprintOf(data), self.background_size, self.summarize)
+
+    def getBackground(self, data):
+        import shap
+        if self.background_size is None or len(data) <= self.background_size:
+            return data
+
+        key = self.getCacheKey(data)
+        with _BACKGROUND_CACHE_LOCK:
+            if key in _BACKGROUND_CACHE:
+                _BACKGROUND_CACHE.move_to_end(key)
+                return _BACKGROUND_CACHE[key]
+
+        if self.summarize == "kmeans":
+            background = shap.kmeans(data, self.background_size)
+        else:
+            background = shap.sample(data, self.background_size, random_state=0)
+
+        with _BACKGROUND_CACHE_LOCK:
+            _BACKGROUND_CACHE[key] = background
+            while len(_BACKGROUND_CACHE) > _BACKGROUND_CACHE_SIZE:
+                _BACKGROUND_CACHE.popitem(last=False)
+        return background
+
     def getExplainer(self, model, data):
-        explainer = shap.KernelExplainer(model, data)
-        return explainer
\ No newline at end of file
+        import shap
+        explainer = shap.KernelExplainer(model, self.getBackground(data))
+        return explainer
+
+    def getShapValues(self, explanationObject, data):
+        import shap
+        import numpy as np
+        values = explanationObject.shap_values(data, nsamples=self.nsamples, silent=True)
+        if isinstance(values, list):
+            values = np.stack(values, axis=-1)
+        if hasattr(explanationObject.expected_value, "__len__"):
+            base_values = np.tile(explanationObject.expected_value, (values.shape[0], 1))
+        else:
+            base_values = np.tile(explanationObject.expected_value, values.shape[0])
+        features = data.values if hasattr(data, "columns") else np.asarray(data)
+        return shap.Explanation(values, base_values=base_values, data=features)
+
+
+class TreeHandler(GeneralHandler):
+    '''
+    Explains tree models (sklearn decision trees and forests, gradient boosting, xgboost, lightgbm, catboost) with
+    shap.TreeExplainer, which computes exact shap values from the trees in polynomial time instead of evaluating the
+    model. approximate=True uses the faster Saabas approximation, and check_additivity=False skips shap's check that
+    the values add up to the model output.
+    '''
+
+    def __init__(self, approximate=False, check_additivity=True, chunk_size=None):
+        super().__init__(chunk_size)
+        self.approximate = approximate
+        self.check_additivity = check_additivity
+
+    def getExplainer(self, model, data=None):
+        import shap
+        explainer = shap.TreeExplainer(model)
+        return explainer
+
+    def getShapValues(self, explanationObject, data):
+        return explanationObject(data, approximate=self.approximate, check_additivity=self.check_additivity)
+
+def _maskerFor(data, background_size):
+    import shap
+    if background_size is None:
+        background_size = len(data)
+    return shap.maskers.Independent(data, max_samples=background_size)
+
+class LinearHandler(GeneralHandler):
+    '''
+    Explains linear models (anything with coef_ and intercept_, such as the sklearn.linear_model estimators) with
+    shap.LinearExplainer, which reads the values off the coefficients. The feature means are taken from up to
+    background_size rows of the data.
+    '''
+
+    def __init__(self, background_size=1000, chunk_size=None):
+        super().__init__(chunk_size)
+        self.background_size = background_size
+
+    def getCacheKey(self, data):
+        # the explainer keeps the feature means of the data
+        return (_fingerprint(data), self.background_size)
+
+    def getExplainer(self, model, data):
+        import shap
+        explainer = shap.LinearExplainer(model, _maskerFor(data, self.background_size))
+        return explainer
+
+def _predictFunction(model):
+    # estimators are explained through their probabilities when they have them
+    for name in ("predict_proba", "predict"):
+        if hasattr(model, name):
+            return getattr(model, name)
+    return model
+
+class PermutationHandler(GeneralHandler):
+    '''
+    Explains any model, or prediction function, with shap.PermutationExplainer. Each row costs max_evals model
+    evaluations ("auto" uses 10 * features + 1), against a background of up to background_size rows of the data, so
+    max_evals and background_size bound the time spent per row. Estimators are called through predict_proba, or
+    predict when they have no probabilities.
+    '''
+
+    def __init__(self, background_size=100, max_evals="auto", chunk_size=None):
+        super().__init__(chunk_size)
+        self.background_size = background_size
+        self.max_evals = max_evals
+
+    def getCacheKey(self, data):
+        # the explainer keeps the background data
+        return (_fingerprint(data), self.background_size)
+
+    def getExplainer(self, model, data):
+        import shap
+        explainer = shap.PermutationExplainer(_predictFunction(model), _maskerFor(data, self.background_size))
+        return explainer
+
+    def getShapValues(self, explanationObject, data):
+        max_evals = self.max_evals
+        if max_evals == "auto":
+            max_evals = 10 * data.shape[1] + 1
+        return explanationObject(data, max_evals=max_evals, silent=True)
@@ -2,16 +2,30 @@ import warnings
 import sys
 import os
 import json
+import io
 from pathlib import Path
 import argparse
 import asyncio
-import websockets
-from datetime import datetime
-from .explainability_interface import explainer
-import shap
-import pandas as pd
-import wget
-import shutil
+import csv
+import concurrent.futures
+import contextvars
+import functools
+import math
+import multiprocessing
+import signal
+import socket
+import tempfile
+import threading
+import time
+import traceback
+import stat
+from . import logs
+from . import metrics
+from . import profiling
+from . import streaming
+
+# websockets and the explainability/data libraries (shap, eli5, pandas, numpy) are imported
+# by the functions that use them, so a model that never calls them does not pay for loading them.
 
 warnings.filterwarnings("ignore")
 
@@ -44,16 +58,118 @@ def _valid_json(myjson):
     return True
 
 
+# Inputs up to this size are checked with json.loads, which is faster; larger ones are checked in chunks
+_JSON_LOAD_LIMIT = 64 * 1024 * 1024
+
+
+def _valid_json_file(path):
+    if (os.path.getsize(path) <= _JSON_LOAD_LIMIT):
+        with open(path, 'rb') as file:
+            return _valid_json(file.read())
+    return streaming.validate_json_file(path)
+
+
 _datafile = ""
 _outfile = ""
 _port = None
 _is_gai = False
 _is_debug = False
+_concurrency = None
+_pool_type = "thread"
+_workers = 1
+_max_in_flight = None
+_max_in_flight_per_connection = None
+_logger = None
+_metrics_port = None
+_result_cache_dir = None
+_result_cache_size = 1024
+_profiler = None
+_bulk_manifest = None
+_bulk_input_dir = None
+_bulk_output_dir = None
+_bulk_jobs = 1
+_bulk_overwrite = False
+_idle_timeout = None
+_drain_timeout = 30
+_host = "127.0.0.1"
+_unix_socket = None
+_compression = "deflate"
+_max_size = 1024 * 1024
+_ping_interval = 20
+
+
+def _set_profile_options(args):
+    global _profiler
+    if (args.profile is None):
+        return
+    if (args.profile_rate is None or args.profile_rate <= 0 or args.profile_rate > 1):
+        sys.stderr.write(
+            "Invalid profile rate specified. Please select a rate greater than 0 and at most 1.")
+        sys.exit(2)
+    if (args.profile_keep is None or args.profile_keep < 1):
+        sys.stderr.write(
+            "Invalid number of profiles to keep specified. Please keep at least 1 profile.")
+        sys.exit(2)
+    _profiler = profiling.Profiler(args.profile, args.profile_rate, args.profile_keep)
+
+
+def _set_bulk_options(args):
+    global _bulk_manifest
+    global _bulk_input_dir
+    global _bulk_output_dir
+    global _bulk_jobs
+    global _bulk_overwrite
+    global _pool_type
+    if (args.input_path is not None or args.output_path is not None):
+        sys.stderr.write(
+            "Input and output paths cannot be combined with --manifest or --input-dir.")
+        sys.exit(2)
+    if (args.manifest is not None and args.input_dir is not None):
+        sys.stderr.write(
+            "Please specify either --manifest or --input-dir, not both.")
+        sys.exit(2)
+    if (args.manifest is not None and not os.path.isfile(args.manifest)):
+        sys.stderr.write("Manifest file not found.")
+        sys.exit(2)
+    if (args.input_dir is not None):
+        if (not os.path.isdir(args.input_dir)):
+            sys.stderr.write("Input directory not found.")
+            sys.exit(2)
+        if (args.output_dir is None):
+            sys.stderr.write("No output directory specified. Please specify --output-dir.")
+            sys.exit(2)
+        inputDir = os.path.abspath(args.input_dir)
+        outputDir = os.path.abspath(args.output_dir)
+        if (outputDir == inputDir or outputDir.startswith(inputDir + os.sep)):
+            sys.stderr.write("The output directory cannot be inside the input directory.")
+            sys.exit(2)
+    if (args.jobs is None or args.jobs < 1):
+        sys.stderr.write(
+            "Invalid number of jobs specified. Please select at least 1 job.")
+        sys.exit(2)
+    _bulk_manifest = args.manifest
+    _bulk_input_dir = args.input_dir
+    _bulk_output_dir = args.output_dir
+    _bulk_jobs = args.jobs
+    _bulk_overwrite = args.overwrite
+    _pool_type = args.pool
 
 
 def _run_command(args):
     global _datafile
     global _outfile
+    _set_profile_options(args)
+    if (args.manifest is not None or args.input_dir is not None):
+        _set_bulk_options(args)
+        return
+
+    if (args.input_path is None):
+        sys.stderr.write("Input file not found. Please create an input file.")
+        sys.exit(2)
+    if (args.output_path is None):
+        sys.stderr.write(
+            "No output file specified on command line. Please specify a file.")
+        sys.exit(2)
     _datafile = Path(args.input_path)
     # Validate that input file exists
     if (not _datafile.is_file()):
@@ -62,12 +178,10 @@ def _run_command(args):
 
     # Validate that json input file contains valid data format, if the input was json
     if str(_datafile).endswith(".json"):
-        with open(str(_datafile), 'r') as file:
-            json_text = file.read().replace('\n', '')
-            if not _valid_json(json_text):
-                sys.stderr.write(
-                    "JSON input is not in a valid format. Please check the format of the input file.")
-                sys.exit(2)
+        if not _valid_json_file(str(_datafile)):
+            sys.stderr.write(
+                "JSON input is not in a valid format. Please check the format of the input file.")
+            sys.exit(2)
 
     # Validate that output file was specified
     if (len(args.output_path) <= 2):
@@ -77,20 +191,114 @@ def _run_command(args):
     _outfile = Path(args.output_path)
 
 
+def _check_in_flight_limits():
+    if ((_max_in_flight is not None and _max_in_flight < 1) or
+            (_max_in_flight_per_connection is not None and _max_in_flight_per_connection < 1)):
+        sys.stderr.write(
+            "Invalid in flight limit specified. Please allow at least 1 request in flight.")
+        sys.exit(2)
+
+
+def _is_multiprocessing_child():
+    # a process started by multiprocessing, such as one of interpret_model's n_jobs workers, imports the script again
+    return multiprocessing.current_process().name != "MainProcess"
+
+
+def _server_location():
+    if (_unix_socket is not None):
+        return "unix socket " + _unix_socket
+    return "port " + str(_port)
+
+
 def _serve_command(args):
     global _port
     global _is_gai
     global _is_debug
+    global _concurrency
+    global _pool_type
     _port = args.port
     _is_gai = args.gai
     _is_debug = args.debug
+    global _workers
+    _concurrency = args.concurrency
+    _pool_type = args.pool
+    _workers = args.workers
+    global _result_cache_dir
+    global _result_cache_size
+    _result_cache_dir = args.result_cache
+    _result_cache_size = args.result_cache_size
+    global _metrics_port
+    _metrics_port = args.metrics_port
+    global _max_in_flight
+    global _max_in_flight_per_connection
+    _max_in_flight = args.max_in_flight
+    _max_in_flight_per_connection = args.max_in_flight_per_connection
+    global _idle_timeout
+    global _drain_timeout
+    _idle_timeout = args.idle_timeout
+    _drain_timeout = args.drain_timeout
+    global _host
+    global _unix_socket
+    global _compression
+    global _max_size
+    global _ping_interval
+    _host = args.host
+    _unix_socket = args.unix_socket
+    _compression = args.compression
+    _max_size = args.max_size
+    _ping_interval = args.ping_interval
+    _set_profile_options(args)
+    global _logger
+    if (_is_debug):
+        _logger = logs.AsyncLogger("gai_debug.log", level=logs.LEVELS[args.log_level])
 
     if (_port is None or _port < 1 or _port > 65535):
         sys.stderr.write(
             "Invalid port number specified. Please select a port number in the range 0-65535")
         sys.exit(2)
-    if(not _is_gai):
-        print("Serving on port " + str(_port))
+    if (_concurrency is not None and _concurrency < 1):
+        sys.stderr.write(
+            "Invalid concurrency specified. Please select at least 1 concurrent request.")
+        sys.exit(2)
+    if (_workers is None or _workers < 1):
+        sys.stderr.write(
+            "Invalid number of workers specified. Please select at least 1 worker.")
+        sys.exit(2)
+    _check_in_flight_limits()
+    if (_metrics_port is not None and (_metrics_port < 1 or _metrics_port + _workers - 1 > 65535 or _metrics_port == _port)):
+        sys.stderr.write(
+            "Invalid metrics port specified. Please select a port number in the range 0-65535 other than the serving port.")
+        sys.exit(2)
+    if (_result_cache_size is None or _result_cache_size < 1):
+        sys.stderr.write(
+            "Invalid result cache size specified. Please select at least 1 MB.")
+        sys.exit(2)
+    if (_idle_timeout is not None and _idle_timeout < 0):
+        sys.stderr.write(
+            "Invalid idle timeout specified. Please select at least 0 seconds.")
+        sys.exit(2)
+    if (_drain_timeout is None or _drain_timeout < 0):
+        sys.stderr.write(
+            "Invalid drain timeout specified. Please select at least 0 seconds.")
+        sys.exit(2)
+    if (_max_size is None or _max_size < 0):
+        sys.stderr.write(
+            "Invalid maximum message size specified. Please select at least 0 bytes.")
+        sys.exit(2)
+    if (_ping_interval is None or _ping_interval < 0):
+        sys.stderr.write(
+            "Invalid ping interval specified. Please select at least 0 seconds.")
+        sys.exit(2)
+    if (_unix_socket is not None and not hasattr(socket, "AF_UNIX")):
+        sys.stderr.write(
+            "Unix sockets are not supported on this platform. Please serve on a port.")
+        sys.exit(2)
+    if (_workers > 1 and not hasattr(os, "fork")):
+        sys.stderr.write(
+            "Multiple workers are not supported on this platform. Please use a single worker.")
+        sys.exit(2)
+    if(not _is_gai and not _is_multiprocessing_child()):
+        print("Serving on " + _server_location())
 
 
 if _type_of_script() == 'terminal':
@@ -100,20 +308,74 @@ if _type_of_script() == 'terminal':
         title='subcommands', help='commands to choose from', required=True, dest='subcommand')
     parser_run = subparsers.add_parser(
         'run', help='run this model once from the command line')
-    parser_run.add_argument("input_path", help='Path to input data file')
-    parser_run.add_argument("output_path", help='Path to output result file')
+    parser_run.add_argument("input_path", nargs='?', help='Path to input data file')
+    parser_run.add_argument("output_path", nargs='?', help='Path to output result file')
+    parser_run.add_argument('--manifest', default=None,
+                            help='Csv file with "input" and "output" columns listing the files to process')
+    parser_run.add_argument('--input-dir', default=None,
+                            help='Process every file in this directory (recursively)')
+    parser_run.add_argument('--output-dir', default=None,
+                            help='Directory for the outputs of --input-dir, with the same relative paths as the inputs')
+    parser_run.add_argument("-j", '--jobs', default=1, type=int,
+                            help='Number of items of a --manifest or --input-dir processed at once')
+    parser_run.add_argument('--pool', choices=["thread", "process"], default="thread",
+                            help='Pool used to run synchronous handlers when --jobs is above 1')
+    parser_run.add_argument('--overwrite', action="store_true",
+                            help='Process items of a --manifest or --input-dir even if their output already exists')
     parser_run.set_defaults(func=_run_command)
 
     parser_serve = subparsers.add_parser(
         'serve', help='run this model as a websocket service')
     parser_serve.add_argument("-p", '--port',  nargs='?',
                               default=49200, help='tcp port to serve on', type=int)
+    parser_serve.add_argument('--host', default="127.0.0.1",
+                              help='Address to serve on, for example 0.0.0.0 for every interface')
+    parser_serve.add_argument('--unix-socket', default=None, metavar='PATH',
+                              help='Serve on this unix domain socket instead of a tcp port')
+    parser_serve.add_argument('--compression', choices=["deflate", "none"], default="deflate",
+                              help='Websocket per-message compression; "none" saves cpu on small messages over fast links')
+    parser_serve.add_argument('--max-size', default=1024 * 1024, type=int, metavar='BYTES',
+                              help='Largest message accepted from a client, 0 for no limit')
+    parser_serve.add_argument('--ping-interval', default=20, type=float, metavar='SECONDS',
+                              help='Interval of the keepalive pings sent to clients, 0 to disable them')
     parser_serve.add_argument('--gai', action="store_true",
                               help='Enable gravity AI specific status messages and idle timeout')
     parser_serve.add_argument('--debug', action="store_true",
                               help='Enable debugging to log file "gai_debug.log"')
+    parser_serve.add_argument('--log-level', choices=list(logs.LEVELS), default="debug",
+                              help='Lowest level of the messages written to "gai_debug.log" with --debug')
+    parser_serve.add_argument("-c", '--concurrency', default=None, type=int,
+                              help='Handle up to this many requests at once, completing them out of order')
+    parser_serve.add_argument('--pool', choices=["thread", "process"], default="thread",
+                              help='Pool used to run synchronous handlers when --concurrency is set')
+    parser_serve.add_argument("-w", '--workers', default=1, type=int,
+                              help='Number of worker processes sharing the port, each with its own copy of the model')
+    parser_serve.add_argument('--max-in-flight', default=None, type=int,
+                              help='Answer "busy" to new requests while this many requests are queued or running')
+    parser_serve.add_argument('--max-in-flight-per-connection', default=None, type=int,
+                              help='Answer "busy" to new requests on a connection that has this many requests queued or running '
+                                   '(needs --concurrency)')
+    parser_serve.add_argument('--metrics-port', default=None, type=int,
+                              help='Serve request latency and load metrics in the Prometheus text format on this http port '
+                                   '(with --workers, worker i serves only its own metrics on this port + i)')
+    parser_serve.add_argument('--result-cache', default=None, metavar='DIR',
+                              help='Reuse the output of earlier requests with identical input files, stored in this folder')
+    parser_serve.add_argument('--result-cache-size', default=1024, type=int, metavar='MB',
+                              help='Disk space the result cache may use, in megabytes')
+    parser_serve.add_argument('--idle-timeout', default=None, type=float, metavar='SECONDS',
+                              help='Exit after this many seconds without connections or requests in flight (default 30 with --gai, otherwise never; 0 for never)')
+    parser_serve.add_argument('--drain-timeout', default=30, type=float, metavar='SECONDS',
+                              help='On SIGTERM or SIGINT, wait up to this many seconds for the requests in flight to finish before exiting')
     parser_serve.set_defaults(func=_serve_command)
 
+    for subparser in (parser_run, parser_serve):
+        subparser.add_argument('--profile', default=None, metavar='DIR',
+                               help='Write a cProfile and a tracemalloc snapshot of the handler for sampled requests to this folder')
+        subparser.add_argument('--profile-rate', default=1.0, type=float,
+                               help='Fraction of the requests to profile with --profile')
+        subparser.add_argument('--profile-keep', default=100, type=int,
+                               help='Number of most recent profiles to keep with --profile')
+
     if (len(sys.argv) <= 1):
         parser.parse_args(['--help'])
         sys.exit(2)
@@ -161,11 +423,45 @@ def getOutputJSON():
 def getOutputFile():
     return getOutputCSV()
 
+
+def read_csv_chunks(path=None, chunksize=10000, **kwargs):
+    '''
+    Yields the input csv (or the csv at path) as pandas DataFrames of up to chunksize rows, so inputs larger than
+    memory can be handled one chunk at a time. kwargs are passed to pandas.read_csv.
+    '''
+    return streaming.read_csv_chunks(path or getInputCSV(), chunksize, **kwargs)
+
+
+def read_json_lines(path=None):
+    '''
+    Yields the object on each line of the input json lines file (or the file at path).
+    '''
+    return streaming.read_json_lines(path or getInputJSON())
+
+
+def open_csv_writer(path=None, **kwargs):
+    '''
+    Returns a writer that appends DataFrames to the output csv (or the csv at path) as they are produced, writing the
+    header once: use it with read_csv_chunks to keep only one chunk of the output in memory.
+    '''
+    return streaming.CSVChunkWriter(path or getOutputCSV(), **kwargs)
+
+
+def open_json_lines_writer(path=None):
+    '''
+    Returns a writer that writes one json object per line to the output file (or the file at path) as they are produced.
+    '''
+    return streaming.JSONLinesWriter(path or getOutputJSON())
+
 # This helper function splits an iterable list into chunks of a constant size (until the last chunk). It is used for batching.
 # from: https://stackoverflow.com/questions/8290397/how-to-split-an-iterable-in-constant-size-chunks
+# Iterables without a length (generators, readers) are consumed lazily instead of being sliced.
 
 
 def batch(iterable, n=1):
+    if (not hasattr(iterable, '__len__') or not hasattr(iterable, '__getitem__')):
+        yield from streaming.batch_iter(iterable, n)
+        return
     l = len(iterable)
     for ndx in range(0, l, n):
         yield iterable[ndx:min(ndx + n, l)]
@@ -197,31 +493,95 @@ def _print_gravity_message(message):
     global _is_gai
     if _is_gai:
         print("[gravityAI]: " + message, flush=True)
-    _print_debug_message(message)
+    _log(logs.INFO, message)
 
 
-def _print_debug_message(message):
-    global _is_debug
-    if _is_debug:
-        timestamp = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        with open("gai_debug.log", "a") as file_object:
-            file_object.write(f"[debug {timestamp}]: {message}\n")
+def _log(level, message, *args, **fields):
+    '''
+    Logs message % args, with any extra fields, as a json line in "gai_debug.log" when --debug is on. Formatting and
+    writing happen on the logger's thread, so pass values as args rather than preformatting them.
+    '''
+    if (_logger is not None and level >= _logger.level):
+        _logger.log(level, message, *args, **fields)
+
+
+# Request latencies are measured per phase: waiting for a request worker, validating the paths,
+# running the handler and sending status messages. Read them with a {"type": "stats"} message
+# or from the --metrics-port http endpoint.
+_metrics = metrics.Registry()
+_queue_seconds = _metrics.histogram(
+    "request_queue_seconds", "Time accepted requests waited for a free request worker")
+_validate_seconds = _metrics.histogram(
+    "request_validate_seconds", "Time spent validating request paths")
+_handler_seconds = _metrics.histogram(
+    "request_handler_seconds", "Time spent in the request handler")
+_send_seconds = _metrics.histogram(
+    "request_send_seconds", "Time spent sending status messages")
+_request_seconds = _metrics.histogram(
+    "request_seconds", "Time from accepting a request to sending its reply")
+_requests_total = _metrics.counter(
+    "requests_total", "Requests answered, by status", label="status")
+_metrics.gauge("requests_in_flight", "Requests accepted and not answered yet", lambda: len(_active_requests))
+_metrics.gauge("requests_queued", "Requests waiting for a free request worker",
+               lambda: _request_queue.qsize() if _request_queue is not None else 0)
+_metrics.gauge("connections", "Open websocket connections", lambda: sum(1 for c in _connections if c.open))
+
+
+def _stats():
+    stats = _metrics.snapshot()
+    stats["pid"] = os.getpid()
+    if (_worker_index is not None):
+        stats["worker"] = _worker_index
+    return stats
+
+
+async def _send(websocket, message):
+    started = time.perf_counter()
+    try:
+        await websocket.send(message)
+    finally:
+        _send_seconds.observe(time.perf_counter() - started)
 
 
 async def _send_error_message(websocket, reqId, message):
-    await websocket.send(json.dumps({"status": "error", "error": message, "requestId": reqId}))
+    await _send(websocket, json.dumps({"status": "error", "error": message, "requestId": reqId}))
 
 
 async def _send_error_bad_message(websocket, error, message):
-    await websocket.send(json.dumps({"status": "error", "error": error, "request": message}))
+    await _send(websocket, json.dumps({"status": "error", "error": error, "request": message}))
 
 
 async def _send_accepted_message(websocket, reqId):
-    await websocket.send(json.dumps({"status": "pending", "requestId": reqId}))
+    await _send(websocket, json.dumps({"status": "pending", "requestId": reqId}))
+
+
+async def _send_busy_message(websocket, reqId, message):
+    await _send(websocket, json.dumps({"status": "busy", "error": message, "requestId": reqId}))
+
+
+async def _send_deadline_exceeded_message(websocket, reqId):
+    await _send(websocket, json.dumps({"status": "deadline_exceeded", "requestId": reqId}))
+
+
+async def _send_cancelled_message(websocket, reqId):
+    await _send(websocket, json.dumps({"status": "cancelled", "requestId": reqId}))
 
 
 async def _send_finished_message(websocket, reqId):
-    await websocket.send(json.dumps({"status": "complete", "requestId": reqId}))
+    await _send(websocket, json.dumps({"status": "complete", "requestId": reqId}))
+
+
+async def _send_finished_inline_message(websocket, reqId, output):
+    # Sent as one fragmented binary message so the output buffer is not copied onto the header.
+    header = json.dumps({"status": "complete", "requestId": reqId}) + "\n"
+    await _send(websocket, [header.encode("utf-8"), output])
+
+
+async def _send_stats_message(websocket, data):
+    reply = {"type": "stats", "stats": _stats()}
+    if (_is_dictionary_string_valid(data, 'requestId')):
+        reply["requestId"] = data['requestId']
+    await _send(websocket, json.dumps(reply))
 
 
 def _normalize_path_string(path):
@@ -231,29 +591,290 @@ def _normalize_path_string(path):
     return f.absolute()
 
 
-async def _on_request(inputFile, outputFile):
+_executor = None
+
+
+async def _run_in_executor(call):
+    # handlers in a thread pool see the request of the calling task (see request_cancelled)
+    if (isinstance(_executor, concurrent.futures.ThreadPoolExecutor)):
+        call = functools.partial(contextvars.copy_context().run, call)
+    return await asyncio.get_event_loop().run_in_executor(_executor, call)
+
+# Set by wait_for_batched_requests. Requests are then queued on _batch_queue and grouped
+# into a single handler call by _batch_dispatcher.
+_max_batch_size = None
+_max_batch_wait = None
+_batch_queue = None
+_batch_dispatchers = []
+
+
+def _is_batching():
+    return _max_batch_size is not None
+
+
+async def _call_batch_handler(inputFiles, outputFiles, profilePath=None):
+    '''
+    Call the batch handler once for every request in the batch, and return a list with the error (or None) for each
+    request. The handler may return None, a single error for the whole batch, or a list with one error per request.
+    '''
+    if(asyncio.iscoroutinefunction(_request_handler)):
+        call = functools.partial(_request_handler, [str(f) for f in inputFiles], [str(f) for f in outputFiles])
+        if (profilePath is not None):
+            err = await profiling.run_profiled_async(call, profilePath)
+        else:
+            err = await call()
+    else:
+        call = functools.partial(_request_handler,
+                                 [str(_normalize_path_string(f)) for f in inputFiles],
+                                 [str(_normalize_path_string(f)) for f in outputFiles])
+        if (profilePath is not None):
+            call = functools.partial(profiling.run_profiled, call, profilePath)
+        if (_executor is None):
+            err = call()
+        else:
+            err = await _run_in_executor(call)
+
+    if (isinstance(err, (list, tuple))):
+        if (len(err) != len(inputFiles)):
+            message = f"Batch handler returned {len(err)} results for {len(inputFiles)} requests"
+            return [message] * len(inputFiles)
+        return list(err)
+    return [err] * len(inputFiles)
+
+
+async def _profile_batch_handler(inputFiles, outputFiles, reqIds):
+    # a batch is profiled as a whole, under the id of its first request
+    profilePath = _profiler.start("batch-" + str(reqIds[0])) if _profiler is not None else None
+    if (profilePath is None):
+        return await _call_batch_handler(inputFiles, outputFiles)
+    _log(logs.INFO, "Profiling batch of %d requests", len(inputFiles), profile=profilePath, requests=list(reqIds))
+    try:
+        return await _call_batch_handler(inputFiles, outputFiles, profilePath)
+    finally:
+        _profiler.finish()
+
+
+async def _batch_dispatcher():
+    loop = asyncio.get_event_loop()
+    while(True):
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + _max_batch_wait
+        while(len(batch) < _max_batch_size):
+            remaining = deadline - loop.time()
+            if (remaining <= 0):
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        inputFiles, outputFiles, reqIds, futures = zip(*batch)
+        _log(logs.DEBUG, "Handling Batch of %d requests", len(batch))
+        try:
+            errors = await _profile_batch_handler(inputFiles, outputFiles, reqIds)
+        except BaseException as e:
+            for future in futures:
+                if (not future.done()):
+                    future.set_exception(e)
+            if (isinstance(e, asyncio.CancelledError)):
+                raise
+            continue
+
+        for future, err in zip(futures, errors):
+            if (not future.done()):
+                future.set_result(err)
+
+
+async def _invoke_handler(inputFile, outputFile, reqId=None):
+    if (_is_batching()):
+        if (_batch_queue is None):
+            errors = await _profile_batch_handler([inputFile], [outputFile], [reqId])
+            return errors[0]
+        future = asyncio.get_event_loop().create_future()
+        await _batch_queue.put((inputFile, outputFile, reqId, future))
+        return await future
+
+    profilePath = _profiler.start(reqId) if _profiler is not None else None
+    if (profilePath is None):
+        return await _call_handler(inputFile, outputFile)
+    _log(logs.INFO, "Profiling request %s", reqId, profile=profilePath)
+    try:
+        return await _call_handler(inputFile, outputFile, profilePath)
+    finally:
+        _profiler.finish()
+
+
+async def _call_handler(inputFile, outputFile, profilePath=None):
+    # Async handlers run on the event loop. Synchronous handlers run inline unless
+    # a pool was configured, in which case the loop keeps serving while they work.
+    # Profiled calls are wrapped where they run, since cProfile only sees its own thread.
+    if(asyncio.iscoroutinefunction(_request_handler)):
+        call = functools.partial(_request_handler, str(inputFile), str(outputFile))
+        if (profilePath is not None):
+            return await profiling.run_profiled_async(call, profilePath)
+        return await call()
+
+    call = functools.partial(_request_handler, str(_normalize_path_string(
+        inputFile)), str(_normalize_path_string(outputFile)))
+    if (profilePath is not None):
+        call = functools.partial(profiling.run_profiled, call, profilePath)
+    if (_executor is None):
+        return call()
+    return await _run_in_executor(call)
+
+
+_inline_handler = None
+
+
+def _call_inline_handler(handler, inputData):
+    outputBuffer = io.BytesIO()
+    err = handler(inputData, outputBuffer)
+    return err, outputBuffer
+
+
+async def _invoke_inline_handler(inputData):
+    if(asyncio.iscoroutinefunction(_inline_handler)):
+        outputBuffer = io.BytesIO()
+        err = await _inline_handler(inputData, outputBuffer)
+        return err, outputBuffer
+
+    if (_executor is None):
+        return _call_inline_handler(_inline_handler, inputData)
+    if (isinstance(_executor, concurrent.futures.ProcessPoolExecutor)):
+        # memoryviews cannot be pickled over to the worker process
+        inputData = bytes(inputData)
+    return await _run_in_executor(functools.partial(_call_inline_handler, _inline_handler, inputData))
+
+
+async def _on_spilled_inline_request(inputData, reqId=None):
+    # Without an inline handler, the payload goes through the regular path based handler
+    # using a private temporary folder.
+    with tempfile.TemporaryDirectory(prefix="gravityai-") as folder:
+        inputFile = os.path.join(folder, "input")
+        outputFile = os.path.join(folder, "output")
+        with open(inputFile, "wb") as file_object:
+            file_object.write(inputData)
+
+        isOk, error = await _on_request(inputFile, outputFile, reqId)
+        if (not isOk):
+            return False, error, None
+        with open(outputFile, "rb") as file_object:
+            return True, None, file_object.read()
+
+
+async def _on_inline_request(inputData, reqId=None):
+    if (_inline_handler is None):
+        return await _on_spilled_inline_request(inputData, reqId)
+    if (not callable(_inline_handler)):
+        return False, "Inline Request Handler is not callable", None
+
+    try:
+        _log(logs.DEBUG, "Handling Inline Request")
+        started = time.perf_counter()
+        try:
+            err, outputBuffer = await _invoke_inline_handler(inputData)
+        finally:
+            _handler_seconds.observe(time.perf_counter() - started)
+        if (not err is None and err):
+            _log(logs.WARNING, "Request Error: %s", err)
+            return False, f"Error returned during processing: {err}", None
+        _log(logs.DEBUG, "Request Finished")
+    except Exception as e:
+        return False, "Exception generated during processing: " + str(e), None
+    except BaseException as e:
+        return False, "Exception generated during processing: " + str(e), None
+    return True, None, outputBuffer.getbuffer()
+
+
+_result_cache = None
+_result_cache_version = ""
+_result_cache_pending = {}
+
+
+def _open_result_cache(version, handler):
+    global _result_cache
+    global _result_cache_version
+    from .diskcache import DiskCache
+    _result_cache = DiskCache(_result_cache_dir, _result_cache_size * 1024 * 1024)
+    if (version is None):
+        version = getattr(handler, "__module__", "") + "." + getattr(handler, "__qualname__", "")
+    _result_cache_version = str(version)
+
+
+async def _on_cached_request(inputFile, outputFile, reqId=None):
+    '''
+    Serves a request from the result cache when an earlier request had the same input, version and output file extension
+    (handlers may pick the output format from it), otherwise runs it and stores its output. Identical requests arriving
+    while one is running wait for it rather than running too, and run themselves if it fails or is cancelled.
+    '''
+    from .diskcache import hash_file
+    loop = asyncio.get_running_loop()
+    extension = os.path.splitext(outputFile)[1]
+    key = _result_cache_version + ":" + extension + ":" + await loop.run_in_executor(None, hash_file, inputFile)
+    while(True):
+        entry = _result_cache.get(key, count=False)
+        if (entry is not None):
+            _result_cache.record(entry)
+            _log(logs.DEBUG, "Result Cache Hit")
+            await loop.run_in_executor(None, functools.partial(_result_cache.materialize, entry, outputFile, link=False))
+            return True, None
+        pending = _result_cache_pending.get(key)
+        if (pending is None):
+            break
+        # a failed or cancelled leader leaves nothing in the cache, so try again (and run it here if nobody else is)
+        await asyncio.shield(pending)
+
+    _result_cache.record(None)
+    pending = _result_cache_pending[key] = loop.create_future()
+    result = (False, "Request was cancelled")
+    try:
+        result = await _run_request(inputFile, outputFile, reqId)
+        if (result[0]):
+            await loop.run_in_executor(None, functools.partial(_result_cache.put, key, outputFile, link=False))
+    finally:
+        del _result_cache_pending[key]
+        pending.set_result(result)
+    return result
+
+
+async def _on_request(inputFile, outputFile, reqId=None):
     global _request_handler
     if (not _check_request_handler()):
         return False, "Request Handler is not callable"
 
     try:
         # Validate that input file exists
+        started = time.perf_counter()
         inFile = Path(inputFile)
-        if (not inFile.is_file()):
+        isFile = inFile.is_file()
+        _validate_seconds.observe(time.perf_counter() - started)
+        if (not isFile):
             return False, "Input file not found"
-        _print_debug_message("Handling Request")
-        err = None
-        if(asyncio.iscoroutinefunction(_request_handler)):
-            err = await _request_handler(str(inputFile), str(outputFile))
-        else:
-            err = _request_handler(str(_normalize_path_string(
-                inputFile)), str(_normalize_path_string(outputFile)))
+        if (_result_cache is not None):
+            return await _on_cached_request(inputFile, outputFile, reqId)
+        return await _run_request(inputFile, outputFile, reqId)
+    except Exception as e:
+        return False, "Exception generated during processing: " + str(e)
+    except BaseException as e:
+        return False, "Exception generated during processing: " + str(e)
+    except:
+        return False, "Unknown Exception generated during processing"
+
+
+async def _run_request(inputFile, outputFile, reqId=None):
+    try:
+        _log(logs.DEBUG, "Handling Request")
+        started = time.perf_counter()
+        try:
+            err = await _invoke_handler(inputFile, outputFile, reqId)
+        finally:
+            _handler_seconds.observe(time.perf_counter() - started)
 
         if (not err is None and err):
-            _print_debug_message(f"Request Error: {err}")
+            _log(logs.WARNING, "Request Error: %s", err)
             return False, f"Error returned during processing: {err}"
 
-        _print_debug_message(f"Request Finished")
+        _log(logs.DEBUG, "Request Finished")
         outFile = Path(outputFile)
 
         # Validate that output file exists
@@ -277,22 +898,332 @@ _connections = set()
 
 
 async def _remove_when_closed(websocket):
-    _print_debug_message("Awaiting Close")
+    _log(logs.DEBUG, "Awaiting Close")
     await websocket.wait_closed()
-    _print_debug_message("Awaiting Close Complete")
+    _log(logs.DEBUG, "Awaiting Close Complete")
     if(websocket in _connections):
         _connections.remove(websocket)
+        _update_idle_state()
+
+
+async def _process_request(websocket, reqId, inputFile, outputFile):
+    try:
+        isOk, error = await _on_request(inputFile, outputFile, reqId)
+    except:
+        _requests_total.inc("error")
+        await _send_error_message(websocket, reqId, "Unhandle exception during processing")
+        return
+
+    if (request_cancelled()):
+        _requests_total.inc("cancelled")
+        await _send_cancelled_message(websocket, reqId)
+        return
+
+    if (not isOk):
+        _requests_total.inc("error")
+        await _send_error_message(websocket, reqId, error)
+        return
+
+    _requests_total.inc("complete")
+    await _send_finished_message(websocket, reqId)
+
+
+async def _process_inline_request(websocket, reqId, inputData):
+    try:
+        isOk, error, output = await _on_inline_request(inputData, reqId)
+    except:
+        _requests_total.inc("error")
+        await _send_error_message(websocket, reqId, "Unhandle exception during processing")
+        return
+
+    if (request_cancelled()):
+        _requests_total.inc("cancelled")
+        await _send_cancelled_message(websocket, reqId)
+        return
+
+    if (not isOk):
+        _requests_total.inc("error")
+        await _send_error_message(websocket, reqId, error)
+        return
+
+    _requests_total.inc("complete")
+    await _send_finished_inline_message(websocket, reqId, output)
+
+
+# When serving concurrently, accepted requests are queued here and picked up by
+# _concurrency workers, so replies are sent in completion order rather than arrival order.
+# The queue is ordered by priority (highest first), then earliest deadline, then arrival.
+_request_queue = None
+_request_sequence = 0
+_request_workers = []
+
+
+class _Request:
+    '''
+    A request from the moment it is answered "pending" until its final reply. cancelled is a threading.Event so
+    handlers running in a thread pool can check it. Higher priorities are scheduled first, and deadline is the
+    absolute time (seconds since the epoch) after which the request is no longer worth running.
+    '''
+
+    def __init__(self, websocket, reqId, priority=0, deadline=None):
+        self.websocket = websocket
+        self.reqId = reqId
+        self.priority = priority
+        self.deadline = deadline
+        self.accepted = time.perf_counter()
+        self.started = False
+        self.released = False
+        self.cancelled = threading.Event()
+
+    def deadlinePassed(self):
+        return self.deadline is not None and time.time() > self.deadline
+
+
+# Requests in flight, and how many of them each connection has, for the --max-in-flight limits
+_active_requests = set()
+_connection_requests = {}
+_current_request = contextvars.ContextVar("gravityai_request", default=None)
+
+
+def request_cancelled():
+    '''
+    Returns True if the client cancelled the request being handled. Long running handlers may check this now and then
+    and stop early, since the reply to a cancelled request is "cancelled" whatever the handler returns. Handlers
+    running in a process pool cannot see cancellations.
+    '''
+    request = _current_request.get()
+    return request is not None and request.cancelled.is_set()
+
+
+def _is_number(value):
+    # json.loads accepts NaN and Infinity, which would break the queue order and never expire
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+async def _accept_request(websocket, reqId, data):
+    '''
+    Registers a new request and answers "pending", or answers "busy" (which the client may retry later) when the
+    server or this connection already has its limit of requests in flight, or "deadline_exceeded" when its deadline
+    has already passed. Returns the request, or None when it was not accepted.
+    '''
+    priority = data.get('priority', 0)
+    deadline = data.get('deadline')
+    if (not _is_number(priority)):
+        await _send_error_message(websocket, reqId, "Request priority is not a number")
+        return None
+    if (deadline is not None and not _is_number(deadline)):
+        await _send_error_message(websocket, reqId, "Request deadline is not a number of seconds since the epoch")
+        return None
+    if (deadline is not None and time.time() > deadline):
+        _requests_total.inc("deadline_exceeded")
+        await _send_deadline_exceeded_message(websocket, reqId)
+        return None
+
+    count = _connection_requests.get(websocket, 0)
+    if (_draining):
+        _requests_total.inc("busy")
+        await _send_busy_message(websocket, reqId, "Server is shutting down")
+        return None
+    if (_max_in_flight is not None and len(_active_requests) >= _max_in_flight):
+        _requests_total.inc("busy")
+        await _send_busy_message(websocket, reqId, f"Server is busy with {len(_active_requests)} requests")
+        return None
+    if (_max_in_flight_per_connection is not None and count >= _max_in_flight_per_connection):
+        _requests_total.inc("busy")
+        await _send_busy_message(websocket, reqId, f"Connection is busy with {count} requests")
+        return None
+
+    request = _Request(websocket, reqId, priority, deadline)
+    _active_requests.add(request)
+    _connection_requests[websocket] = count + 1
+    _update_idle_state()
+    await _send_accepted_message(websocket, reqId)
+    return request
+
+
+def _release_request(request):
+    if (request.released):
+        return
+    request.released = True
+    _active_requests.discard(request)
+    count = _connection_requests.get(request.websocket, 0) - 1
+    if (count > 0):
+        _connection_requests[request.websocket] = count
+    else:
+        _connection_requests.pop(request.websocket, None)
+    _request_seconds.observe(time.perf_counter() - request.accepted)
+    _update_idle_state()
+
+
+async def _on_cancel_message(websocket, data, message):
+    '''
+    Cancels the requests of this connection with the given requestId. Queued requests are dropped and answered
+    "cancelled" right away; running requests are flagged (see request_cancelled) and answered when they return.
+    '''
+    if (not _is_dictionary_string_valid(data, 'requestId')):
+        await _send_error_bad_message(websocket, "Cancel does not contain a valid requestId", message)
+        return
+
+    reqId = data['requestId']
+    if (_request_queue is None):
+        # without a request queue the connection is not read again until its request has finished
+        await _send_error_message(websocket, reqId, "Cancelling requests needs concurrency")
+        return
+    matches = [r for r in _active_requests if r.websocket is websocket and r.reqId == reqId]
+    if (not matches):
+        await _send_error_message(websocket, reqId, "No request in flight with this requestId")
+        return
+    for request in matches:
+        _log(logs.DEBUG, "Cancelling request %s (%s)", reqId, "running" if request.started else "queued")
+        request.cancelled.set()
+        if (not request.started):
+            _release_request(request)
+            _requests_total.inc("cancelled")
+            await _send_cancelled_message(websocket, reqId)
+
+
+def _cancel_connection_requests(websocket):
+    # nobody is left to read the replies of a closed connection, so its queued requests are dropped
+    for request in [r for r in _active_requests if r.websocket is websocket]:
+        request.cancelled.set()
+        if (not request.started):
+            _release_request(request)
+
+
+async def _complete_request(request, process):
+    # recorded here so requests handled without a request queue are counted too (with their wait of about zero)
+    _queue_seconds.observe(time.perf_counter() - request.accepted)
+    if (request.deadlinePassed()):
+        _log(logs.DEBUG, "Deadline exceeded for request %s", request.reqId)
+        _release_request(request)
+        _requests_total.inc("deadline_exceeded")
+        await _send_deadline_exceeded_message(request.websocket, request.reqId)
+        return
+    request.started = True
+    token = _current_request.set(request)
+    try:
+        await process()
+    finally:
+        _current_request.reset(token)
+        _release_request(request)
+
+
+async def _request_worker():
+    while(True):
+        _, request, process = await _request_queue.get()
+        try:
+            if (request.cancelled.is_set()):
+                continue
+            await _complete_request(request, process)
+        except Exception as e:
+            _print_gravity_message(
+                f"Exception while completing request {request.reqId}: {e}")
+        finally:
+            _request_queue.task_done()
+
+
+def _create_executor(handlers):
+    global _executor
+    if (not asyncio.iscoroutinefunction(_request_handler)):
+        if (_pool_type == "process"):
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=handlers)
+        else:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=handlers, thread_name_prefix="gravityai")
+
+
+def _start_request_workers(loop):
+    global _request_queue
+    global _request_workers
+    global _batch_queue
+    global _batch_dispatchers
+    if (_concurrency is None and not _is_batching()):
+        return
+
+    # When batching, _concurrency is the number of batches that may run at once, and enough
+    # requests are taken off the request queue to fill each of them.
+    handlers = _concurrency or 1
+    workers = handlers * _max_batch_size if _is_batching() else handlers
+    _create_executor(handlers)
+
+    _request_queue = asyncio.PriorityQueue()
+    _request_workers = [loop.create_task(_request_worker())
+                        for _ in range(workers)]
+    if (_is_batching()):
+        _batch_queue = asyncio.Queue()
+        _batch_dispatchers = [loop.create_task(_batch_dispatcher())
+                              for _ in range(handlers)]
+        _log(logs.INFO, "Serving batches of up to %d requests, %d at once (%s pool)",
+             _max_batch_size, handlers, _pool_type)
+    else:
+        _log(logs.INFO, "Serving up to %d requests at once (%s pool)", handlers, _pool_type)
+
+
+async def _dispatch_request(request, process):
+    global _request_sequence
+    if (_request_queue is None):
+        await _complete_request(request, process)
+    else:
+        _request_sequence += 1
+        deadline = request.deadline if request.deadline is not None else float("inf")
+        await _request_queue.put(((-request.priority, deadline, _request_sequence), request, process))
+
+
+def _header_text(header):
+    # only decoded for the debug log and error replies, which quote the start of the header
+    return header[:1024].decode("utf-8", "replace")
+
+
+async def _on_inline_message(websocket, message):
+    '''
+    An inline request is a binary frame holding a json header line with the requestId, followed by
+    the input bytes. The result comes back as a binary frame in the same layout, with the "complete"
+    status as the header.
+    '''
+    separator = message.find(b"\n")
+    header = message if separator < 0 else message[:separator]
+    if (_logger is not None and _logger.enabled(logs.DEBUG)):
+        _log(logs.DEBUG, "Inline Message Received (%d bytes)", len(message), header=_header_text(header))
+    if (separator < 0):
+        await _send_error_bad_message(websocket, "Invalid Request: binary frame has no json header line", _header_text(header))
+        return
+
+    isOk, data = _tryParseJsonRequest(header)
+    if (not isOk):
+        await _send_error_bad_message(websocket, "Invalid Request: Json parse error", _header_text(header))
+        return
+
+    if (not isinstance(data, dict)):
+        await _send_error_bad_message(websocket, "Invalid Request: root json object is not a dictionary", _header_text(header))
+        return
+
+    if (not _is_dictionary_string_valid(data, 'requestId')):
+        await _send_error_bad_message(websocket, "Request does not contain a valid requestId", _header_text(header))
+        return
+
+    reqId = data['requestId']
+    request = await _accept_request(websocket, reqId, data)
+    if (request is None):
+        return
+    await _dispatch_request(request, functools.partial(
+        _process_inline_request, websocket, reqId, memoryview(message)[separator + 1:]))
 
 
 async def _wsHandler(websocket, path):
     global _connections
     _print_gravity_message("Websocket Connection")
     _connections.add(websocket)
+    _update_idle_state()
     asyncio.ensure_future(_remove_when_closed(websocket))
     try:
         async for message in websocket:
+            if (isinstance(message, bytes)):
+                await _on_inline_message(websocket, message)
+                continue
+
             isOk, data = _tryParseJsonRequest(message)
-            _print_debug_message(f"Message Received: {message}")
+            _log(logs.DEBUG, "Message Received", payload=message)
             if (not isOk):
                 await _send_error_bad_message(websocket, "Invalid Request: Json parse error", message)
                 continue
@@ -301,6 +1232,14 @@ async def _wsHandler(websocket, path):
                 await _send_error_bad_message(websocket, "Invalid Request: root json object is not a dictionary", message)
                 continue
 
+            if (data.get('type') == 'stats'):
+                await _send_stats_message(websocket, data)
+                continue
+
+            if (data.get('type') == 'cancel'):
+                await _on_cancel_message(websocket, data, message)
+                continue
+
             if (not _is_dictionary_string_valid(data, 'requestId')):
                 await _send_error_bad_message(websocket, "Request does not contain a valid requestId", message)
                 continue
@@ -314,54 +1253,171 @@ async def _wsHandler(websocket, path):
                 await _send_error_message(websocket, reqId, "Request does not contain outputFile")
                 continue
 
-            await _send_accepted_message(websocket, reqId)
-
-            try:
-                isOk, error = await _on_request(data['inputFile'], data['outputFile'])
-            except:
-                await _send_error_message(websocket, reqId, "Unhandle exception during processing")
-                continue
-
-            if (not isOk):
-                await _send_error_message(websocket, reqId, error)
+            request = await _accept_request(websocket, reqId, data)
+            if (request is None):
                 continue
-
-            await _send_finished_message(websocket, reqId)
+            await _dispatch_request(request, functools.partial(
+                _process_request, websocket, reqId, data['inputFile'], data['outputFile']))
     except Exception as e:
         _print_gravity_message(f"Exception in Websocket: {e}")
     finally:
         _print_gravity_message("Websocket Disconnected")
         if(websocket in _connections):
             _connections.remove(websocket)
+        _cancel_connection_requests(websocket)
+        _update_idle_state()
 
 
-async def _idle_timer():
-    global _is_gai
-    global _connections
-    if (not _is_gai):
+# In multi-worker mode each worker records in its slot of this shared array when it last became idle (infinity
+# while it is busy), and the supervisor makes the idle timeout decision for all of them.
+_worker_index = None
+_worker_activity = None
+_idle_handle = None
+_draining = False
+_drained = None
+_servers = []
+_exit_code = 0
+
+
+def _idle_timeout_seconds():
+    timeout = _idle_timeout
+    if (timeout is None):
+        timeout = 30 if _is_gai else 0
+    return timeout or None
+
+
+def _update_idle_state():
+    '''
+    Called whenever a connection opens or closes and whenever a request is accepted or released. The idle timeout
+    starts once the server has neither connections nor requests in flight (a request still running for a closed
+    connection keeps it busy), and is cancelled as soon as one arrives.
+    '''
+    global _idle_handle
+    if (not _active_requests and _drained is not None and not _drained.done()):
+        _drained.set_result(None)
+    timeout = _idle_timeout_seconds()
+    if (timeout is None or _draining):
+        return
+    idle = not _connections and not _active_requests
+    if (_worker_activity is not None):
+        _worker_activity[_worker_index] = time.time() if idle else float("inf")
         return
+    if (not idle):
+        if (_idle_handle is not None):
+            _idle_handle.cancel()
+            _idle_handle = None
+    elif (_idle_handle is None):
+        _idle_handle = asyncio.get_event_loop().call_later(timeout, _on_idle_timeout)
 
-    idle_count = 0
-    _print_gravity_message("Idle Timer: started")
-    while(True):
-        await asyncio.sleep(5)
-        idle_count += 1
-
-        if (_connections):
-            count = sum(1 for c in _connections if c.open)
-            if (count > 0):
-                idle_count = 0
-                _print_debug_message(
-                    f"Idle Timer: Server has open connections: {count}")
-                continue
 
-        _print_debug_message("Idle Timer: tick " + str(idle_count))
+def _start_idle_tracking(loop):
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, _on_shutdown_signal)
+        except (NotImplementedError, RuntimeError):
+            # not supported by the windows event loops
+            pass
+    if (_idle_timeout_seconds() is not None):
+        _print_gravity_message("Idle Timer: started")
+        _update_idle_state()
 
-        if (idle_count >= 6):  # 30 seconds or so.
-            _print_debug_message("Idle Timer: Timeout ")
-            sys.stderr.write(
-                "Idle Timeout")
-            sys.exit(2)
+
+def _on_idle_timeout():
+    _log(logs.INFO, "Idle Timer: Timeout")
+    sys.stderr.write(
+        "Idle Timeout")
+    _begin_drain(2)
+
+
+def _on_shutdown_signal():
+    if (_draining):
+        # a second signal does not wait for the requests in flight
+        sys.exit(2)
+    _begin_drain(0)
+
+
+def _begin_drain(code):
+    global _draining
+    if (_draining):
+        return
+    _draining = True
+    asyncio.ensure_future(_drain(code))
+
+
+async def _drain(code):
+    '''
+    Stops listening for connections and answers "busy" to new requests on the open ones, waits up to --drain-timeout
+    seconds for the requests in flight to finish, then closes the connections and stops the loop, which exits with code.
+    If requests are still running after the timeout, it exits right away without waiting for their handlers.
+    '''
+    global _drained
+    global _exit_code
+    _log(logs.INFO, "Draining with %d requests in flight", len(_active_requests))
+    for server in _servers:
+        server.server.close()
+    timed_out = False
+    if (_active_requests):
+        _drained = asyncio.get_event_loop().create_future()
+        try:
+            await asyncio.wait_for(_drained, _drain_timeout)
+        except asyncio.TimeoutError:
+            _log(logs.WARNING, "Drain timeout with %d requests in flight", len(_active_requests))
+            timed_out = True
+    for server in _servers:
+        server.close()
+    await asyncio.gather(*[server.wait_closed() for server in _servers], return_exceptions=True)
+    if (timed_out):
+        _exit_abandoning_requests(code)
+    _exit_code = code
+    asyncio.get_event_loop().stop()
+
+
+def _exit_abandoning_requests(code):
+    '''
+    Exits with code without waiting for the handlers still running, which a normal exit would do for the threads of
+    the request pool (or the default executor) and the processes of a --pool process.
+    '''
+    if (isinstance(_executor, concurrent.futures.ProcessPoolExecutor)):
+        for process in list((_executor._processes or {}).values()):
+            process.kill()
+    if (_executor is not None):
+        _executor.shutdown(wait=False, cancel_futures=True)
+    if (_unix_socket is not None and _worker_index is None):
+        # in multi-worker mode the supervisor removes it
+        _remove_unix_socket()
+    if (_logger is not None):
+        _logger.close()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
+
+
+def _warm_up(inputFiles):
+    '''
+    Runs the handler on each warm-up input in this process, before any pool or worker process is started (so forked
+    ones inherit what it initialized), writing the outputs to a temporary folder. Exits if one of them fails.
+    '''
+    if (isinstance(inputFiles, (str, os.PathLike))):
+        inputFiles = [inputFiles]
+    started = time.perf_counter()
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory(prefix="gravityai-warmup-") as folder:
+        for i, inputFile in enumerate(inputFiles):
+            outputFile = os.path.join(folder, f"output-{i}")
+            try:
+                if (not Path(inputFile).is_file()):
+                    err = "Input file not found"
+                elif (_is_batching()):
+                    err = loop.run_until_complete(_call_batch_handler([inputFile], [outputFile]))[0]
+                else:
+                    err = loop.run_until_complete(_call_handler(inputFile, outputFile))
+            except Exception as e:
+                err = "Exception generated during processing: " + str(e)
+            if (err):
+                sys.stderr.write(f"Warm-up failed for {inputFile}: {err}")
+                _print_gravity_message("Warm-up failed")
+                sys.exit(2)
+    _log(logs.INFO, "Warmed up with %d inputs in %.3fs", len(inputFiles), time.perf_counter() - started)
 
 
 def handle_loop_exception(loop, context):
@@ -372,10 +1428,272 @@ def handle_loop_exception(loop, context):
     sys.exit(2)
 
 
-def wait_for_requests(handler):
+def _remove_unix_socket():
+    try:
+        if (stat.S_ISSOCK(os.stat(_unix_socket).st_mode)):
+            os.remove(_unix_socket)
+    except OSError:
+        pass
+
+
+def _bind_server_socket():
+    if (_unix_socket is not None):
+        # a socket file left behind by an earlier server would make bind fail
+        _remove_unix_socket()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(_unix_socket)
+    else:
+        family = socket.getaddrinfo(_host, _port, type=socket.SOCK_STREAM)[0][0]
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((_host, _port))
+    sock.listen(socket.SOMAXCONN)
+    sock.setblocking(False)
+    return sock
+
+
+def _start_websocket_server(loop, sock=None):
+    '''
+    Starts serving websockets on sock (bound by the supervisor), or else on the --unix-socket path or --host and --port,
+    with the --compression, --max-size and --ping-interval settings.
+    '''
+    import websockets
+    options = {
+        "compression": None if _compression == "none" else _compression,
+        "max_size": _max_size or None,
+        "ping_interval": _ping_interval or None,
+    }
+    if (sock is not None):
+        serve = websockets.serve(_wsHandler, sock=sock, **options)
+    elif (_unix_socket is not None):
+        serve = websockets.unix_serve(_wsHandler, _unix_socket, **options)
+    else:
+        serve = websockets.serve(_wsHandler, _host, _port, **options)
+    _servers.append(loop.run_until_complete(serve))
+
+
+def _run_worker(index, sock):
+    global _worker_index
+    _worker_index = index
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    _servers.clear()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.set_exception_handler(handle_loop_exception)
+    _start_request_workers(loop)
+    _start_websocket_server(loop, sock)
+    if (_metrics_port is not None):
+        # each worker has its own metrics, served on consecutive ports
+        loop.run_until_complete(metrics.serve_http(_metrics, _host, _metrics_port + index))
+    _log(logs.INFO, "Worker %d running as pid %d", index, os.getpid())
+    _start_idle_tracking(loop)
+    loop.run_forever()
+    sys.exit(_exit_code)
+
+
+# A crashed worker is restarted after a delay that doubles with each recent crash, and the supervisor exits once a
+# worker has crashed more than _MAX_WORKER_RESTARTS times in _WORKER_RESTART_WINDOW seconds, so a worker that cannot
+# start does not make it fork forever.
+_MAX_WORKER_RESTARTS = 5
+_WORKER_RESTART_WINDOW = 60.0
+_WORKER_RESTART_DELAY = 0.1
+_WORKER_RESTART_MAX_DELAY = 10.0
+
+
+def _wait_child():
+    try:
+        return os.waitpid(-1, os.WNOHANG)
+    except ChildProcessError:
+        return 0, 0
+
+
+def _fork_worker(index, sock):
+    pid = os.fork()
+    if (pid != 0):
+        return pid
+
+    code = 2
+    try:
+        _run_worker(index, sock)
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 2
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        if (_logger is not None):
+            _logger.close()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def _stop_workers(children):
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    # workers drain their requests in flight before exiting
+    deadline = time.time() + _drain_timeout + 5
+    while(children and time.time() < deadline):
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if (pid == 0):
+            time.sleep(0.1)
+            continue
+        children.pop(pid, None)
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def _supervise_workers():
+    '''
+    Pre-fork _workers processes that share one listening socket, so a model loaded before wait_for_requests is
+    shared copy-on-write. Crashed workers are restarted, and the server exits once every worker has been without
+    connections or requests in flight for the idle timeout, or with status 2 when a worker keeps crashing.
+    '''
+    global _worker_activity
+    try:
+        sock = _bind_server_socket()
+    except Exception as e:
+        sys.stderr.write("Failed to start server: " + str(e))
+        _print_gravity_message("Bad Port")
+        sys.exit(2)
+
+    started = time.time()
+    _worker_activity = multiprocessing.Array('d', _workers, lock=False)
+    for i in range(_workers):
+        _worker_activity[i] = started
+    children = {_fork_worker(i, sock): i for i in range(_workers)}
+
+    def _on_stop_signal(signum, frame):
+        _stop_workers(children)
+        if (_unix_socket is not None):
+            _remove_unix_socket()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, _on_stop_signal)
+    signal.signal(signal.SIGINT, _on_stop_signal)
+    _print_gravity_message(
+        "Running on " + _server_location() + " with " + str(_workers) + " workers")
+
+    crashes = {i: [] for i in range(_workers)}
+    restarts = {}
+    while(True):
+        wait = min([1.0] + [due - time.time() for due in restarts.values()])
+        if (wait > 0):
+            time.sleep(wait)
+        pid, status = _wait_child()
+        while(pid != 0):
+            index = children.pop(pid, None)
+            if (index is not None):
+                now = time.time()
+                recent = [t for t in crashes[index] if now - t < _WORKER_RESTART_WINDOW] + [now]
+                crashes[index] = recent
+                if (len(recent) > _MAX_WORKER_RESTARTS):
+                    _print_gravity_message(
+                        f"Worker {index} exited with status {status} {len(recent)} times in {_WORKER_RESTART_WINDOW:.0f}s, stopping")
+                    _stop_workers(children)
+                    if (_unix_socket is not None):
+                        _remove_unix_socket()
+                    sys.stderr.write(
+                        "Worker keeps crashing")
+                    sys.exit(2)
+                delay = min(_WORKER_RESTART_DELAY * 2 ** (len(recent) - 1), _WORKER_RESTART_MAX_DELAY)
+                _print_gravity_message(
+                    f"Worker {index} exited with status {status}, restarting in {delay:.1f}s")
+                restarts[index] = now + delay
+            pid, status = _wait_child()
+
+        for index, due in list(restarts.items()):
+            if (due <= time.time()):
+                del restarts[index]
+                children[_fork_worker(index, sock)] = index
+
+        timeout = _idle_timeout_seconds()
+        if (timeout is not None and time.time() - max(_worker_activity) >= timeout):
+            _log(logs.INFO, "Idle Timer: Timeout")
+            _stop_workers(children)
+            if (_unix_socket is not None):
+                _remove_unix_socket()
+            sys.stderr.write(
+                "Idle Timeout")
+            sys.exit(2)
+
+
+def wait_for_requests(handler, concurrency=None, pool=None, inline_handler=None, result_cache_version=None,
+                      max_in_flight=None, max_in_flight_per_connection=None, warmup=None):
+    '''
+    Serve requests with handler(inputPath, outputPath). By default requests on a connection are handled one at a time,
+    and synchronous handlers block the event loop while they run. Pass concurrency (or --concurrency on the command line)
+    to handle up to that many requests at once: synchronous handlers are then sent to a bounded "thread" or "process"
+    pool, and each "complete" or "error" reply is sent as soon as its request finishes. A "process" pool pickles the
+    handler, so it must be a module level function and the script should guard wait_for_requests with
+    if __name__ == "__main__".
+
+    Clients may also send small inputs inline, as a binary frame instead of a file path. These are handled by
+    inline_handler(inputData, outputBuffer) when it is given: inputData is a memoryview of the input bytes (bytes in
+    a process pool) and the result is written to the io.BytesIO outputBuffer. Without an inline_handler, inline
+    inputs are written to a temporary file and passed to handler as usual.
+
+    With --result-cache DIR on the command line, outputs are kept in DIR (up to --result-cache-size megabytes, least
+    recently used first out) and a request whose input file has the same content as an earlier one gets a copy of the
+    earlier output without calling handler. Entries are also keyed by result_cache_version (by default the handler's
+    name), which should be changed whenever the model or handler changes its results.
+
+    max_in_flight and max_in_flight_per_connection (or --max-in-flight and --max-in-flight-per-connection) limit the
+    requests queued or running on the server and on each connection; requests over a limit are answered "busy" at once.
+    A {"type": "cancel", "requestId": ...} message drops that request if it is still queued, or makes
+    request_cancelled() return True for its handler if it is running. Cancelling and max_in_flight_per_connection need
+    concurrency (or batching), since otherwise a connection is not read while its request runs.
+
+    warmup is an input path, or a list of them, that handler is run on before the server starts listening, so the first
+    real request does not pay for lazy initialization; the outputs are discarded and the server exits if one fails.
+    With --idle-timeout (30 seconds by default with --gai) the server exits once it has had no connections and no
+    requests in flight for that long. On SIGTERM or SIGINT it stops accepting connections, answers "busy" to new
+    requests and waits up to --drain-timeout seconds for the requests in flight before exiting.
+
+    With --workers N each worker process keeps its own metrics: a {"type": "stats"} reply only covers the worker that
+    holds the connection (its index is in the "worker" field), and with --metrics-port P worker i serves its metrics on
+    port P + i. Scrape every worker's port and add them up for the whole server.
+
+    wait_for_requests returns at once in a process started by multiprocessing, which imports the script again.
+    '''
     global _request_handler
+    global _inline_handler
     global _port
+    global _concurrency
+    global _pool_type
+    if (_is_multiprocessing_child()):
+        return
     _request_handler = handler
+    _inline_handler = inline_handler
+    if (_result_cache_dir is not None and not _port is None):
+        _open_result_cache(result_cache_version, handler)
+    if (concurrency is not None):
+        _concurrency = concurrency
+    if (pool is not None):
+        _pool_type = pool
+    global _max_in_flight
+    global _max_in_flight_per_connection
+    if (max_in_flight is not None):
+        _max_in_flight = max_in_flight
+    if (max_in_flight_per_connection is not None):
+        _max_in_flight_per_connection = max_in_flight_per_connection
+    _check_in_flight_limits()
+    if (_max_in_flight_per_connection is not None and _concurrency is None and not _is_batching()):
+        sys.stderr.write(
+            "The per connection in flight limit needs concurrency. Without it a connection has one request in flight at a time.")
+        sys.exit(2)
+
+    if (_concurrency is not None and _concurrency < 1):
+        sys.stderr.write(
+            "Invalid concurrency specified. Please select at least 1 concurrent request.")
+        sys.exit(2)
 
     if (not _check_request_handler):
         sys.stderr.write(
@@ -383,44 +1701,224 @@ def wait_for_requests(handler):
         sys.exit(2)
         return
 
-    if (not _port is None):
+    if (not _port is None and warmup is not None):
+        _warm_up(warmup)
+
+    if (not _port is None and _workers > 1):
+        _print_gravity_message("Starting server")
+        _supervise_workers()
+
+    elif (not _port is None):
         _print_gravity_message("Starting server")
         loop = asyncio.get_event_loop()
         loop.set_exception_handler(handle_loop_exception)
+        _start_request_workers(loop)
         try:
-            loop.run_until_complete(websockets.serve(
-                _wsHandler, '127.0.0.1', _port))
+            _start_websocket_server(loop)
+            if (_metrics_port is not None):
+                loop.run_until_complete(metrics.serve_http(_metrics, _host, _metrics_port))
         except Exception as e:
             sys.stderr.write("Failed to start server: " + str(e))
             _print_gravity_message("Bad Port")
             sys.exit(2)
 
-        _print_gravity_message("Running on port " + str(_port))
+        _print_gravity_message("Running on " + _server_location())
 
-        loop.run_until_complete(_idle_timer())
+        _start_idle_tracking(loop)
         loop.run_forever()
+        if (_unix_socket is not None):
+            _remove_unix_socket()
+        sys.exit(_exit_code)
+
+    elif (_bulk_manifest is not None or _bulk_input_dir is not None):
+        summary = asyncio.get_event_loop().run_until_complete(_run_bulk())
+        if (summary["failed"]):
+            sys.exit(2)
 
     else:
         isOk, error = asyncio.get_event_loop().run_until_complete(
-            _on_request(getInputFile(), getOutputFile()))
+            _on_request(getInputFile(), getOutputFile(), "run"))
 
         if (not isOk):
             sys.stderr.write(error)
             sys.exit(2)
 
-def interpret_model(model, data, outPath, output_labels=None, feature_labels=None):
+def _bulk_items():
+    '''
+    Yields (input path, output path, name, error) for every item of --manifest or --input-dir. Relative paths in a
+    manifest are relative to the manifest's folder. error is None, except for a manifest row without an input or an
+    output, which is yielded with None paths so it is reported as a failed item.
+    '''
+    if (_bulk_manifest is not None):
+        base = os.path.dirname(os.path.abspath(_bulk_manifest))
+        with open(_bulk_manifest, "r", newline="") as file_object:
+            reader = csv.DictReader(file_object)
+            if (reader.fieldnames is None or "input" not in reader.fieldnames or "output" not in reader.fieldnames):
+                raise ValueError("The manifest needs a header row with \"input\" and \"output\" columns")
+            for row in reader:
+                if (not row["input"] or not row["output"]):
+                    yield None, None, f"manifest line {reader.line_num}", "The row has no input or no output"
+                    continue
+                yield os.path.join(base, row["input"]), os.path.join(base, row["output"]), row["input"], None
+        return
+
+    for root, dirs, files in os.walk(_bulk_input_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if (name.startswith(".")):
+                continue
+            inputPath = os.path.join(root, name)
+            relative = os.path.relpath(inputPath, _bulk_input_dir)
+            yield inputPath, os.path.join(_bulk_output_dir, relative), relative, None
+
+
+async def _run_bulk_item(inputPath, outputPath, name):
+    '''
+    Runs the handler on one item, writing to a temporary file next to outputPath that is renamed into place once the
+    handler succeeds, so an existing output is always complete.
+    '''
+    folder = os.path.dirname(os.path.abspath(outputPath))
+    os.makedirs(folder, exist_ok=True)
+    base, extension = os.path.splitext(os.path.basename(outputPath))
+    handle, tempPath = tempfile.mkstemp(dir=folder, prefix="." + base + ".", suffix=extension)
+    os.close(handle)
+    os.remove(tempPath)
+    try:
+        isOk, error = await _on_request(inputPath, tempPath, name)
+        if (isOk):
+            os.replace(tempPath, outputPath)
+        return isOk, error
+    finally:
+        if (os.path.exists(tempPath)):
+            os.remove(tempPath)
+
+
+async def _run_bulk():
+    '''
+    Runs the handler on every item of --manifest or --input-dir, --jobs at a time, skipping items whose output exists
+    (unless --overwrite), and prints a summary with the failed items at the end.
+    '''
+    if (_bulk_jobs > 1):
+        _create_executor(_bulk_jobs)
+    summary = {"succeeded": 0, "skipped": 0, "failed": []}
+    slots = asyncio.Semaphore(_bulk_jobs)
+    running = set()
+    started = time.time()
+
+    async def run_item(inputPath, outputPath, name):
+        try:
+            isOk, error = await _run_bulk_item(inputPath, outputPath, name)
+        except Exception as e:
+            isOk, error = False, "Exception generated during processing: " + str(e)
+        finally:
+            slots.release()
+        if (isOk):
+            summary["succeeded"] += 1
+        else:
+            _log(logs.WARNING, "Failed %s: %s", name, error)
+            summary["failed"].append((name, error))
+
+    try:
+        for inputPath, outputPath, name, error in _bulk_items():
+            if (error is not None):
+                _log(logs.WARNING, "Failed %s: %s", name, error)
+                summary["failed"].append((name, error))
+                continue
+            if (not _bulk_overwrite and os.path.exists(outputPath)):
+                summary["skipped"] += 1
+                continue
+            await slots.acquire()
+            task = asyncio.ensure_future(run_item(inputPath, outputPath, name))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    except (OSError, ValueError, csv.Error) as e:
+        summary["failed"].append(("manifest", str(e)))
+    if (running):
+        await asyncio.gather(*running)
+    if (_executor is not None):
+        _executor.shutdown()
+
+    print(f"Processed {summary['succeeded'] + len(summary['failed'])} items in {time.time() - started:.1f}s: "
+          f"{summary['succeeded']} succeeded, {len(summary['failed'])} failed, {summary['skipped']} skipped (output exists)")
+    for name, error in summary["failed"]:
+        sys.stderr.write(f"Failed {name}: {error}\n")
+    return summary
+
+
+def wait_for_batched_requests(handler, max_batch_size=64, max_wait_ms=10, concurrency=None, pool=None, result_cache_version=None,
+                              warmup=None):
+    '''
+    Serve requests like wait_for_requests, but group requests that arrive on any connection within max_wait_ms of
+    each other (up to max_batch_size of them) into one call of handler(inputPaths, outputPaths), where both arguments
+    are lists. The handler returns None if every request succeeded, an error string that applies to the whole batch,
+    or a list with an error string (or None) for each request. Each request still gets its own "complete" or "error"
+    reply. Synchronous handlers run in a pool so the server keeps collecting the next batch; concurrency sets how many
+    batches may run at once. Each warmup input is passed to handler as a batch of one.
+    '''
+    global _max_batch_size
+    global _max_batch_wait
+    if (max_batch_size is None or max_batch_size < 1):
+        sys.stderr.write(
+            "Invalid batch size specified. Please select a batch size of at least 1.")
+        sys.exit(2)
+    if (max_wait_ms is None or max_wait_ms < 0):
+        sys.stderr.write(
+            "Invalid batch wait specified. Please select a wait of at least 0 milliseconds.")
+        sys.exit(2)
+
+    _max_batch_size = max_batch_size
+    _max_batch_wait = max_wait_ms / 1000.0
+    wait_for_requests(handler, concurrency=concurrency, pool=pool, result_cache_version=result_cache_version,
+                      warmup=warmup)
+
+
+def interpret_model(model, data, outPath, output_labels=None, feature_labels=None, use_cache=True, model_type="general", **handler_kwargs):
     '''
     This function uses the classes in explainability_interface to return a bar plot through the SHAP library. To see descriptions for
     output_labels and feature_labels, refer to the README in explainability_interface. Note that this function must be called within 
     your request handler function, as this is not setup to be asynchronous. The intent behind this is to augment the output of your model with
     explainability. Output is returned as a json (see the example notebook in explainability_interface). If your script outputs
     to anything other than a json, you will need to modify this json to work with your output type.
+    The shap explainer built for a model is cached for the life of the process (see explainer_cache_stats), so
+    pass use_cache=False if the model object is modified in place between calls. With model_type="auto" tree models are
+    explained with shap.TreeExplainer, linear models with shap.LinearExplainer and other estimators or prediction
+    functions with shap.PermutationExplainer (max_evals bounds its cost), which are usually much faster than the default
+    shap.Explainer ("general"). Use model_type="neuralNetwork" for models that need shap.KernelExplainer; its
+    background_size, summarize and nsamples settings can be passed as keywords, as can chunk_size to compute shap values
+    a chunk of rows at a time, and n_jobs to split the rows across worker processes (kept for later calls unless
+    use_cache=False).
     '''
-    shapExplainer = explainer.SHAPExplainer(model, data, model_type="general")
-    explanationObject = shapExplainer.getExplanationObject()
+    from .explainability_interface import explainer
+    shapExplainer = explainer.SHAPExplainer(model, data, model_type=model_type, use_cache=use_cache, **handler_kwargs)
+    # in parallel mode each worker process builds its own explainer
+    explanationObject = None if shapExplainer.isParallel() else shapExplainer.getExplanationObject()
     return shapExplainer.getBarPlotJson(explanationObject, output_labels=output_labels, feature_labels=feature_labels)
 
-def handle_csvs_with_uris(filePath, outPath, handle_fnc, **kwargs):
+def explainer_cache_stats():
+    '''
+    Returns the hit, miss and eviction counts, the number of entries and the estimated bytes of the process wide
+    explainer cache used by interpret_model.
+    '''
+    from .explainability_interface import cache
+    return cache.EXPLAINER_CACHE.getStats()
+
+
+def _create_output_temp(folder):
+    '''
+    Creates an empty temporary file in folder and returns its path. Unlike mkstemp, which always makes the file owner-only,
+    the file gets the permissions of any newly created file (0666 less the umask), as it is renamed to the output later.
+    '''
+    while(True):
+        path = os.path.join(folder, ".gravityai-" + os.urandom(8).hex() + ".tmp")
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+            return path
+        except FileExistsError:
+            continue
+
+
+def handle_csvs_with_uris(filePath, outPath, handle_fnc, download_workers=8, download_timeout=60, download_retries=3, output_format="xlsx",
+                          cache_dir=None, cache_max_bytes=1024 * 1024 * 1024, cache_ttl=0, **kwargs):
     '''
     Function to handle multiple files. Pass in a filePath (csv) containing a column called "uri". This function will apply the wrapped function to each uri.
     Kwargs are passed to the handle_fnc, so design that function to work accordingly:
@@ -429,20 +1927,40 @@ def handle_csvs_with_uris(filePath, outPath, handle_fnc, **kwargs):
         Do stuff here
 
     This function will combine the output of handle_fnc for each file into a multi tabbed excel file (assumes the output is a pandas df). 
+    Up to download_workers uris are downloaded at once, ahead of handle_fnc, reusing connections to the same host. Each download is
+    retried download_retries times and times out after download_timeout seconds. file:// uris are read in place.
+
+    Each result is written to the output as soon as it is produced, through a private temporary file next to outPath that
+    is renamed to outPath at the end. output_format selects the output: "xlsx" (one sheet per row, written in openpyxl's
+    write-only mode), "parquet" or "feather" (one table with a "sheet" column, which needs pyarrow and results with the
+    same columns), or "csv_zip" (a zip with one csv per row).
+
+    With cache_dir, http(s) downloads are kept in a content addressed cache there (up to cache_max_bytes, least recently
+    used first out), so a uri already seen is only revalidated with the server (ETag / Last-Modified) and then hard linked
+    from the cache instead of downloaded again. Cached entries younger than cache_ttl seconds are used without revalidating.
+    Files handed to handle_fnc from the cache are read-only. Returns the download and cache counters.
     '''
+    import pandas as pd
+    from . import downloads
+    from . import outputs
     df = pd.read_csv(filePath)
-    
-    writer = pd.ExcelWriter("temp_out.xlsx")
-    for i, row in df.iterrows():
-        uri = row["uri"]
-        filename = wget.download(uri)
-        output_temp = handle_fnc(filename, row, **kwargs)
-        output_temp.to_excel(writer, sheet_name=f"Sheet_{i}")
-        os.remove(filename)
-    writer.save()
-    shutil.copyfile("temp_out.xlsx", outPath)
-    os.remove("temp_out.xlsx")
-
-
-
+    cache = downloads.get_cache(cache_dir, cache_max_bytes) if cache_dir else None
 
+    outPath = os.path.abspath(outPath)
+    tempPath = _create_output_temp(os.path.dirname(outPath))
+    try:
+        with outputs.open_output_writer(tempPath, output_format) as writer:
+            with downloads.Downloader(workers=download_workers, timeout=download_timeout, retries=download_retries,
+                                      cache=cache, cache_ttl=cache_ttl) as downloader:
+                for (i, row), filename, is_temporary in downloader.prefetch(df.iterrows(), lambda item: item[1]["uri"]):
+                    output_temp = handle_fnc(filename, row, **kwargs)
+                    writer.write(i, output_temp)
+                    if (is_temporary):
+                        os.remove(filename)
+        os.replace(tempPath, outPath)
+    finally:
+        if (os.path.exists(tempPath)):
+            os.remove(tempPath)
+    stats = downloader.stats()
+    _log(logs.INFO, "Downloads", **stats)
+    return stats
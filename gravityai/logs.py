@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+_LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+_STOP = object()
+
+
+def _truncate(value, limit):
+    if (isinstance(value, (bytes, bytearray, memoryview))):
+        return f"<{len(value)} bytes>"
+    if (not isinstance(value, str)):
+        return value
+    if (len(value) <= limit):
+        return value
+    return value[:limit] + f"... ({len(value)} chars)"
+
+
+class AsyncLogger:
+    '''
+    Writes log records as json lines to path from a background thread. log() only puts the record on a queue, and
+    the message is formatted (message % args) by the writer, so logging does no file i/o on the caller's thread and a
+    disabled level costs one comparison. The writer collects whatever records are queued (up to max_batch) and
+    writes them with a single append, at least every flush_interval seconds. Strings longer than max_field characters
+    are truncated and bytes are replaced by their length.
+
+    A forked child gets a new writer thread the first time it logs, and appends to the same file.
+    '''
+
+    def __init__(self, path, level=DEBUG, max_field=1024, flush_interval=0.5, max_batch=1024):
+        self.path = path
+        self.level = level
+        self.max_field = max_field
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        atexit.register(self.close)
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, message, *args, **fields):
+        if (level < self.level):
+            return
+        if (self._pid != os.getpid()):
+            self._start()
+        self._queue.put((time.time(), level, message, args, fields))
+
+    def _start(self):
+        with self._lock:
+            if (self._pid == os.getpid()):
+                return
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._write_loop, args=(self._queue,),
+                                            name="gravityai-log", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _format(self, record):
+        created, level, message, args, fields = record
+        if (args):
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                message = " ".join([str(message)] + [str(a) for a in args])
+        line = {
+            "time": datetime.fromtimestamp(created).isoformat(timespec="milliseconds"),
+            "level": _LEVEL_NAMES.get(level, str(level)),
+            "pid": os.getpid(),
+            "message": _truncate(str(message), self.max_field),
+        }
+        for name, value in fields.items():
+            line[name] = _truncate(value, self.max_field)
+        return json.dumps(line, default=str) + "\n"
+
+    def _write_loop(self, records):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            stopping = False
+            while(not stopping):
+                try:
+                    batch = [records.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    continue
+                while(len(batch) < self.max_batch):
+                    try:
+                        batch.append(records.get_nowait())
+                    except queue.Empty:
+                        break
+                lines = []
+                for record in batch:
+                    if (record is _STOP):
+                        stopping = True
+                        continue
+                    try:
+                        lines.append(self._format(record))
+                    except Exception as e:
+                        lines.append(json.dumps({"level": "error", "message": f"Unable to format log record: {e}"}) + "\n")
+                if (lines):
+                    # one write per batch, so batches from several processes do not interleave within a line
+                    os.write(fd, "".join(lines).encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def close(self):
+        '''
+        Writes out the queued records and stops the writer thread of this process.
+        '''
+        with self._lock:
+            if (self._pid != os.getpid() or self._thread is None):
+                return
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._pid = None
+            self._thread = None
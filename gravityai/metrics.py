@@ -0,0 +1,175 @@
+import time
+import bisect
+import asyncio
+
+
+def _exponential_buckets(start, end, factor):
+    bounds = []
+    bound = start
+    while(bound < end):
+        bounds.append(round(bound, 6))
+        bound *= factor
+    bounds.append(end)
+    return bounds
+
+
+# 0.1 ms to 5 minutes, each bucket 25% wider than the previous one
+DEFAULT_BUCKETS = _exponential_buckets(0.0001, 300.0, 1.25)
+
+
+class Histogram:
+    '''
+    Counts observed values (in seconds) in fixed exponential buckets. Quantiles are estimated from the buckets the
+    same way Prometheus' histogram_quantile does, so they are within one bucket width (25%) of the true value. Like the
+    rest of the server's metrics, it is only updated from the event loop and needs no lock.
+    '''
+
+    def __init__(self, name, help, buckets=None):
+        self.name = name
+        self.help = help
+        self.bounds = list(buckets or DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        if (self.count == 0):
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if (cumulative + count >= rank and count > 0):
+                if (i == len(self.bounds)):
+                    return self.bounds[-1]
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.bounds[-1]
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+    def prometheus(self, prefix):
+        name = prefix + self.name
+        lines = [f"# HELP {name} {self.help}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class Counter:
+    '''
+    A count per value of one label (or a single count when label is None).
+    '''
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}
+
+    def inc(self, labelValue=None, amount=1):
+        self.values[labelValue] = self.values.get(labelValue, 0) + amount
+
+    def snapshot(self):
+        if (self.label is None):
+            return self.values.get(None, 0)
+        return dict(self.values)
+
+    def prometheus(self, prefix):
+        name = prefix + self.name
+        lines = [f"# HELP {name} {self.help}", f"# TYPE {name} counter"]
+        for labelValue, count in self.values.items():
+            labels = "" if self.label is None else f'{{{self.label}="{labelValue}"}}'
+            lines.append(f"{name}{labels} {count}")
+        return lines
+
+
+class Gauge:
+    '''
+    A value read from read() whenever the metrics are collected.
+    '''
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def snapshot(self):
+        return self.read()
+
+    def prometheus(self, prefix):
+        name = prefix + self.name
+        return [f"# HELP {name} {self.help}", f"# TYPE {name} gauge", f"{name} {self.read()}"]
+
+
+class Registry:
+    def __init__(self, prefix="gravityai_"):
+        self.prefix = prefix
+        self.started = time.time()
+        self._metrics = {}
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name, help, buckets=None):
+        return self._add(Histogram(name, help, buckets))
+
+    def counter(self, name, help, label=None):
+        return self._add(Counter(name, help, label))
+
+    def gauge(self, name, help, read):
+        return self._add(Gauge(name, help, read))
+
+    def snapshot(self):
+        stats = {"uptime": time.time() - self.started}
+        for name, metric in self._metrics.items():
+            stats[name] = metric.snapshot()
+        return stats
+
+    def prometheus(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.prometheus(self.prefix))
+        return "\n".join(lines) + "\n"
+
+
+async def serve_http(registry, host, port):
+    '''
+    Serves registry in the Prometheus text format on every path of a minimal http server on the running loop.
+    '''
+    async def on_connection(reader, writer):
+        try:
+            while(True):
+                line = await reader.readline()
+                if (line in (b"\r\n", b"\n", b"")):
+                    break
+            body = registry.prometheus().encode("utf-8")
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode("ascii") + b"\r\n"
+                         b"Connection: close\r\n\r\n" + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(on_connection, host, port)
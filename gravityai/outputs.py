@@ -0,0 +1,158 @@
+import abc
+import io
+import zipfile
+
+
+class OutputWriter(abc.ABC):
+    '''
+    Writes the pandas DataFrame produced for each manifest row to a single output file as soon as it is produced, so
+    memory use does not grow with the number of rows. write(index, df) stores one result under the name
+    "Sheet_<index>", and close() finishes the file.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    @abc.abstractmethod
+    def write(self, index, df):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _sheet_name(index):
+    return f"Sheet_{index}"
+
+
+def _excel_value(value):
+    # openpyxl writes numpy scalars but not NaN/NaT, which to_excel leaves as empty cells
+    try:
+        if (value != value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if (hasattr(value, "item") and type(value).__module__ == "numpy"):
+        return value.item()
+    return value
+
+
+class ExcelOutputWriter(OutputWriter):
+    '''
+    One sheet per result, written with openpyxl's write-only mode, which streams each sheet's rows to disk instead
+    of keeping the whole workbook in memory. Like DataFrame.to_excel, the first row holds the column names and the
+    first column the index.
+    '''
+
+    def __init__(self, path):
+        super().__init__(path)
+        from openpyxl import Workbook
+        self._workbook = Workbook(write_only=True)
+
+    def write(self, index, df):
+        sheet = self._workbook.create_sheet(_sheet_name(index))
+        sheet.append([df.index.name] + [str(c) for c in df.columns])
+        for row in df.itertuples(index=True, name=None):
+            sheet.append([_excel_value(v) for v in row])
+
+    def close(self):
+        if (self._workbook is not None):
+            if (not self._workbook.worksheets):
+                self._workbook.create_sheet(_sheet_name(0))
+            self._workbook.save(self.path)
+            self._workbook = None
+
+
+class _ArrowOutputWriter(OutputWriter):
+    '''
+    Appends every result to one table, with a "sheet" column naming the result it came from, followed by the index
+    (as DataFrame.reset_index names it) and the columns of the result. All results must have the same columns and
+    types. Without any results the file holds an empty table with just the "sheet" column.
+    '''
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._writer = None
+        self._closed = False
+
+    @abc.abstractmethod
+    def _open(self, schema):
+        pass
+
+    def _table(self, index, df):
+        import pyarrow as pa
+        df = df.reset_index()
+        df.insert(0, "sheet", _sheet_name(index))
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if (self._writer is not None and not table.schema.equals(self._schema, check_metadata=False)):
+            table = table.cast(self._schema)
+        return table
+
+    def write(self, index, df):
+        table = self._table(index, df)
+        if (self._writer is None):
+            self._schema = table.schema
+            self._writer = self._open(self._schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if (self._closed):
+            return
+        self._closed = True
+        if (self._writer is None):
+            import pyarrow as pa
+            self._writer = self._open(pa.schema([("sheet", pa.string())]))
+        self._writer.close()
+        self._writer = None
+
+
+class ParquetOutputWriter(_ArrowOutputWriter):
+    def _open(self, schema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self.path, schema)
+
+
+class FeatherOutputWriter(_ArrowOutputWriter):
+    def _open(self, schema):
+        import pyarrow as pa
+        return pa.ipc.new_file(self.path, schema)
+
+
+class CsvZipOutputWriter(OutputWriter):
+    '''
+    A zip file with one "Sheet_<index>.csv" entry per result, each streamed into the archive as it is written.
+    '''
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def write(self, index, df):
+        with self._zip.open(_sheet_name(index) + ".csv", "w", force_zip64=True) as entry:
+            with io.TextIOWrapper(entry, encoding="utf-8", newline="") as text:
+                df.to_csv(text)
+
+    def close(self):
+        if (self._zip is not None):
+            self._zip.close()
+            self._zip = None
+
+
+OUTPUT_WRITERS = {
+    "xlsx": ExcelOutputWriter,
+    "parquet": ParquetOutputWriter,
+    "feather": FeatherOutputWriter,
+    "csv_zip": CsvZipOutputWriter,
+}
+
+
+def open_output_writer(path, output_format="xlsx"):
+    if (output_format not in OUTPUT_WRITERS):
+        raise ValueError(f"Unknown output format {output_format}, expected one of {', '.join(OUTPUT_WRITERS)}")
+    return OUTPUT_WRITERS[output_format](path)
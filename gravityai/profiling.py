@@ -0,0 +1,105 @@
+import os
+import re
+import random
+import cProfile
+import threading
+import tracemalloc
+
+
+def _safe_name(reqId):
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", str(reqId))[:128].lstrip(".")
+    return name or "request"
+
+
+def run_profiled(call, basePath):
+    '''
+    Calls call() under cProfile and tracemalloc, and writes basePath + ".prof" (load it with pstats) and
+    basePath + ".tracemalloc" (load it with tracemalloc.Snapshot.load) even if call raises. This is a module level
+    function so it can be sent to a process pool along with the call.
+    '''
+    startedTracing = not tracemalloc.is_tracing()
+    if (startedTracing):
+        tracemalloc.start(10)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return call()
+    finally:
+        profiler.disable()
+        _write_profile(profiler, basePath, startedTracing)
+
+
+async def run_profiled_async(call, basePath):
+    '''
+    Like run_profiled for a coroutine function. The profile covers the event loop thread while call runs, so it also
+    includes anything else the loop did meanwhile.
+    '''
+    startedTracing = not tracemalloc.is_tracing()
+    if (startedTracing):
+        tracemalloc.start(10)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return await call()
+    finally:
+        profiler.disable()
+        _write_profile(profiler, basePath, startedTracing)
+
+
+def _write_profile(profiler, basePath, stopTracing):
+    snapshot = tracemalloc.take_snapshot()
+    if (stopTracing):
+        tracemalloc.stop()
+    profiler.dump_stats(basePath + ".prof")
+    snapshot.dump(basePath + ".tracemalloc")
+
+
+class Profiler:
+    '''
+    Picks the requests to profile: each request is sampled with probability rate, and only while no other request of
+    this process is being profiled, since tracemalloc is process wide and the profilers would slow each other down.
+    Files are named by requestId in folder, and only the keep most recent profiles are kept.
+    '''
+
+    def __init__(self, folder, rate=1.0, keep=100):
+        self.folder = os.path.abspath(folder)
+        self.rate = rate
+        self.keep = keep
+        os.makedirs(self.folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._busy = False
+
+    def start(self, reqId):
+        '''
+        Returns the base path for the profile files of reqId if it should be profiled, otherwise None. Every request
+        that gets a path must call finish() afterwards.
+        '''
+        with self._lock:
+            if (self._busy or random.random() >= self.rate):
+                return None
+            self._busy = True
+        return os.path.join(self.folder, _safe_name(reqId))
+
+    def finish(self):
+        try:
+            self._prune()
+        finally:
+            with self._lock:
+                self._busy = False
+
+    def _prune(self):
+        profiles = []
+        for name in os.listdir(self.folder):
+            if (name.endswith(".prof")):
+                path = os.path.join(self.folder, name)
+                try:
+                    profiles.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        profiles.sort()
+        for _, path in profiles[:max(0, len(profiles) - self.keep)]:
+            for extension in (".prof", ".tracemalloc"):
+                try:
+                    os.remove(path[:-len(".prof")] + extension)
+                except OSError:
+                    pass
@@ -0,0 +1,264 @@
+import re
+import json
+import codecs
+import itertools
+
+_CHUNK_CHARS = 1024 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_STRING_BODY = re.compile(r'(?:[^"\\\x00-\x1f]+|\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4}))*')
+_NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?")
+_STRING = re.compile(r'"(?:[^"\\\x00-\x1f]+|\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4}))*"')
+_NUMBER_CHARS = re.compile(r"[-+.eE0-9]*")
+_LITERALS = {"t": "true", "f": "false", "n": "null"}
+
+# parser states of validate_json_file
+_VALUE, _VALUE_OR_CLOSE, _KEY, _KEY_OR_CLOSE, _COLON, _COMMA_OR_CLOSE, _END = range(7)
+
+
+def batch_iter(iterable, n=1):
+    '''
+    Yields lists of n items (the last one may be shorter) from any iterable, including generators and file readers,
+    without needing its length.
+    '''
+    iterator = iter(iterable)
+    while(True):
+        chunk = list(itertools.islice(iterator, n))
+        if (not chunk):
+            return
+        yield chunk
+
+
+def read_csv_chunks(path, chunksize=10000, **kwargs):
+    '''
+    Yields the csv file at path as pandas DataFrames of up to chunksize rows, so only one chunk is in memory at a time.
+    kwargs are passed to pandas.read_csv.
+    '''
+    import pandas as pd
+    with pd.read_csv(path, chunksize=chunksize, **kwargs) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def read_json_lines(path, encoding="utf-8"):
+    '''
+    Yields the object on each line of a json lines file, skipping blank lines. Raises ValueError with the line number
+    for a line that is not valid json.
+    '''
+    with open(path, "r", encoding=encoding) as file_object:
+        for number, line in enumerate(file_object, 1):
+            if (not line.strip()):
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Invalid json on line {number} of {path}: {e}") from e
+
+
+class CSVChunkWriter:
+    '''
+    Appends pandas DataFrames to one csv file as they are produced; the header is written with the first one. kwargs
+    are passed to DataFrame.to_csv (index=False by default).
+    '''
+
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self.kwargs = dict({"index": False}, **kwargs)
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._header = True
+
+    def write(self, df):
+        df.to_csv(self._file, header=self._header, **self.kwargs)
+        self._header = False
+
+    def close(self):
+        if (self._file is not None):
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JSONLinesWriter:
+    '''
+    Writes one json object per line as they are produced.
+    '''
+
+    def __init__(self, path, encoding="utf-8"):
+        self.path = path
+        self._file = open(path, "w", encoding=encoding)
+
+    def write(self, obj):
+        self._file.write(json.dumps(obj))
+        self._file.write("\n")
+
+    def write_all(self, objects):
+        for obj in objects:
+            self.write(obj)
+
+    def close(self):
+        if (self._file is not None):
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _JSONValidator:
+    '''
+    Checks json text fed to it in pieces without building any objects, so memory use does not depend on the size of
+    the document (only on its nesting depth). Tokens split across pieces are carried over to the next piece, and
+    strings are scanned incrementally so even a very long one is never held in full.
+    '''
+
+    def __init__(self):
+        self.stack = []
+        self.state = _VALUE
+        self.inString = False
+        self.pending = ""
+        self.empty = False
+        self.valid = True
+
+    def _afterValue(self):
+        self.state = _COMMA_OR_CLOSE if self.stack else _END
+
+    def _scalar(self, falsy):
+        if (self.state in (_VALUE, _VALUE_OR_CLOSE)):
+            if (not self.stack):
+                self.empty = falsy
+            self._afterValue()
+            return True
+        return False
+
+    def _string(self, isEmpty):
+        if (self.state in (_KEY, _KEY_OR_CLOSE)):
+            self.state = _COLON
+            return True
+        return self._scalar(isEmpty)
+
+    def _punctuation(self, char):
+        state = self.state
+        if (char in "{["):
+            if (state not in (_VALUE, _VALUE_OR_CLOSE)):
+                return False
+            self.stack.append(char)
+            self.state = _KEY_OR_CLOSE if char == "{" else _VALUE_OR_CLOSE
+            return True
+        if (char in "}]"):
+            opener = "{" if char == "}" else "["
+            if (not self.stack or self.stack[-1] != opener):
+                return False
+            closesEmpty = state == (_KEY_OR_CLOSE if char == "}" else _VALUE_OR_CLOSE)
+            if (not closesEmpty and state != _COMMA_OR_CLOSE):
+                return False
+            self.stack.pop()
+            if (not self.stack):
+                self.empty = closesEmpty
+            self._afterValue()
+            return True
+        if (char == ","):
+            if (state != _COMMA_OR_CLOSE):
+                return False
+            self.state = _KEY if self.stack[-1] == "{" else _VALUE
+            return True
+        if (char == ":"):
+            if (state != _COLON):
+                return False
+            self.state = _VALUE
+            return True
+        return False
+
+    def feed(self, text, final=False):
+        text = self.pending + text
+        self.pending = ""
+        pos = 0
+        length = len(text)
+        while(self.valid and pos < length):
+            if (self.inString):
+                pos = _STRING_BODY.match(text, pos).end()
+                if (pos >= length or (text[pos] == "\\" and not final and length - pos < 6)):
+                    # a piece may end inside an escape sequence
+                    self.pending = text[pos:]
+                    return
+                if (text[pos] != '"'):
+                    self.valid = False
+                    return
+                pos += 1
+                self.inString = False
+                continue
+
+            char = text[pos]
+            if (char in " \t\n\r"):
+                pos = _WHITESPACE.match(text, pos).end()
+                if (pos >= length):
+                    return
+                char = text[pos]
+            if (char == '"'):
+                match = _STRING.match(text, pos)
+                if (match is not None):
+                    # the whole string is in this piece
+                    self.valid = self._string(match.end() == pos + 2)
+                    pos = match.end()
+                    continue
+                if (pos + 1 >= length and not final):
+                    self.pending = text[pos:]
+                    return
+                self.valid = self._string(text.startswith('"', pos + 1))
+                self.inString = True
+                pos += 1
+            elif (char == "-" or "0" <= char <= "9"):
+                if (_NUMBER_CHARS.match(text, pos).end() == length and not final):
+                    # the number may go on in the next piece
+                    self.pending = text[pos:]
+                    return
+                match = _NUMBER.match(text, pos)
+                if (match is None):
+                    self.valid = False
+                    return
+                self.valid = self._scalar(float(match.group()) == 0)
+                pos = match.end()
+            elif (char in _LITERALS):
+                literal = _LITERALS[char]
+                if (length - pos < len(literal) and not final):
+                    self.pending = text[pos:]
+                    return
+                self.valid = text.startswith(literal, pos) and self._scalar(literal != "true")
+                pos += len(literal)
+            else:
+                self.valid = self._punctuation(char)
+                pos += 1
+
+    def finish(self):
+        if (self.pending):
+            self.feed("", final=True)
+        return self.valid and not self.inString and not self.pending and self.state == _END
+
+
+def validate_json_file(path, allow_empty=False, chunk_chars=_CHUNK_CHARS):
+    '''
+    Returns True if the file at path holds a single valid (utf-8) json document, reading it in chunks so files larger
+    than memory can be checked. Unless allow_empty is set, a document that is empty or falsy ({}, [], "", 0, false,
+    null) counts as invalid, like the check done on json inputs by the run command.
+    '''
+    validator = _JSONValidator()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(path, "rb") as file_object:
+            for chunk in iter(lambda: file_object.read(chunk_chars), b""):
+                validator.feed(decoder.decode(chunk))
+                if (not validator.valid):
+                    return False
+            validator.feed(decoder.decode(b"", final=True))
+    except UnicodeDecodeError:
+        return False
+    if (not validator.finish()):
+        return False
+    return allow_empty or not validator.empty
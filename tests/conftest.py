@@ -0,0 +1,133 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if (REPO_ROOT not in sys.path):
+    sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture(scope="session")
+def gravityai():
+    '''
+    gravityai.gravityai parses the command line when imported from a terminal, so import it with a serve command line
+    and its banner hidden.
+    '''
+    argv = sys.argv
+    sys.argv = [argv[0], "serve", "-p", "49200"]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            from gravityai import gravityai
+    finally:
+        sys.argv = argv
+    return gravityai
+
+
+SERVING_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serving_model.py")
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _stop(process):
+    process.terminate()
+    try:
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def start_model(model, *args, env=None, port=None, timeout=30):
+    '''
+    Starts "python model args..." with the repository on the python path, and when port is given waits until it
+    accepts connections there. Returns the subprocess.Popen, with stderr piped.
+    '''
+    childEnv = dict(os.environ)
+    childEnv["PYTHONPATH"] = REPO_ROOT + os.pathsep + childEnv.get("PYTHONPATH", "")
+    childEnv.update(env or {})
+    process = subprocess.Popen([sys.executable, model] + [str(a) for a in args], cwd=REPO_ROOT, env=childEnv,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.time() + timeout
+    while(port is not None):
+        if (process.poll() is not None):
+            raise RuntimeError(f"Server exited with status {process.returncode}: {process.stderr.read().decode()}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if (time.time() > deadline):
+                _stop(process)
+                raise RuntimeError(f"Server did not start listening on port {port} within {timeout} seconds")
+            time.sleep(0.05)
+    return process
+
+
+@pytest.fixture
+def serve(tmp_path):
+    '''
+    Returns a function that serves tests/serving_model.py (or another model script) with the given serve arguments
+    and returns a Server for it. Servers still running at the end of the test are stopped.
+    '''
+    processes = []
+
+    def start(*serveArgs, model=SERVING_MODEL, env=None):
+        port = free_port()
+        process = start_model(model, "serve", "-p", port, *serveArgs, env=env, port=port)
+        processes.append(process)
+        return Server(port, process, tmp_path)
+    yield start
+    for process in processes:
+        if (process.poll() is None):
+            _stop(process)
+
+
+class Server:
+    '''
+    A model started by the serve fixture. request() writes data as the json input file of a new request and returns
+    the message to send for it; replies() reads messages until every given request has its final reply.
+    '''
+
+    def __init__(self, port, process, folder):
+        self.port = port
+        self.process = process
+        self.folder = folder
+
+    def connect(self):
+        import websockets
+        return websockets.connect(f"ws://127.0.0.1:{self.port}")
+
+    def request(self, reqId, data, **fields):
+        inputPath = self.folder / (reqId + ".json")
+        inputPath.write_text(json.dumps(data))
+        message = {"requestId": reqId, "inputFile": str(inputPath), "outputFile": str(self.output(reqId))}
+        message.update(fields)
+        return json.dumps(message)
+
+    def output(self, reqId):
+        return self.folder / (reqId + ".out.json")
+
+    async def replies(self, websocket, reqIds, timeout=10):
+        '''
+        Returns the final replies for reqIds (anything but "pending") in the order they arrived.
+        '''
+        waiting = set(reqIds)
+        replies = []
+        while(waiting):
+            reply = json.loads(await asyncio.wait_for(websocket.recv(), timeout))
+            if (reply.get("status") == "pending"):
+                continue
+            waiting.discard(reply.get("requestId"))
+            replies.append(reply)
+        return replies
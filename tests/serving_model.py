@@ -0,0 +1,59 @@
+'''
+A model for the serving tests. Each input file holds a json object: the handler sleeps "sleep" seconds (or, with
+"wait_for_cancel", until the request is cancelled), exits the process with status "exit", returns "error" when it
+is given, and otherwise copies the input to the output. With GRAVITYAI_TEST_CRASH_WORKERS set, every forked worker
+exits at once. With GRAVITYAI_TEST_BATCH set it is served with wait_for_batched_requests, and each output also holds
+the size of the batch it was handled in. With GRAVITYAI_TEST_INLINE set, inline requests are handled by
+inline_handler, which returns the input bytes upper cased (or an error for the input b"error"); otherwise they are
+spilled to a file for the handler. GRAVITYAI_TEST_WARMUP is the path of an input to warm up with.
+
+    python tests/serving_model.py serve -p 49200 --concurrency 2
+'''
+import json
+import os
+import time
+
+from gravityai import gravityai as grav
+
+
+def _handle(inputPath, outputPath, extra=None):
+    with open(inputPath) as file_object:
+        data = json.load(file_object)
+    time.sleep(data.get("sleep", 0))
+    if (data.get("exit") is not None):
+        os._exit(data["exit"])
+    if (data.get("wait_for_cancel")):
+        deadline = time.time() + 10
+        while(not grav.request_cancelled() and time.time() < deadline):
+            time.sleep(0.01)
+    if (data.get("error")):
+        return data["error"]
+    data.update(extra or {})
+    with open(outputPath, "w") as file_object:
+        json.dump(data, file_object)
+    return None
+
+
+def handler(inputPath, outputPath):
+    return _handle(inputPath, outputPath)
+
+
+def batch_handler(inputPaths, outputPaths):
+    return [_handle(i, o, {"batch": len(inputPaths)}) for i, o in zip(inputPaths, outputPaths)]
+
+
+def inline_handler(inputData, outputBuffer):
+    if (bytes(inputData) == b"error"):
+        return "bad input"
+    outputBuffer.write(bytes(inputData).upper())
+    return None
+
+
+if __name__ == "__main__":
+    if (os.environ.get("GRAVITYAI_TEST_CRASH_WORKERS")):
+        os.register_at_fork(after_in_child=lambda: os._exit(3))
+    if (os.environ.get("GRAVITYAI_TEST_BATCH")):
+        grav.wait_for_batched_requests(batch_handler, max_batch_size=8, max_wait_ms=200)
+    else:
+        grav.wait_for_requests(handler, inline_handler=inline_handler if os.environ.get("GRAVITYAI_TEST_INLINE") else None,
+                               warmup=os.environ.get("GRAVITYAI_TEST_WARMUP"))
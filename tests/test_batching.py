@@ -0,0 +1,52 @@
+import asyncio
+import json
+import os
+
+BATCH = {"GRAVITYAI_TEST_BATCH": "1"}
+
+
+def test_requests_are_batched_with_errors_per_request(serve):
+    server = serve(env=BATCH)
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("a", {}))
+            await websocket.send(server.request("b", {"error": "bad row"}))
+            await websocket.send(server.request("c", {}))
+            return await server.replies(websocket, ["a", "b", "c"])
+
+    replies = {r["requestId"]: r for r in asyncio.run(main())}
+    assert replies["a"]["status"] == "complete"
+    assert replies["c"]["status"] == "complete"
+    assert replies["b"]["status"] == "error"
+    assert "bad row" in replies["b"]["error"]
+    assert json.loads(server.output("a").read_text())["batch"] == 3
+
+
+def test_batches_from_several_connections(serve):
+    server = serve("--concurrency", "1", env=BATCH)
+
+    async def client(name):
+        async with server.connect() as websocket:
+            await websocket.send(server.request(name, {}))
+            return await server.replies(websocket, [name])
+
+    async def main():
+        return await asyncio.gather(client("x"), client("y"))
+
+    assert [r[0]["status"] for r in asyncio.run(main())] == ["complete", "complete"]
+    assert json.loads(server.output("x").read_text())["batch"] == 2
+
+
+def test_batches_are_profiled(serve, tmp_path):
+    folder = tmp_path / "profiles"
+    server = serve("--profile", str(folder), env=BATCH)
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("first", {}))
+            await websocket.send(server.request("second", {}))
+            return await server.replies(websocket, ["first", "second"])
+
+    asyncio.run(main())
+    assert sorted(os.listdir(folder)) == ["batch-first.prof", "batch-first.tracemalloc"]
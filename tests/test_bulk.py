@@ -0,0 +1,51 @@
+import json
+
+from conftest import SERVING_MODEL, start_model
+
+
+def _run(*args):
+    process = start_model(SERVING_MODEL, "run", *args)
+    _, stderr = process.communicate(timeout=60)
+    return process.returncode, stderr.decode()
+
+
+def test_manifest(tmp_path):
+    (tmp_path / "a.json").write_text(json.dumps({"name": "a"}))
+    (tmp_path / "b.json").write_text(json.dumps({"error": "bad input"}))
+    (tmp_path / "c.json").write_text(json.dumps({"name": "c"}))
+    (tmp_path / "done.json").write_text("{}")
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("input,output\n"
+                        "a.json,out/a.json\n"
+                        "b.json,out/b.json\n"
+                        "c.json\n"
+                        ",out/d.json\n"
+                        "c.json,done.json\n")
+
+    status, stderr = _run("--manifest", str(manifest), "--jobs", "2")
+    assert status == 2
+    assert json.loads((tmp_path / "out" / "a.json").read_text()) == {"name": "a"}
+    assert not (tmp_path / "out" / "b.json").exists()
+    assert (tmp_path / "done.json").read_text() == "{}"
+    assert "Failed b.json: Error returned during processing: bad input" in stderr
+    assert "Failed manifest line 4: The row has no input or no output" in stderr
+    assert "Failed manifest line 5: The row has no input or no output" in stderr
+    assert sorted(p.name for p in (tmp_path / "out").iterdir()) == ["a.json"]
+
+
+def test_input_dir_resumes(tmp_path):
+    inputs = tmp_path / "in"
+    (inputs / "nested").mkdir(parents=True)
+    (inputs / "one.json").write_text(json.dumps({"n": 1}))
+    (inputs / "nested" / "two.json").write_text(json.dumps({"n": 2}))
+    (inputs / ".hidden.json").write_text(json.dumps({"error": "read a hidden file"}))
+    outputs = tmp_path / "out"
+
+    assert _run("--input-dir", str(inputs), "--output-dir", str(outputs)) == (0, "")
+    assert json.loads((outputs / "nested" / "two.json").read_text()) == {"n": 2}
+
+    (outputs / "one.json").write_text("kept")
+    assert _run("--input-dir", str(inputs), "--output-dir", str(outputs)) == (0, "")
+    assert (outputs / "one.json").read_text() == "kept"
+    assert _run("--input-dir", str(inputs), "--output-dir", str(outputs), "--overwrite") == (0, "")
+    assert json.loads((outputs / "one.json").read_text()) == {"n": 1}
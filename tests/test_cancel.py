@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+
+def test_cancel_queued_and_running_requests(serve):
+    server = serve("--concurrency", "1")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("running", {"wait_for_cancel": True}))
+            await websocket.send(server.request("queued", {}))
+            await asyncio.sleep(0.2)
+            await websocket.send(json.dumps({"type": "cancel", "requestId": "queued"}))
+            first = await server.replies(websocket, ["queued"])
+            await websocket.send(json.dumps({"type": "cancel", "requestId": "running"}))
+            return first + await server.replies(websocket, ["running"])
+
+    replies = asyncio.run(main())
+    assert [(r["requestId"], r["status"]) for r in replies] == [("queued", "cancelled"), ("running", "cancelled")]
+    assert not server.output("queued").exists()
+
+
+def test_cancel_unknown_request(serve):
+    server = serve("--concurrency", "1")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(json.dumps({"type": "cancel", "requestId": "nothing"}))
+            return json.loads(await websocket.recv())
+
+    reply = asyncio.run(main())
+    assert reply["status"] == "error"
+    assert reply["requestId"] == "nothing"
+
+
+def test_cancel_needs_concurrency(serve):
+    server = serve()
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(json.dumps({"type": "cancel", "requestId": "abc"}))
+            return json.loads(await websocket.recv())
+
+    assert asyncio.run(main()) == {"status": "error", "error": "Cancelling requests needs concurrency",
+                                   "requestId": "abc"}
+
+
+def test_busy_over_the_limits(serve):
+    server = serve("--concurrency", "1", "--max-in-flight", "2", "--max-in-flight-per-connection", "1")
+
+    async def main():
+        async with server.connect() as first, server.connect() as second, server.connect() as third:
+            await first.send(server.request("a", {"sleep": 0.5}))
+            await first.send(server.request("b", {}))
+            await second.send(server.request("c", {}))
+            await third.send(server.request("d", {}))
+            replies = await server.replies(first, ["b"])
+            replies += await server.replies(third, ["d"])
+            replies += await server.replies(first, ["a"])
+            replies += await server.replies(second, ["c"])
+            return {r["requestId"]: r["status"] for r in replies}
+
+    assert asyncio.run(main()) == {"a": "complete", "b": "busy", "c": "complete", "d": "busy"}
+
+
+def test_per_connection_limit_needs_concurrency(tmp_path):
+    from conftest import SERVING_MODEL, start_model
+    process = start_model(SERVING_MODEL, "serve", "-p", "49200", "--max-in-flight-per-connection", "2")
+    assert process.wait(30) == 2
+    assert b"needs concurrency" in process.stderr.read()
@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+
+def test_replies_in_completion_order(serve):
+    server = serve("--concurrency", "2")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("slow", {"sleep": 0.5}))
+            await websocket.send(server.request("fast", {}))
+            return await server.replies(websocket, ["slow", "fast"])
+
+    replies = asyncio.run(main())
+    assert [(r["requestId"], r["status"]) for r in replies] == [("fast", "complete"), ("slow", "complete")]
+    assert json.loads(server.output("slow").read_text()) == {"sleep": 0.5}
+
+
+def test_default_mode_handles_one_request_at_a_time(serve):
+    server = serve()
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("slow", {"sleep": 0.3}))
+            await websocket.send(server.request("fast", {}))
+            return await server.replies(websocket, ["slow", "fast"])
+
+    replies = asyncio.run(main())
+    assert [r["requestId"] for r in replies] == ["slow", "fast"]
+
+
+def test_handler_errors_are_replied(serve):
+    server = serve("--concurrency", "2", "--pool", "process")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("bad", {"error": "no model"}))
+            await websocket.send(server.request("good", {}))
+            return await server.replies(websocket, ["bad", "good"])
+
+    replies = {r["requestId"]: r for r in asyncio.run(main())}
+    assert replies["bad"]["status"] == "error"
+    assert "no model" in replies["bad"]["error"]
+    assert replies["good"]["status"] == "complete"
@@ -0,0 +1,107 @@
+import os
+import stat
+
+from gravityai.diskcache import DiskCache
+
+
+def _file(folder, name, content):
+    path = folder / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_put_get_and_materialize(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    entry = cache.put("one", _file(tmp_path, "one.txt", b"hello"), etag='"1"')
+    assert cache.get("one") == entry
+    assert entry["etag"] == '"1"'
+    assert cache.get("two") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    linked = str(tmp_path / "linked.txt")
+    cache.materialize(entry, linked)
+    assert os.path.samefile(linked, cache.blob_path(entry))
+    assert not os.stat(linked).st_mode & stat.S_IWUSR
+
+    copied = str(tmp_path / "copied.txt")
+    cache.materialize(entry, copied, link=False)
+    assert not os.path.samefile(copied, cache.blob_path(entry))
+    with open(copied, "ab") as file_object:
+        file_object.write(b"!")
+    with open(cache.blob_path(entry), "rb") as file_object:
+        assert file_object.read() == b"hello"
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    first = cache.put("one", _file(tmp_path, "one.txt", b"same"), link=False)
+    second = cache.put("two", _file(tmp_path, "two.txt", b"same"), link=False)
+    assert cache.blob_path(first) == cache.blob_path(second)
+    assert cache.stats()["bytes_stored"] == 4
+
+
+def test_least_recently_used_keys_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=25)
+    for index, name in enumerate(["a", "b"]):
+        cache.put(name, _file(tmp_path, name, name.encode() * 10), link=False)
+        os.utime(cache._index_path(name), (1000 + index, 1000 + index))
+    # reading a makes b the least recently used key
+    os.utime(cache._index_path("a"), (2000, 2000))
+    cache.put("c", _file(tmp_path, "c", b"c" * 10), link=False)
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 20
+
+
+def test_missing_blobs_are_misses(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    entry = cache.put("one", _file(tmp_path, "one.txt", b"hello"), link=False)
+    os.remove(cache.blob_path(entry))
+    assert cache.get("one") is None
+
+
+def test_overwritten_keys_release_their_previous_blob(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=3000)
+    for version in range(6):
+        # the same uri with a new ETag and new content each time
+        content = bytes([version]) * 1000
+        cache.put("uri", _file(tmp_path, "download", content), link=False, etag=f'"{version}"')
+        entry = cache.get("uri")
+        assert entry is not None and entry["etag"] == f'"{version}"'
+        with open(cache.blob_path(entry), "rb") as file_object:
+            assert file_object.read() == content
+    blobs = [name for _, _, files in os.walk(tmp_path / "cache" / "blobs") for name in files]
+    assert blobs == [entry["hash"]]
+    assert cache.stats()["evictions"] == 0
+    assert cache.stats()["bytes"] == 1000
+
+
+def test_overwritten_keys_keep_blobs_shared_with_other_keys(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    shared = cache.put("one", _file(tmp_path, "one", b"shared"), link=False)
+    cache.put("two", _file(tmp_path, "two", b"shared"), link=False)
+    cache.put("one", _file(tmp_path, "one", b"changed"), link=False)
+    assert os.path.isfile(cache.blob_path(shared))
+    assert cache.get("two") is not None
+
+
+def test_orphan_blobs_are_swept_when_full(tmp_path, monkeypatch):
+    from gravityai import diskcache
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=25)
+    orphan = cache.put("orphan", _file(tmp_path, "orphan", b"o" * 10), link=False)
+    os.remove(cache._index_path("orphan"))
+    cache.put("a", _file(tmp_path, "a", b"a" * 10), link=False)
+
+    # a recent orphan may be a blob whose entry is still being written
+    cache.put("b", _file(tmp_path, "b", b"b" * 10), link=False)
+    assert cache.stats()["evictions"] == 1
+    assert os.path.isfile(cache.blob_path(orphan))
+
+    monkeypatch.setattr(diskcache, "_ORPHAN_GRACE_SECONDS", 0)
+    cache.put("c", _file(tmp_path, "c", b"c" * 10), link=False)
+    assert not os.path.exists(cache.blob_path(orphan))
+    assert cache.get("b") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 20
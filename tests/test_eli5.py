@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+eli5 = pytest.importorskip("eli5")
+pytest.importorskip("sklearn")
+
+from sklearn.linear_model import LinearRegression, LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+
+from gravityai.explainability_interface.explainer import ELI5Explainer
+from gravityai.explainability_interface.factory import ELI5Factory
+
+
+def _data():
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.rand(40, 3), columns=["a", "b", "c"])
+    return X, 3 * X["a"] - X["b"]
+
+
+def _row_by_row(model, X, targets=None):
+    '''
+    The contributions and bias of each row, as eli5.explain_prediction computes them for the first target.
+    '''
+    contributions = np.zeros(X.shape)
+    bias = np.zeros(len(X))
+    names = list(X.columns)
+    for row, values in enumerate(X.values):
+        explanation = eli5.explain_prediction(model, values, top=None, feature_names=names, targets=targets)
+        weights = explanation.targets[0].feature_weights
+        for weight in weights.pos + weights.neg:
+            if weight.feature == "<BIAS>":
+                bias[row] = weight.weight
+            else:
+                contributions[row, names.index(weight.feature)] = weight.weight
+    return contributions, bias
+
+
+def test_linear_regression_matches_eli5():
+    X, y = _data()
+    model = LinearRegression().fit(X, y)
+    contributions, bias = ELI5Factory().create_factory(model, X).explainPredictions()
+    expected = _row_by_row(model, X)
+    np.testing.assert_allclose(contributions, expected[0], atol=1e-9)
+    np.testing.assert_allclose(bias, expected[1], atol=1e-9)
+    np.testing.assert_allclose(contributions.sum(axis=1) + bias, model.predict(X))
+
+
+def test_binary_classifier_is_explained_for_the_positive_class():
+    X, y = _data()
+    model = LogisticRegression().fit(X, y > y.median())
+    contributions, bias = ELI5Explainer(model, X).explainPredictions()
+    expected = _row_by_row(model, X, targets=[True])
+    assert contributions.shape == X.shape
+    np.testing.assert_allclose(contributions, expected[0], atol=1e-9)
+    np.testing.assert_allclose(bias, expected[1], atol=1e-9)
+
+
+def test_multi_class_and_single_rows():
+    X, y = _data()
+    model = LogisticRegression().fit(X, np.digitize(y, np.quantile(y, [0.33, 0.66])))
+    contributions, bias = ELI5Explainer(model, X).explainPredictions()
+    assert contributions.shape == (40, 3, 3)
+    assert bias.shape == (40, 3)
+    contributions, _ = ELI5Explainer(model, X).explainPredictions(X.values[0])
+    assert contributions.shape == (1, 3, 3)
+
+
+def test_other_models_are_explained_row_by_row():
+    X, y = _data()
+    model = DecisionTreeClassifier(max_depth=3, random_state=0).fit(X, y > y.median())
+    contributions, bias = ELI5Explainer(model, X).explainPredictions()
+    expected = _row_by_row(model, X, targets=[True])
+    np.testing.assert_allclose(contributions, expected[0], atol=1e-9)
+    np.testing.assert_allclose(bias, expected[1], atol=1e-9)
+
+
+def test_weights_are_cached():
+    X, y = _data()
+    model = LinearRegression().fit(X, y)
+    first = ELI5Explainer(model, X).explainWeights()
+    assert ELI5Explainer(model, X).explainWeights() is first
+    assert ELI5Explainer(model, X, use_cache=False).explainWeights() is not first
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from gravityai.explainability_interface.cache import ExplainerCache, _estimateSize
+
+
+class Model:
+    def __init__(self, size=0):
+        self.weights = np.zeros(size, dtype=np.uint8)
+
+
+def _builder(calls, size=0):
+    def build():
+        calls.append(1)
+        return {"buffer": np.zeros(size, dtype=np.uint8)}
+    return build
+
+
+def test_hits_and_misses():
+    cache = ExplainerCache()
+    model = Model()
+    calls = []
+    first = cache.getOrCreate(model, "shap", _builder(calls))
+    assert cache.getOrCreate(model, "shap", _builder(calls)) is first
+    cache.getOrCreate(model, "eli5", _builder(calls))
+    cache.getOrCreate(model, "shap", _builder(calls), extraKey="other background")
+    cache.getOrCreate(Model(), "shap", _builder(calls))
+    assert len(calls) == 4
+    assert cache.getStats()["hits"] == 1
+    assert cache.getStats()["misses"] == 4
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ExplainerCache(maxEntries=2)
+    models = [Model() for _ in range(3)]
+    calls = []
+    cache.getOrCreate(models[0], "shap", _builder(calls))
+    cache.getOrCreate(models[1], "shap", _builder(calls))
+    cache.getOrCreate(models[0], "shap", _builder(calls))
+    cache.getOrCreate(models[2], "shap", _builder(calls))
+    assert len(calls) == 3
+    cache.getOrCreate(models[0], "shap", _builder(calls))
+    assert len(calls) == 3
+    cache.getOrCreate(models[1], "shap", _builder(calls))
+    assert len(calls) == 4
+    assert cache.getStats()["evictions"] == 2
+
+
+def test_models_count_once_towards_max_bytes():
+    cache = ExplainerCache(maxBytes=10 * 1000 * 1000)
+    model = Model(4 * 1000 * 1000)
+    calls = []
+    cache.getOrCreate(model, "shap", _builder(calls, 1000 * 1000))
+    cache.getOrCreate(model, "eli5", _builder(calls, 1000 * 1000))
+    stats = cache.getStats()
+    assert stats["entries"] == 2
+    assert 6 * 1000 * 1000 <= stats["bytes"] < 7 * 1000 * 1000
+
+    # a second model of the same size does not fit next to the first, which is dropped with its explainers
+    cache.getOrCreate(Model(4 * 1000 * 1000), "shap", _builder(calls, 1000 * 1000))
+    stats = cache.getStats()
+    assert stats["entries"] == 1
+    assert 5 * 1000 * 1000 <= stats["bytes"] < 6 * 1000 * 1000
+
+    cache.clear()
+    assert cache.getStats()["bytes"] == 0
+
+
+def test_models_larger_than_max_bytes_are_not_cached():
+    cache = ExplainerCache(maxBytes=1000 * 1000)
+    model = Model(2 * 1000 * 1000)
+    calls = []
+    cache.getOrCreate(model, "shap", _builder(calls))
+    cache.getOrCreate(model, "shap", _builder(calls))
+    assert len(calls) == 2
+    assert cache.getStats()["entries"] == 0
+    cache.configure(maxBytes=4 * 1000 * 1000)
+    cache.getOrCreate(model, "shap", _builder(calls))
+    cache.getOrCreate(model, "shap", _builder(calls))
+    assert len(calls) == 3
+
+
+def test_estimate_size_follows_extension_state():
+    sklearn = pytest.importorskip("sklearn.tree")
+    X = np.random.RandomState(0).rand(500, 4)
+    model = sklearn.DecisionTreeRegressor(random_state=0).fit(X, X[:, 0])
+    state = model.tree_.__getstate__()
+    assert _estimateSize(model) >= state["nodes"].nbytes + state["values"].nbytes
+
+
+def test_interpret_model_reuses_the_explainer(gravityai):
+    pytest.importorskip("shap")
+    from sklearn.ensemble import RandomForestRegressor
+    X = np.random.RandomState(0).rand(30, 3)
+    model = RandomForestRegressor(n_estimators=5, random_state=0).fit(X, X[:, 0])
+    before = gravityai.explainer_cache_stats()
+    first = gravityai.interpret_model(model, X, None)
+    second = gravityai.interpret_model(model, X, None)
+    after = gravityai.explainer_cache_stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+    np.testing.assert_allclose(first[1], second[1])
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+shap = pytest.importorskip("shap")
+pytest.importorskip("sklearn")
+
+from sklearn.ensemble import BaggingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.neighbors import KNeighborsRegressor
+
+from gravityai.explainability_interface import explainer
+from gravityai.explainability_interface.explainer import SHAPExplainer, detectModelType
+from gravityai.explainability_interface.factory import SHAPFactory
+from gravityai.explainability_interface.modelhandler import GeneralHandler
+
+
+def _data():
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.rand(60, 3), columns=["a", "b", "c"])
+    return X, 3 * X["a"] - X["b"] + 0.1 * rng.rand(60)
+
+
+def test_detect_model_type():
+    X, y = _data()
+    assert detectModelType(RandomForestRegressor(n_estimators=3).fit(X, y)) == "tree"
+    assert detectModelType(LinearRegression().fit(X, y)) == "linear"
+    assert detectModelType(KNeighborsRegressor().fit(X, y)) == "permutation"
+    assert detectModelType(BaggingRegressor(LinearRegression(), n_estimators=2).fit(X, y)) == "permutation"
+    assert detectModelType(lambda rows: rows.sum(axis=1)) == "permutation"
+    assert detectModelType(object()) == "general"
+
+
+@pytest.mark.parametrize("model, handler, explainerType", [
+    (RandomForestRegressor(n_estimators=5, random_state=0), "TreeHandler", shap.TreeExplainer),
+    (LinearRegression(), "LinearHandler", shap.LinearExplainer),
+    (KNeighborsRegressor(), "PermutationHandler", shap.PermutationExplainer),
+])
+def test_auto_picks_the_explainer_from_the_model(model, handler, explainerType):
+    X, y = _data()
+    model.fit(X, y)
+    shapExplainer = SHAPExplainer(model, X, model_type="auto", use_cache=False)
+    assert type(shapExplainer.modelHandler).__name__ == handler
+    explanationObject = shapExplainer.getExplanationObject()
+    assert isinstance(explanationObject, explainerType)
+
+    # shap values add up to the prediction
+    values = shapExplainer.modelHandler.getShapValues(explanationObject, X.iloc[:10])
+    np.testing.assert_allclose(values.values.sum(axis=1) + values.base_values, model.predict(X.iloc[:10]), atol=1e-6)
+
+    labels, means, _ = shapExplainer.getBarPlotJson(explanationObject)
+    assert len(labels) == len(means) == 3
+
+
+def test_factory_passes_the_settings_on():
+    X, y = _data()
+    model = LinearRegression().fit(X, y)
+    shapExplainer = SHAPFactory().create_factory(model, X, model_type="auto", use_cache=False)
+    assert shapExplainer.model is model
+    assert type(shapExplainer.modelHandler).__name__ == "LinearHandler"
+
+
+def test_general_stays_the_default():
+    X, y = _data()
+    shapExplainer = SHAPExplainer(LinearRegression().fit(X, y), X, use_cache=False)
+    assert shapExplainer.model_type == "general"
+    assert type(shapExplainer.modelHandler) is GeneralHandler
+
+
+def test_auto_ignores_keywords_of_other_handlers():
+    X, y = _data()
+    shapExplainer = SHAPExplainer(RandomForestRegressor(n_estimators=3).fit(X, y), X, model_type="auto",
+                                  use_cache=False, max_evals=100)
+    assert shapExplainer.model_type == "tree"
+    with pytest.raises(TypeError):
+        SHAPExplainer(RandomForestRegressor(n_estimators=3).fit(X, y), X, use_cache=False, max_evals=100)
+
+
+def test_unknown_model_type():
+    X, y = _data()
+    with pytest.raises(Exception, match="Unknown model_type"):
+        SHAPExplainer(LinearRegression().fit(X, y), X, model_type="forest")
+
+
+def test_register_model_handler(monkeypatch):
+    monkeypatch.setattr(explainer, "MODEL_TYPE_MAPPINGS", dict(explainer.MODEL_TYPE_MAPPINGS))
+    monkeypatch.setattr(explainer, "MODEL_TYPE_DETECTORS", list(explainer.MODEL_TYPE_DETECTORS))
+
+    class ConstantHandler(GeneralHandler):
+        pass
+
+    class ConstantModel:
+        def predict(self, rows):
+            return np.ones(len(rows))
+
+    explainer.registerModelHandler("constant", ConstantHandler, lambda model: isinstance(model, ConstantModel))
+    X, _ = _data()
+    shapExplainer = SHAPExplainer(ConstantModel(), X, model_type="auto", use_cache=False)
+    assert shapExplainer.model_type == "constant"
+    assert type(shapExplainer.modelHandler) is ConstantHandler
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import pytest
+
+INLINE = {"GRAVITYAI_TEST_INLINE": "1"}
+
+
+async def _inline_replies(websocket, count=1, timeout=10):
+    '''
+    Returns the final replies as (header, payload) pairs, with a payload only for binary "complete" replies.
+    '''
+    replies = []
+    while(len(replies) < count):
+        message = await asyncio.wait_for(websocket.recv(), timeout)
+        if (isinstance(message, bytes)):
+            header, _, payload = message.partition(b"\n")
+            replies.append((json.loads(header), payload))
+            continue
+        reply = json.loads(message)
+        if (reply.get("status") != "pending"):
+            replies.append((reply, None))
+    return replies
+
+
+def _frame(header, payload):
+    return json.dumps(header).encode("utf-8") + b"\n" + payload
+
+
+def test_inline_handler(serve):
+    server = serve(env=INLINE)
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(_frame({"requestId": "a"}, b"hello\nworld"))
+            await websocket.send(_frame({"requestId": "b"}, b"error"))
+            return await _inline_replies(websocket, 2)
+
+    replies = asyncio.run(main())
+    assert replies[0] == ({"status": "complete", "requestId": "a"}, b"HELLO\nWORLD")
+    assert replies[1][0]["status"] == "error"
+    assert replies[1][0]["requestId"] == "b"
+    assert "bad input" in replies[1][0]["error"]
+
+
+def test_inline_input_spills_to_a_file_without_inline_handler(serve):
+    server = serve()
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(_frame({"requestId": "spilled"}, json.dumps({"value": 1}).encode("utf-8")))
+            return await _inline_replies(websocket)
+
+    header, payload = asyncio.run(main())[0]
+    assert header == {"status": "complete", "requestId": "spilled"}
+    assert json.loads(payload) == {"value": 1}
+
+
+def test_inline_complete_reply_layout(serve):
+    server = serve(env=INLINE)
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(_frame({"requestId": "layout"}, b"\x00\xffabc"))
+            assert json.loads(await websocket.recv()) == {"status": "pending", "requestId": "layout"}
+            return await asyncio.wait_for(websocket.recv(), 10)
+
+    message = asyncio.run(main())
+    assert isinstance(message, bytes)
+    assert message == b'{"status": "complete", "requestId": "layout"}\n\x00\xffABC'
+
+
+@pytest.mark.parametrize("frame,error", [
+    (b'{"requestId": "a"}', "Invalid Request: binary frame has no json header line"),
+    (b'{"requestId": \n', "Invalid Request: Json parse error"),
+    (b'["a"]\n', "Invalid Request: root json object is not a dictionary"),
+    (b'{"other": "a"}\npayload', "Request does not contain a valid requestId"),
+])
+def test_invalid_inline_frames(serve, frame, error):
+    server = serve(env=INLINE)
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(frame)
+            return json.loads(await asyncio.wait_for(websocket.recv(), 10))
+
+    reply = asyncio.run(main())
+    assert reply["status"] == "error"
+    assert reply["error"] == error
+    assert reply["request"] == frame.split(b"\n")[0].decode("utf-8")
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import signal
+import time
+
+import pytest
+
+from conftest import SERVING_MODEL, free_port, start_model
+
+
+def test_running_request_of_a_closed_connection_delays_the_idle_exit(serve):
+    server = serve("--concurrency", "1", "--idle-timeout", "0.5")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("slow", {"sleep": 2}))
+            assert json.loads(await websocket.recv())["status"] == "pending"
+
+    started = time.time()
+    asyncio.run(main())
+    time.sleep(1)
+    assert server.process.poll() is None
+    assert server.process.wait(10) == 2
+    assert time.time() - started >= 2.5
+    assert b"Idle Timeout" in server.process.stderr.read()
+    assert json.loads(server.output("slow").read_text()) == {"sleep": 2}
+
+
+def test_idle_exit_without_connections(serve):
+    server = serve("--idle-timeout", "0.5")
+    assert server.process.wait(10) == 2
+
+
+def test_sigterm_drains_requests_in_flight(serve):
+    server = serve("--concurrency", "2")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("running", {"sleep": 1}))
+            assert json.loads(await websocket.recv())["status"] == "pending"
+            server.process.send_signal(signal.SIGTERM)
+            await asyncio.sleep(0.2)
+            await websocket.send(server.request("new", {}))
+            return await server.replies(websocket, ["running", "new"])
+
+    replies = {r["requestId"]: r for r in asyncio.run(main())}
+    assert replies["new"]["status"] == "busy"
+    assert replies["new"]["error"] == "Server is shutting down"
+    assert replies["running"]["status"] == "complete"
+    assert server.process.wait(10) == 0
+    assert not server.output("new").exists()
+
+
+def test_failing_warm_up_exits_before_listening(tmp_path):
+    warmup = tmp_path / "warmup.json"
+    warmup.write_text(json.dumps({"error": "not warm"}))
+    port = free_port()
+    process = start_model(SERVING_MODEL, "serve", "-p", port, env={"GRAVITYAI_TEST_WARMUP": str(warmup)})
+    assert process.wait(30) == 2
+    stderr = process.stderr.read()
+    assert b"Warm-up failed for " + str(warmup).encode() + b": not warm" in stderr
+    assert b"Failed to start server" not in stderr
+
+
+def test_warm_up(serve, tmp_path):
+    warmup = tmp_path / "warmup.json"
+    warmup.write_text(json.dumps({"sleep": 0.1}))
+    server = serve(env={"GRAVITYAI_TEST_WARMUP": str(warmup)})
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("first", {}))
+            return await server.replies(websocket, ["first"])
+
+    assert asyncio.run(main())[0]["status"] == "complete"
+
+
+@pytest.mark.parametrize("pool", ["thread", "process"])
+def test_sigterm_exits_after_the_drain_timeout(serve, pool):
+    server = serve("--concurrency", "1", "--pool", pool, "--drain-timeout", "1")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("slow", {"sleep": 8}))
+            assert json.loads(await websocket.recv())["status"] == "pending"
+            server.process.send_signal(signal.SIGTERM)
+            started = time.time()
+            # the client keeps answering the closing handshake while it waits
+            assert await asyncio.get_event_loop().run_in_executor(None, server.process.wait, 10) == 0
+            return time.time() - started
+
+    assert asyncio.run(main()) < 4
+    assert not server.output("slow").exists()
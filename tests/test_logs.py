@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+from gravityai import logs
+from gravityai.logs import AsyncLogger
+
+
+def _lines(path):
+    with open(path) as file_object:
+        return [json.loads(line) for line in file_object]
+
+
+def test_levels_below_the_logger_level_are_dropped(tmp_path):
+    path = tmp_path / "debug.log"
+    logger = AsyncLogger(str(path), level=logs.INFO)
+    assert not logger.enabled(logs.DEBUG) and logger.enabled(logs.WARNING)
+    logger.log(logs.DEBUG, "hidden")
+    logger.log(logs.INFO, "shown")
+    logger.log(logs.ERROR, "failed")
+    logger.close()
+    assert [(line["level"], line["message"]) for line in _lines(path)] == [("info", "shown"), ("error", "failed")]
+
+
+def test_long_fields_are_truncated(tmp_path):
+    path = tmp_path / "debug.log"
+    logger = AsyncLogger(str(path), max_field=10)
+    logger.log(logs.INFO, "x" * 30, payload="y" * 11, data=b"\x00" * 5, count=12345678901)
+    logger.close()
+    line = _lines(path)[0]
+    assert line["message"] == "x" * 10 + "... (30 chars)"
+    assert line["payload"] == "y" * 10 + "... (11 chars)"
+    assert line["data"] == "<5 bytes>"
+    assert line["count"] == 12345678901
+
+
+def test_one_json_object_per_line(tmp_path):
+    path = tmp_path / "debug.log"
+    logger = AsyncLogger(str(path), max_batch=7)
+    for index in range(100):
+        logger.log(logs.INFO, "record %d of %s", index, "many", text="line\nbreak")
+    logger.log(logs.INFO, "bad %d format", "x")
+    logger.close()
+    with open(path) as file_object:
+        raw = file_object.read().splitlines()
+    assert len(raw) == 101
+    lines = [json.loads(line) for line in raw]
+    assert [line["message"] for line in lines[:100]] == [f"record {i} of many" for i in range(100)]
+    assert lines[0]["text"] == "line\nbreak"
+    assert lines[0]["pid"] == os.getpid()
+    assert lines[100]["message"] == "bad %d format x"
+
+
+def test_close_writes_queued_records(tmp_path):
+    path = tmp_path / "debug.log"
+    # a writer that would otherwise only flush after a minute
+    logger = AsyncLogger(str(path), flush_interval=60)
+    logger.log(logs.INFO, "queued")
+    logger.close()
+    assert [line["message"] for line in _lines(path)] == ["queued"]
+    logger.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_starts_its_own_writer(tmp_path):
+    path = tmp_path / "debug.log"
+    logger = AsyncLogger(str(path))
+    logger.log(logs.INFO, "parent before fork")
+    pid = os.fork()
+    if (pid == 0):
+        code = 1
+        try:
+            logger.log(logs.INFO, "child")
+            code = 0 if logger._thread.is_alive() else 1
+            logger.close()
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    logger.log(logs.INFO, "parent after fork")
+    logger.close()
+    lines = _lines(path)
+    assert sorted((line["message"], line["pid"]) for line in lines) == sorted([
+        ("parent before fork", os.getpid()), ("child", pid), ("parent after fork", os.getpid())])
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import time
+import urllib.request
+
+import pytest
+
+from conftest import free_port
+from gravityai.metrics import Histogram, Registry
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    histogram = Histogram("seconds", "Test", buckets=[1, 2, 4])
+    assert histogram.quantile(0.5) is None
+    for value in [0.5, 1.5, 1.5, 3]:
+        histogram.observe(value)
+    assert histogram.quantile(0.25) == pytest.approx(1.0)
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(0.75) == pytest.approx(2.0)
+    assert histogram.quantile(1.0) == pytest.approx(4.0)
+    assert histogram.snapshot() == {"count": 4, "mean": pytest.approx(1.625), "p50": pytest.approx(1.5),
+                                    "p95": pytest.approx(3.6), "p99": pytest.approx(3.92)}
+
+
+def test_histogram_values_over_the_last_bucket():
+    histogram = Histogram("seconds", "Test", buckets=[1, 2])
+    histogram.observe(10)
+    assert histogram.counts == [0, 0, 1]
+    assert histogram.quantile(0.5) == 2
+
+
+def test_prometheus_text_format():
+    registry = Registry()
+    histogram = registry.histogram("request_seconds", "Request time", buckets=[0.5, 1])
+    counter = registry.counter("requests_total", "Requests", label="status")
+    registry.gauge("connections", "Connections", lambda: 3)
+    histogram.observe(0.25)
+    histogram.observe(2)
+    counter.inc("complete")
+    counter.inc("complete")
+    counter.inc("error")
+    assert registry.prometheus() == "\n".join([
+        "# HELP gravityai_request_seconds Request time",
+        "# TYPE gravityai_request_seconds histogram",
+        'gravityai_request_seconds_bucket{le="0.5"} 1',
+        'gravityai_request_seconds_bucket{le="1"} 1',
+        'gravityai_request_seconds_bucket{le="+Inf"} 2',
+        "gravityai_request_seconds_sum 2.25",
+        "gravityai_request_seconds_count 2",
+        "# HELP gravityai_requests_total Requests",
+        "# TYPE gravityai_requests_total counter",
+        'gravityai_requests_total{status="complete"} 2',
+        'gravityai_requests_total{status="error"} 1',
+        "# HELP gravityai_connections Connections",
+        "# TYPE gravityai_connections gauge",
+        "gravityai_connections 3",
+    ]) + "\n"
+
+
+def test_stats_message(serve):
+    server = serve("--concurrency", "2")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("a", {}))
+            await websocket.send(server.request("b", {"error": "bad"}))
+            await server.replies(websocket, ["a", "b"])
+            await websocket.send(json.dumps({"type": "stats", "requestId": "s"}))
+            return json.loads(await asyncio.wait_for(websocket.recv(), 10))
+
+    reply = asyncio.run(main())
+    assert reply["type"] == "stats"
+    assert reply["requestId"] == "s"
+    stats = reply["stats"]
+    assert stats["pid"] == server.process.pid
+    assert stats["requests_total"] == {"complete": 1, "error": 1}
+    assert stats["request_handler_seconds"]["count"] == 2
+    assert stats["request_seconds"]["p50"] > 0
+    assert stats["requests_in_flight"] == 0
+    assert stats["connections"] == 1
+
+
+def _scrape(port, timeout=10):
+    deadline = time.time() + timeout
+    while(True):
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+                return response.headers["Content-Type"], response.read().decode("utf-8")
+        except OSError:
+            if (time.time() > deadline):
+                raise
+            time.sleep(0.05)
+
+
+def test_metrics_port(serve):
+    port = free_port()
+    server = serve("--metrics-port", port)
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("a", {}))
+            await server.replies(websocket, ["a"])
+
+    asyncio.run(main())
+    contentType, text = _scrape(port)
+    assert contentType.startswith("text/plain; version=0.0.4")
+    lines = text.splitlines()
+    assert 'gravityai_requests_total{status="complete"} 1' in lines
+    assert "gravityai_request_handler_seconds_count 1" in lines
+    assert "# TYPE gravityai_request_seconds histogram" in lines
+    assert "gravityai_requests_in_flight 0" in lines
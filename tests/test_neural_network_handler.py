@@ -0,0 +1,82 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+shap = pytest.importorskip("shap")
+
+from gravityai.explainability_interface import modelhandler
+from gravityai.explainability_interface.modelhandler import NeuralNetworkHandler
+
+
+@pytest.fixture(autouse=True)
+def background_cache(monkeypatch):
+    monkeypatch.setattr(modelhandler, "_BACKGROUND_CACHE", OrderedDict())
+    return modelhandler._BACKGROUND_CACHE
+
+
+def _data(rows=200, seed=0):
+    return np.random.RandomState(seed).rand(rows, 4)
+
+
+def test_kmeans_background():
+    background = NeuralNetworkHandler(background_size=10).getBackground(_data())
+    assert background.data.shape == (10, 4)
+    assert background.weights.sum() == pytest.approx(1)
+
+
+def test_sampled_background():
+    data = _data()
+    background = NeuralNetworkHandler(background_size=10, summarize="sample").getBackground(data)
+    assert background.shape == (10, 4)
+    assert all(any((row == original).all() for original in data) for row in background)
+
+
+def test_small_or_unbounded_backgrounds_are_kept():
+    data = _data(rows=10)
+    assert NeuralNetworkHandler(background_size=10).getBackground(data) is data
+    data = _data()
+    assert NeuralNetworkHandler(background_size=None).getBackground(data) is data
+
+
+def test_backgrounds_are_cached_by_fingerprint(background_cache):
+    first = NeuralNetworkHandler(background_size=10, summarize="sample").getBackground(_data())
+    # an equal copy of the data has the same fingerprint
+    assert NeuralNetworkHandler(background_size=10, summarize="sample").getBackground(_data()) is first
+    assert len(background_cache) == 1
+
+    assert NeuralNetworkHandler(background_size=10, summarize="sample").getBackground(_data(seed=1)) is not first
+    assert NeuralNetworkHandler(background_size=5, summarize="sample").getBackground(_data()) is not first
+    assert NeuralNetworkHandler(background_size=10).getBackground(_data()) is not first
+    assert len(background_cache) == 4
+
+
+def test_nsamples_is_passed_to_shap_values():
+    calls = []
+
+    class Explainer:
+        expected_value = 0.5
+
+        def shap_values(self, data, nsamples, silent):
+            calls.append(nsamples)
+            return np.zeros(data.shape)
+
+    data = _data(rows=3)
+    values = NeuralNetworkHandler(nsamples=50).getShapValues(Explainer(), data)
+    NeuralNetworkHandler().getShapValues(Explainer(), data)
+    assert calls == [50, "auto"]
+    assert values.values.shape == (3, 4)
+    np.testing.assert_array_equal(values.base_values, [0.5] * 3)
+
+
+def test_kernel_explainer_values():
+    data = _data(rows=50)
+    handler = NeuralNetworkHandler(background_size=5, nsamples=100)
+    explanationObject = handler.getExplainer(lambda rows: rows.sum(axis=1), data)
+    values = handler.getShapValues(explanationObject, data[:3])
+    np.testing.assert_allclose(values.values.sum(axis=1) + values.base_values, data[:3].sum(axis=1), atol=1e-6)
+
+
+def test_invalid_summarize():
+    with pytest.raises(Exception, match="summarize"):
+        NeuralNetworkHandler(summarize="median")
@@ -0,0 +1,110 @@
+import io
+import os
+import zipfile
+
+import pandas as pd
+import pytest
+
+from gravityai import outputs
+
+
+def _results():
+    first = pd.DataFrame({"a": [1.0, 2.0, 3.0]}).describe()
+    second = pd.DataFrame({"a": [4.0, 5.0]}).describe()
+    return [first, second]
+
+
+def _read_arrow(path, output_format):
+    if (output_format == "parquet"):
+        return pd.read_parquet(path)
+    return pd.read_feather(path)
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "feather"])
+def test_arrow_writers_keep_the_index(tmp_path, output_format):
+    path = str(tmp_path / ("out." + output_format))
+    with outputs.open_output_writer(path, output_format) as writer:
+        for index, df in enumerate(_results()):
+            writer.write(index, df)
+
+    table = _read_arrow(path, output_format)
+    assert list(table.columns) == ["sheet", "index", "a"]
+    first = table[table["sheet"] == "Sheet_0"]
+    assert list(first["index"]) == list(_results()[0].index)
+    assert list(first["a"]) == list(_results()[0]["a"])
+    assert list(table["sheet"].unique()) == ["Sheet_0", "Sheet_1"]
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "feather"])
+def test_arrow_writers_without_results_write_a_readable_file(tmp_path, output_format):
+    path = str(tmp_path / ("out." + output_format))
+    with outputs.open_output_writer(path, output_format):
+        pass
+
+    table = _read_arrow(path, output_format)
+    assert list(table.columns) == ["sheet"]
+    assert len(table) == 0
+
+
+def test_excel_writer_keeps_the_index(tmp_path):
+    path = str(tmp_path / "out.xlsx")
+    with outputs.open_output_writer(path, "xlsx") as writer:
+        for index, df in enumerate(_results()):
+            writer.write(index, df)
+
+    sheets = pd.read_excel(path, sheet_name=None, index_col=0)
+    assert list(sheets) == ["Sheet_0", "Sheet_1"]
+    pd.testing.assert_frame_equal(sheets["Sheet_1"], _results()[1], check_names=False)
+
+
+def test_csv_zip_writer_keeps_the_index(tmp_path):
+    path = str(tmp_path / "out.zip")
+    with outputs.open_output_writer(path, "csv_zip") as writer:
+        for index, df in enumerate(_results()):
+            writer.write(index, df)
+
+    with zipfile.ZipFile(path) as archive:
+        assert archive.namelist() == ["Sheet_0.csv", "Sheet_1.csv"]
+        sheet = pd.read_csv(io.BytesIO(archive.read("Sheet_0.csv")), index_col=0)
+    pd.testing.assert_frame_equal(sheet, _results()[0])
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        outputs.open_output_writer(str(tmp_path / "out"), "xls")
+
+
+@pytest.mark.parametrize("output_format", ["xlsx", "parquet", "feather", "csv_zip"])
+def test_handle_csvs_with_uris(gravityai, tmp_path, output_format):
+    uris = []
+    for index in range(3):
+        path = tmp_path / f"input{index}.txt"
+        path.write_text(str(index))
+        uris.append(path.as_uri())
+    manifest = tmp_path / "manifest.csv"
+    pd.DataFrame({"uri": uris}).to_csv(manifest, index=False)
+
+    def handle_fnc(filename, row):
+        with open(filename) as file_object:
+            return pd.DataFrame({"value": [int(file_object.read())]})
+
+    outPath = str(tmp_path / ("out." + output_format))
+    previous = os.umask(0o022)
+    try:
+        gravityai.handle_csvs_with_uris(str(manifest), outPath, handle_fnc, output_format=output_format)
+    finally:
+        os.umask(previous)
+
+    assert os.stat(outPath).st_mode & 0o777 == 0o644
+    assert [name for name in os.listdir(tmp_path) if name.startswith(".gravityai-")] == []
+    if (output_format in ("parquet", "feather")):
+        assert list(_read_arrow(outPath, output_format)["value"]) == [0, 1, 2]
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "feather"])
+def test_handle_csvs_with_uris_empty_manifest(gravityai, tmp_path, output_format):
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("uri\n")
+    outPath = str(tmp_path / ("out." + output_format))
+    gravityai.handle_csvs_with_uris(str(manifest), outPath, lambda filename, row: None, output_format=output_format)
+    assert len(_read_arrow(outPath, output_format)) == 0
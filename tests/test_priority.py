@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+
+def test_queued_requests_run_by_priority_then_deadline(serve):
+    server = serve("--concurrency", "1")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("busy", {"sleep": 0.5}))
+            await asyncio.sleep(0.1)
+            await websocket.send(server.request("low", {}))
+            await websocket.send(server.request("late", {}, priority=5, deadline=time.time() + 60))
+            await websocket.send(server.request("soon", {}, priority=5, deadline=time.time() + 30))
+            await websocket.send(server.request("high", {}, priority=10))
+            return await server.replies(websocket, ["busy", "low", "late", "soon", "high"])
+
+    replies = asyncio.run(main())
+    assert [r["requestId"] for r in replies] == ["busy", "high", "soon", "late", "low"]
+
+
+def test_deadlines(serve):
+    server = serve("--concurrency", "1")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("past", {}, deadline=time.time() - 1))
+            await websocket.send(server.request("busy", {"sleep": 0.5}))
+            await asyncio.sleep(0.1)
+            await websocket.send(server.request("expires", {}, deadline=time.time() + 0.1))
+            await websocket.send(server.request("invalid", {}, deadline="tomorrow"))
+            await websocket.send(server.request("nan", {}, deadline=float("nan")))
+            await websocket.send(server.request("forever", {}, deadline=float("inf")))
+            return await server.replies(websocket, ["past", "busy", "expires", "invalid", "nan", "forever"])
+
+    replies = {r["requestId"]: r["status"] for r in asyncio.run(main())}
+    assert replies == {"past": "deadline_exceeded", "busy": "complete", "expires": "deadline_exceeded",
+                       "invalid": "error", "nan": "error", "forever": "error"}
+
+
+def test_priorities_must_be_finite(serve):
+    server = serve("--concurrency", "1")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("nan", {}, priority=float("nan")))
+            await websocket.send(server.request("infinite", {}, priority=float("-inf")))
+            await websocket.send(server.request("valid", {}, priority=1.5))
+            return await server.replies(websocket, ["nan", "infinite", "valid"])
+
+    replies = {r["requestId"]: r for r in asyncio.run(main())}
+    assert replies["nan"]["status"] == replies["infinite"]["status"] == "error"
+    assert replies["nan"]["error"] == "Request priority is not a number"
+    assert replies["valid"]["status"] == "complete"
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import os
+import pstats
+import tracemalloc
+
+from conftest import SERVING_MODEL, start_model
+from gravityai import profiling
+from gravityai.profiling import Profiler
+
+
+def _send_one_by_one(server, reqIds):
+    async def main():
+        async with server.connect() as websocket:
+            for reqId in reqIds:
+                await websocket.send(server.request(reqId, {}))
+                await server.replies(websocket, [reqId])
+
+    asyncio.run(main())
+
+
+def _check_profile(basePath):
+    assert pstats.Stats(basePath + ".prof").total_calls > 0
+    assert tracemalloc.Snapshot.load(basePath + ".tracemalloc").traces is not None
+
+
+def test_requests_are_profiled(serve, tmp_path):
+    folder = tmp_path / "profiles"
+    server = serve("--profile", str(folder))
+    _send_one_by_one(server, ["one", "../two"])
+    assert sorted(os.listdir(folder)) == ["_two.prof", "_two.tracemalloc", "one.prof", "one.tracemalloc"]
+    _check_profile(str(folder / "one"))
+
+
+def test_only_the_most_recent_profiles_are_kept(serve, tmp_path):
+    folder = tmp_path / "profiles"
+    server = serve("--profile", str(folder), "--profile-keep", "2")
+    _send_one_by_one(server, ["a", "b", "c", "d"])
+    assert sorted(os.listdir(folder)) == ["c.prof", "c.tracemalloc", "d.prof", "d.tracemalloc"]
+
+
+def test_profile_rate_samples_requests(tmp_path, monkeypatch):
+    draws = iter([0.1, 0.6, 0.4, 0.9])
+    monkeypatch.setattr(profiling.random, "random", lambda: next(draws))
+    profiler = Profiler(str(tmp_path), rate=0.5)
+    picked = []
+    for reqId in ["a", "b", "c", "d"]:
+        path = profiler.start(reqId)
+        if (path is not None):
+            picked.append(os.path.basename(path))
+            profiler.finish()
+    assert picked == ["a", "c"]
+
+
+def test_one_request_is_profiled_at_a_time(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    assert profiler.start("first") is not None
+    assert profiler.start("second") is None
+    profiler.finish()
+    assert profiler.start("third") is not None
+
+
+def test_profile_rate_is_validated():
+    process = start_model(SERVING_MODEL, "serve", "-p", "49200", "--profile", "profiles", "--profile-rate", "0")
+    assert process.wait(30) == 2
+    assert b"Invalid profile rate" in process.stderr.read()
+
+
+def test_run_is_profiled(tmp_path):
+    inputPath = tmp_path / "input.json"
+    inputPath.write_text(json.dumps({"value": 1}))
+    folder = tmp_path / "profiles"
+    process = start_model(SERVING_MODEL, "run", inputPath, tmp_path / "output.json", "--profile", folder)
+    assert process.wait(60) == 0
+    assert json.loads((tmp_path / "output.json").read_text()) == {"value": 1}
+    assert sorted(os.listdir(folder)) == ["run.prof", "run.tracemalloc"]
+    _check_profile(str(folder / "run"))
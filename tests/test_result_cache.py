@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def cache(gravityai, tmp_path, monkeypatch):
+    '''
+    Returns a function that installs handler as the request handler, with an empty result cache in tmp_path.
+    '''
+    def install(handler):
+        monkeypatch.setattr(gravityai, "_request_handler", handler)
+        monkeypatch.setattr(gravityai, "_result_cache_dir", str(tmp_path / "cache"))
+        monkeypatch.setattr(gravityai, "_result_cache_pending", {})
+        gravityai._open_result_cache("test", handler)
+        return gravityai
+    yield install
+    monkeypatch.setattr(gravityai, "_result_cache", None)
+
+
+def _files(tmp_path, count, content=b"same input", extension=".csv"):
+    inputs = []
+    for index in range(count):
+        path = tmp_path / f"input{index}.csv"
+        path.write_bytes(content)
+        inputs.append((str(path), str(tmp_path / f"output{index}{extension}")))
+    return inputs
+
+
+def _read(path):
+    with open(path, "rb") as file_object:
+        return file_object.read()
+
+
+def test_hit_skips_handler(cache, tmp_path):
+    calls = []
+
+    def handler(inputPath, outputPath):
+        calls.append(inputPath)
+        with open(outputPath, "wb") as file_object:
+            file_object.write(b"result")
+
+    gravityai = cache(handler)
+    (in0, out0), (in1, out1) = _files(tmp_path, 2)
+    assert asyncio.run(gravityai._on_cached_request(in0, out0)) == (True, None)
+    assert asyncio.run(gravityai._on_cached_request(in1, out1)) == (True, None)
+    assert calls == [in0]
+    assert _read(out1) == b"result"
+
+
+def test_output_extension_is_part_of_the_key(cache, tmp_path):
+    calls = []
+
+    def handler(inputPath, outputPath):
+        calls.append(outputPath)
+        with open(outputPath, "w") as file_object:
+            file_object.write(outputPath.rsplit(".", 1)[1])
+
+    gravityai = cache(handler)
+    ((in0, out0),) = _files(tmp_path, 1, extension=".csv")
+    ((in1, out1),) = _files(tmp_path, 1, extension=".json")
+    asyncio.run(gravityai._on_cached_request(in0, out0))
+    asyncio.run(gravityai._on_cached_request(in1, out1))
+    assert len(calls) == 2
+    assert _read(out1) == b"json"
+
+
+def test_identical_requests_in_flight_run_once(cache, tmp_path):
+    calls = []
+
+    async def handler(inputPath, outputPath):
+        calls.append(inputPath)
+        await asyncio.sleep(0.05)
+        with open(outputPath, "wb") as file_object:
+            file_object.write(b"result")
+
+    gravityai = cache(handler)
+    files = _files(tmp_path, 5)
+
+    async def main():
+        return await asyncio.gather(*[gravityai._on_cached_request(i, o) for i, o in files])
+
+    assert asyncio.run(main()) == [(True, None)] * 5
+    assert len(calls) == 1
+    assert all(_read(o) == b"result" for _, o in files)
+
+
+def test_waiting_request_runs_itself_when_the_first_is_cancelled(cache, tmp_path):
+    calls = []
+
+    async def handler(inputPath, outputPath):
+        calls.append(inputPath)
+        if (len(calls) == 1):
+            await asyncio.sleep(10)
+        with open(outputPath, "wb") as file_object:
+            file_object.write(b"result")
+
+    gravityai = cache(handler)
+    (in0, out0), (in1, out1) = _files(tmp_path, 2)
+
+    async def main():
+        first = asyncio.ensure_future(gravityai._on_cached_request(in0, out0))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(gravityai._on_cached_request(in1, out1))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    first, second = asyncio.run(main())
+    # _run_request turns the cancellation into an error reply for the cancelled request only
+    assert first[0] is False
+    assert second == (True, None)
+    assert calls == [in0, in1]
+    assert _read(out1) == b"result"
+
+
+def test_waiting_request_runs_itself_when_the_first_fails(cache, tmp_path):
+    calls = []
+
+    async def handler(inputPath, outputPath):
+        calls.append(inputPath)
+        await asyncio.sleep(0.05)
+        if (len(calls) == 1):
+            return "model failed"
+        with open(outputPath, "wb") as file_object:
+            file_object.write(b"result")
+
+    gravityai = cache(handler)
+    files = _files(tmp_path, 2)
+
+    async def main():
+        return await asyncio.gather(*[gravityai._on_cached_request(i, o) for i, o in files])
+
+    first, second = asyncio.run(main())
+    assert first == (False, "Error returned during processing: model failed")
+    assert second == (True, None)
+    assert len(calls) == 2
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("shap")
+pytest.importorskip("sklearn")
+
+from sklearn.ensemble import RandomForestRegressor
+
+from gravityai.explainability_interface.explainer import SHAPExplainer
+
+
+def _model(outputs):
+    rng = np.random.RandomState(0)
+    data = pd.DataFrame(rng.rand(40, 6), columns=list("abcdef"))
+    targets = np.stack([data["a"] * 2 + data["b"], data["c"] - data["d"]], axis=1)[:, :outputs]
+    model = RandomForestRegressor(n_estimators=5, random_state=0).fit(data, targets[:, 0] if outputs == 1 else targets)
+    return model, data
+
+
+def _barPlot(model, data, **kwargs):
+    shapExplainer = SHAPExplainer(model, data, use_cache=False, **kwargs)
+    return shapExplainer.getBarPlotJson(shapExplainer.getExplanationObject(), max_features=3)
+
+
+def _assertBarPlotsEqual(result, expected):
+    # the chunked sums are added in a different order than the mean over all rows, so only rounding may differ
+    np.testing.assert_array_equal(result[0], expected[0])
+    np.testing.assert_allclose(result[1], expected[1], rtol=1e-12)
+    assert result[2] == expected[2]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 40, 100])
+def test_chunked_bar_plot_matches_unchunked(chunk_size):
+    model, data = _model(outputs=1)
+    _assertBarPlotsEqual(_barPlot(model, data, chunk_size=chunk_size), _barPlot(model, data))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 40, 100])
+def test_chunked_bar_plot_matches_unchunked_with_several_outputs(chunk_size):
+    model, data = _model(outputs=2)
+    expected = _barPlot(model, data)
+    result = _barPlot(model, data, chunk_size=chunk_size)
+    assert sorted(result) == sorted(expected) == [0, 1]
+    for output in expected:
+        _assertBarPlotsEqual(result[output], expected[output])
+
+
+def test_chunked_shap_sums():
+    model, data = _model(outputs=2)
+    shapExplainer = SHAPExplainer(model, data, use_cache=False)
+    explanationObject = shapExplainer.getExplanationObject()
+    values = shapExplainer.modelHandler.getShapValues(explanationObject, data).values
+    sums, rows = shapExplainer.modelHandler.getShapSums(explanationObject, data, 7)
+    assert rows == 40
+    assert sums.shape == (6, 2)
+    np.testing.assert_allclose(sums, values.sum(axis=0), rtol=1e-12)
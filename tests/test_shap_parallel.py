@@ -0,0 +1,109 @@
+import asyncio
+import json
+import textwrap
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("shap")
+pytest.importorskip("sklearn")
+
+MODEL = textwrap.dedent('''
+    import json
+
+    import numpy as np
+    import pandas as pd
+    from sklearn.ensemble import RandomForestRegressor
+
+    from gravityai import gravityai as grav
+
+    rng = np.random.RandomState(0)
+    data = pd.DataFrame(rng.rand(40, 3), columns=["a", "b", "c"])
+    model = RandomForestRegressor(n_estimators=5, random_state=0).fit(data, data["a"] * 2)
+
+
+    def handler(inputPath, outputPath):
+        labels, values, _ = grav.interpret_model(model, data, outputPath, n_jobs=2)
+        with open(outputPath, "w") as file_object:
+            json.dump([np.asarray(labels).tolist(), np.asarray(values).tolist()], file_object)
+
+
+    grav.wait_for_requests(handler)
+''')
+
+
+def _model():
+    from sklearn.ensemble import RandomForestRegressor
+    rng = np.random.RandomState(0)
+    data = pd.DataFrame(rng.rand(40, 3), columns=["a", "b", "c"])
+    return RandomForestRegressor(n_estimators=5, random_state=0).fit(data, data["a"] * 2), data
+
+
+@pytest.mark.parametrize("chunk_size", [None, 7])
+def test_parallel_matches_serial(chunk_size):
+    from gravityai.explainability_interface.explainer import SHAPExplainer
+    model, data = _model()
+    kwargs = {"chunk_size": chunk_size} if chunk_size else {}
+    serial = SHAPExplainer(model, data, use_cache=False, **kwargs)
+    parallel = SHAPExplainer(model, data, use_cache=False, n_jobs=2, **kwargs)
+    assert parallel.isParallel()
+    expected = serial.getBarPlotJson(serial.getExplanationObject())
+    result = parallel.getBarPlotJson(None)
+    np.testing.assert_array_equal(result[0], expected[0])
+    if (chunk_size):
+        # the chunk sums are added in the same order as in the serial path
+        np.testing.assert_array_equal(result[1], expected[1])
+    else:
+        # the per-worker sums are added in a different order than the serial mean over all rows
+        np.testing.assert_allclose(result[1], expected[1], rtol=1e-12)
+
+
+def _pool(explainer, shapExplainer):
+    backgroundKey = shapExplainer.modelHandler.getCacheKey(shapExplainer.data)
+    return explainer._getShapPool(explainer._shapPoolKey(shapExplainer, backgroundKey), shapExplainer, backgroundKey)
+
+
+def test_parallel_workers_are_reused():
+    from gravityai.explainability_interface import explainer
+    model, data = _model()
+    try:
+        first = explainer.SHAPExplainer(model, data, n_jobs=2)
+        first.getBarPlotJson(None)
+        pool = _pool(explainer, first)
+        workers = set(pool._processes)
+        assert len(explainer._SHAP_POOLS) == 1
+
+        # other rows are explained by the same workers
+        other = pd.DataFrame(np.random.RandomState(1).rand(30, 3), columns=data.columns)
+        second = explainer.SHAPExplainer(model, other, n_jobs=2)
+        result = second.getBarPlotJson(None)
+        serial = explainer.SHAPExplainer(model, other, use_cache=False)
+        expected = serial.getBarPlotJson(serial.getExplanationObject())
+        np.testing.assert_array_equal(result[0], expected[0])
+        np.testing.assert_allclose(result[1], expected[1], rtol=1e-12)
+        assert _pool(explainer, second) is pool
+        assert set(pool._processes) == workers
+
+        # other settings get their own workers, and use_cache=False does not keep any
+        explainer.SHAPExplainer(model, data, n_jobs=2, chunk_size=7).getBarPlotJson(None)
+        explainer.SHAPExplainer(model, data.iloc[:20], n_jobs=2, use_cache=False).getBarPlotJson(None)
+        assert len(explainer._SHAP_POOLS) == 2
+    finally:
+        explainer.shutdownShapPools()
+    assert len(explainer._SHAP_POOLS) == 0
+
+
+def test_parallel_in_a_server_script_without_a_main_guard(serve, tmp_path):
+    model = tmp_path / "model.py"
+    model.write_text(MODEL)
+    server = serve("--concurrency", "1", model=str(model))
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("explain", {}))
+            return await server.replies(websocket, ["explain"], timeout=120)
+
+    assert asyncio.run(main())[0]["status"] == "complete"
+    labels, values = json.loads(server.output("explain").read_text())
+    assert len(labels) == len(values) == 3
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from gravityai.streaming import _JSONValidator, validate_json_file
+
+DOCUMENTS = [
+    '{"a": 1}', '{}', '[]', '""', '0', '-0.0', '1.5e-3', 'false', 'true', 'null', '"x"',
+    '  [ "a" , 1e5 , -2.5E-3 ]  ', '[true, false, null]', '{"a": [1, {"b": null}], "c": "\\u00e9\\n"}',
+    '"\\ud83d"', '"\\\\"', '[' * 50 + ']' * 50, '{"a": "' + 'x' * 5000 + '"}',
+    '[1, 2,]', '{"a":}', '{"a" 1}', '[1 2]', '1.', '01', '-', '--1', '[', ']', '{"a": 1}}', '{"a": 1} x',
+    '"\\x"', '"a\tb"', '[tru]', '{"k": "v",}', '[,1]', '{,}', '1 2', '"abc', '',
+]
+CHUNK_SIZES = [1, 2, 3, 7, 1 << 20]
+
+
+def _loads(text):
+    try:
+        return True, json.loads(text)
+    except ValueError:
+        return False, None
+
+
+def _validate(text, chunk):
+    validator = _JSONValidator()
+    for start in range(0, len(text), chunk):
+        validator.feed(text[start:start + chunk])
+    return validator.finish(), validator.empty
+
+
+@pytest.mark.parametrize("chunk", CHUNK_SIZES)
+@pytest.mark.parametrize("text", DOCUMENTS)
+def test_validator_agrees_with_json_loads(text, chunk):
+    valid, value = _loads(text)
+    result, empty = _validate(text, chunk)
+    assert result == valid
+    if (valid):
+        assert empty == (not value)
+
+
+@pytest.mark.parametrize("text", [d for d in DOCUMENTS if _loads(d)[0] and d.strip() and d.strip()[0] in "[{\""])
+def test_truncated_documents_are_invalid(text):
+    text = text.strip()
+    for end in range(len(text)):
+        assert _validate(text[:end], 3)[0] == _loads(text[:end])[0]
+
+
+@pytest.mark.parametrize("chunk", CHUNK_SIZES)
+@pytest.mark.parametrize("text", DOCUMENTS + ['{"name": "café ☃ \U0001f600"}'])
+def test_validate_json_file(tmp_path, text, chunk):
+    path = tmp_path / "input.json"
+    path.write_bytes(text.encode("utf-8"))
+    valid, value = _loads(text)
+    assert validate_json_file(str(path), chunk_chars=chunk) == (valid and bool(value))
+    assert validate_json_file(str(path), allow_empty=True, chunk_chars=chunk) == valid
+
+
+def test_validate_json_file_rejects_invalid_utf8(tmp_path):
+    path = tmp_path / "input.json"
+    path.write_bytes(b'{"a": "\xff"}')
+    assert not validate_json_file(str(path))
+
+
+def test_csv_writer_writes_the_header_once(tmp_path):
+    pd = pytest.importorskip("pandas")
+    from gravityai.streaming import CSVChunkWriter, read_csv_chunks
+    source = tmp_path / "input.csv"
+    pd.DataFrame({"a": range(7), "b": [chr(97 + i) * 2 for i in range(7)]}).to_csv(source, index=False)
+    output = tmp_path / "output.csv"
+    with CSVChunkWriter(str(output)) as writer:
+        for chunk in read_csv_chunks(str(source), chunksize=3):
+            writer.write(chunk)
+    assert output.read_text() == source.read_text()
+    assert output.read_text().count("a,b") == 1
+
+
+def test_json_lines_round_trip(tmp_path):
+    from gravityai.streaming import JSONLinesWriter, read_json_lines
+    path = tmp_path / "output.jsonl"
+    with JSONLinesWriter(str(path)) as writer:
+        writer.write({"a": 1})
+        writer.write_all(iter([[1, 2], "text\nwith a newline"]))
+    assert list(read_json_lines(str(path))) == [{"a": 1}, [1, 2], "text\nwith a newline"]
+
+
+def test_json_lines_errors_name_the_line(tmp_path):
+    from gravityai.streaming import read_json_lines
+    path = tmp_path / "input.jsonl"
+    path.write_text('{"a": 1}\n\n{"b": 2}\n{"c": \n{"d": 4}\n')
+    rows = read_json_lines(str(path))
+    assert next(rows) == {"a": 1}
+    assert next(rows) == {"b": 2}
+    with pytest.raises(ValueError, match="line 4 of"):
+        next(rows)
+
+
+def test_batch_consumes_generators_lazily(gravityai):
+    produced = []
+
+    def rows():
+        for index in range(10):
+            produced.append(index)
+            yield index
+
+    batches = gravityai.batch(rows(), 3)
+    assert next(batches) == [0, 1, 2]
+    assert produced == [0, 1, 2]
+    assert list(batches) == [[3, 4, 5], [6, 7, 8], [9]]
+    assert list(gravityai.batch(range(5), 2)) == [range(0, 2), range(2, 4), range(4, 5)]
+
+
+@pytest.mark.parametrize("limit", [1 << 20, 8])
+def test_run_validates_json_inputs_on_both_sides_of_the_load_limit(gravityai, tmp_path, monkeypatch, limit):
+    # with the small limit every input below is checked in chunks instead of with json.loads
+    monkeypatch.setattr(gravityai, "_JSON_LOAD_LIMIT", limit)
+    for text, valid in [('{"rows": [1, 2, 3]}', True), ('[1]', True), ('{}', False), ('[]', False),
+                        ('{"rows": [1, 2', False), ('not json', False)]:
+        path = tmp_path / "input.json"
+        path.write_text(text)
+        assert gravityai._valid_json_file(str(path)) == valid, text
+
+
+def test_run_rejects_invalid_json_inputs(tmp_path):
+    from conftest import SERVING_MODEL, start_model
+    inputPath = tmp_path / "input.json"
+    inputPath.write_text('{"rows": [1, 2')
+    process = start_model(SERVING_MODEL, "run", inputPath, tmp_path / "output.json")
+    assert process.wait(60) == 2
+    assert b"JSON input is not in a valid format" in process.stderr.read()
+
+    inputPath.write_text('{"rows": [1, 2]}')
+    process = start_model(SERVING_MODEL, "run", inputPath, tmp_path / "output.json")
+    assert process.wait(60) == 0
+    assert json.loads((tmp_path / "output.json").read_text()) == {"rows": [1, 2]}
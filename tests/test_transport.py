@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import socket
+import time
+
+import pytest
+import websockets
+
+from conftest import SERVING_MODEL, _stop, free_port, start_model
+
+needs_unix_sockets = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs unix sockets")
+
+
+def _wait_for_unix_socket(process, path, timeout=30):
+    deadline = time.time() + timeout
+    while(True):
+        if (process.poll() is not None):
+            raise RuntimeError(f"Server exited with status {process.returncode}: {process.stderr.read().decode()}")
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+            return
+        except OSError:
+            if (time.time() > deadline):
+                raise RuntimeError(f"Server did not start listening on {path} within {timeout} seconds")
+            time.sleep(0.05)
+
+
+@pytest.fixture
+def serve_unix(tmp_path):
+    '''
+    Returns a function that serves tests/serving_model.py on a unix socket in tmp_path with the given serve arguments
+    and returns the process and the socket path.
+    '''
+    processes = []
+
+    def start(*serveArgs, wait=True):
+        path = str(tmp_path / "model.sock")
+        process = start_model(SERVING_MODEL, "serve", "-p", free_port(), "--unix-socket", path, *serveArgs)
+        processes.append(process)
+        if (wait):
+            _wait_for_unix_socket(process, path)
+        return process, path
+    yield start
+    for process in processes:
+        if (process.poll() is None):
+            _stop(process)
+
+
+def _request(folder, reqId):
+    inputPath = folder / (reqId + ".json")
+    inputPath.write_text(json.dumps({"id": reqId}))
+    return json.dumps({"requestId": reqId, "inputFile": str(inputPath),
+                       "outputFile": str(folder / (reqId + ".out.json"))})
+
+
+async def _final_reply(websocket):
+    while(True):
+        reply = json.loads(await asyncio.wait_for(websocket.recv(), 10))
+        if (reply["status"] != "pending"):
+            return reply
+
+
+@needs_unix_sockets
+@pytest.mark.parametrize("workers", ["1", "2"])
+def test_unix_socket(serve_unix, tmp_path, workers):
+    process, path = serve_unix("--workers", workers)
+
+    async def client(reqId):
+        async with websockets.unix_connect(path) as websocket:
+            await websocket.send(_request(tmp_path, reqId))
+            return await _final_reply(websocket)
+
+    async def main():
+        return await asyncio.gather(*[client(f"r{i}") for i in range(3)])
+
+    assert [r["status"] for r in asyncio.run(main())] == ["complete"] * 3
+    assert json.loads((tmp_path / "r0.out.json").read_text()) == {"id": "r0"}
+    _stop(process)
+    assert not os.path.exists(path)
+
+
+@needs_unix_sockets
+def test_stale_unix_socket_is_replaced(serve_unix, tmp_path):
+    path = str(tmp_path / "model.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    assert os.path.exists(path)
+    _, path = serve_unix()
+
+    async def main():
+        async with websockets.unix_connect(path) as websocket:
+            await websocket.send(_request(tmp_path, "after"))
+            return await _final_reply(websocket)
+
+    assert asyncio.run(main())["status"] == "complete"
+
+
+@needs_unix_sockets
+def test_other_files_are_not_replaced(serve_unix, tmp_path):
+    (tmp_path / "model.sock").write_text("not a socket")
+    process, _ = serve_unix(wait=False)
+    assert process.wait(30) == 2
+    assert b"Failed to start server" in process.stderr.read()
+    assert (tmp_path / "model.sock").read_text() == "not a socket"
+
+
+def test_messages_over_max_size_are_rejected(serve):
+    server = serve("--max-size", "1000")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("small", {}))
+            assert (await server.replies(websocket, ["small"]))[0]["status"] == "complete"
+            await websocket.send(server.request("large", {"padding": "x" * 2000}, padding="x" * 2000))
+            with pytest.raises(websockets.ConnectionClosed) as closed:
+                await server.replies(websocket, ["large"])
+            return closed.value.rcvd
+
+    assert asyncio.run(main()).code == 1009
+
+
+@pytest.mark.parametrize("compression, extensions", [("deflate", 1), ("none", 0)])
+def test_compression_and_ping_interval(serve, compression, extensions):
+    server = serve("--compression", compression, "--ping-interval", "0")
+
+    async def main():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("a", {}))
+            return len(websocket.extensions), await server.replies(websocket, ["a"])
+
+    negotiated, replies = asyncio.run(main())
+    assert negotiated == extensions
+    assert replies[0]["status"] == "complete"
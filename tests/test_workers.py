@@ -0,0 +1,75 @@
+import asyncio
+import os
+import time
+
+import pytest
+import websockets
+
+from conftest import SERVING_MODEL, start_model
+
+
+def test_workers_serve_every_connection(serve):
+    server = serve("--workers", "2")
+
+    async def client(name):
+        async with server.connect() as websocket:
+            await websocket.send(server.request(name, {"sleep": 0.2}))
+            return await server.replies(websocket, [name])
+
+    async def main():
+        return await asyncio.gather(*[client(f"r{i}") for i in range(4)])
+
+    assert [r[0]["status"] for r in asyncio.run(main())] == ["complete"] * 4
+
+
+def _children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as file_object:
+        return set(int(child) for child in file_object.read().split())
+
+
+def _wait_for_children(pid, ready, timeout=10):
+    '''
+    Returns the children of pid once ready(children) is true, or after timeout seconds. The supervisor listens before
+    it forks its workers, so the server may accept connections before they all exist, and a crashed worker is only
+    reaped and replaced on the supervisor's next poll.
+    '''
+    deadline = time.time() + timeout
+    children = _children(pid)
+    while(not ready(children) and time.time() < deadline):
+        time.sleep(0.05)
+        children = _children(pid)
+    return children
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/task"), reason="reads the worker processes from /proc")
+def test_crashed_worker_is_restarted(serve):
+    server = serve("--workers", "2")
+    workers = _wait_for_children(server.process.pid, lambda children: len(children) == 2)
+    assert len(workers) == 2
+
+    async def crash():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("crash", {"exit": 3}))
+            with pytest.raises(websockets.ConnectionClosed):
+                await server.replies(websocket, ["crash"])
+
+    async def request():
+        async with server.connect() as websocket:
+            await websocket.send(server.request("after", {}))
+            return await server.replies(websocket, ["after"])
+
+    asyncio.run(crash())
+    restarted = _wait_for_children(server.process.pid,
+                                   lambda children: len(children) == 2 and len(children - workers) == 1)
+    assert len(restarted) == 2
+    assert len(restarted - workers) == 1
+    assert asyncio.run(request())[0]["status"] == "complete"
+
+
+def test_supervisor_gives_up_on_workers_that_keep_crashing():
+    started = time.time()
+    process = start_model(SERVING_MODEL, "serve", "-p", "49211", "--workers", "2",
+                          env={"GRAVITYAI_TEST_CRASH_WORKERS": "1"})
+    assert process.wait(60) == 2
+    assert time.time() - started > 2
+    assert b"Worker keeps crashing" in process.stderr.read()